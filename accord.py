@@ -1,11 +1,16 @@
 from datetime import datetime
+import heapq
+import itertools
 import math
+import os
 from enum import IntFlag, IntEnum
-from typing import Tuple
+from typing import Tuple, Iterable, Iterator, List, Dict
 
-from mido import MidiFile, MidiTrack, MetaMessage, Message, second2tick
+import numpy as np
+from mido import MetaMessage, Message
 
-from notes import Note
+from midi_stream import MidiStreamWriter
+from notes import Note, NoteTable
 
 
 class NoteLength(IntEnum):
@@ -35,6 +40,8 @@ class Accord:
     """
     Class representing single accord of music piece.
     """
+    __slots__ = ('metre', 'tempo', 'notes', 'length', 'wait', 'flags')
+
     def __init__(self, metre: Tuple[int, int], tempo: float, notes: list[Tuple[int, NoteLength]], length: float, wait: float | None, flags: int):
         self.metre = metre
         self.tempo = tempo
@@ -44,6 +51,152 @@ class Accord:
         self.flags = flags
 
 
+class TrackNames:
+    """
+    Read only sequence of track names of every accord of `AccordTable`.
+    """
+    __slots__ = ('table',)
+
+    def __init__(self, table: 'AccordTable'):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, i: int) -> str:
+        return self.table.track_names[self.table.track[i]]
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.table.track_names[t] for t in self.table.track.tolist())
+
+
+class AccordTable:
+    """
+    Compact columnar collection of accords of many tracks. Notes of all accords are stored in flat arrays,
+    notes of accord `i` are `note_keys[note_offsets[i]:note_offsets[i + 1]]`. Instead of name, each accord
+    stores id of its track in `track_names`. Missing `wait` is stored as NaN.
+    """
+    __slots__ = ('metre', 'tempo', 'length', 'wait', 'flags', 'note_offsets', 'note_keys', 'note_lengths', 'track',
+                 'track_names')
+
+    # Names of columns with one value per accord.
+    COLUMNS = ('metre', 'tempo', 'length', 'wait', 'flags', 'track')
+
+    def __init__(self, metre: np.ndarray, tempo: np.ndarray, length: np.ndarray, wait: np.ndarray,
+                 flags: np.ndarray, note_offsets: np.ndarray, note_keys: np.ndarray, note_lengths: np.ndarray,
+                 track: np.ndarray, track_names: List[str]):
+        self.metre = metre
+        self.tempo = tempo
+        self.length = length
+        self.wait = wait
+        self.flags = flags
+        self.note_offsets = note_offsets
+        self.note_keys = note_keys
+        self.note_lengths = note_lengths
+        self.track = track
+        self.track_names = track_names
+
+    @staticmethod
+    def from_accords(accords: List[Accord], name: str = '') -> 'AccordTable':
+        """
+        Creates table from accords of single track.
+
+        :param accords: Accords to be stored.
+        :param name: Name of track.
+        """
+
+        note_offsets = np.zeros(len(accords) + 1, dtype=np.int64)
+        note_offsets[1:] = np.cumsum([len(a.notes) for a in accords])
+        return AccordTable(
+            np.array([a.metre for a in accords], dtype=np.int32).reshape(-1, 2),
+            np.array([a.tempo for a in accords], dtype=np.float64),
+            np.array([a.length for a in accords], dtype=np.float64),
+            np.array([np.nan if a.wait is None else a.wait for a in accords], dtype=np.float64),
+            np.array([int(a.flags) for a in accords], dtype=np.int32),
+            note_offsets,
+            np.array([n for a in accords for (n, _) in a.notes], dtype=np.int16),
+            np.array([int(l) for a in accords for (_, l) in a.notes], dtype=np.int8),
+            np.zeros(len(accords), dtype=np.int32),
+            [name])
+
+    @staticmethod
+    def concatenate(tables: List['AccordTable']) -> 'AccordTable':
+        """
+        Joins tables into one, merging lists of their tracks.
+        """
+
+        if len(tables) == 0:
+            return AccordTable.from_accords([])
+        offsets = [np.zeros(1, dtype=np.int64)]
+        tracks = []
+        notes_count, names_count = 0, 0
+        for t in tables:
+            offsets.append(t.note_offsets[1:] - t.note_offsets[0] + notes_count)
+            notes_count += t.note_offsets[-1] - t.note_offsets[0]
+            tracks.append(t.track + names_count)
+            names_count += len(t.track_names)
+        return AccordTable(
+            *(np.concatenate([getattr(t, c) for t in tables]) for c in ('metre', 'tempo', 'length', 'wait', 'flags')),
+            np.concatenate(offsets),
+            np.concatenate([t.note_keys[t.note_offsets[0]:t.note_offsets[-1]] for t in tables]),
+            np.concatenate([t.note_lengths[t.note_offsets[0]:t.note_offsets[-1]] for t in tables]),
+            np.concatenate(tracks),
+            [name for t in tables for name in t.track_names])
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns arrays of table (e.g. to be saved with `np.savez`). Track names are not included.
+        """
+
+        start, end = self.note_offsets[0], self.note_offsets[-1]
+        return {'metre': self.metre, 'tempo': self.tempo, 'length': self.length, 'wait': self.wait,
+                'flags': self.flags, 'track': self.track, 'note_offsets': self.note_offsets - start,
+                'note_keys': self.note_keys[start:end], 'note_lengths': self.note_lengths[start:end]}
+
+    @staticmethod
+    def from_arrays(data, track_names: List[str]) -> 'AccordTable':
+        """
+        Creates table from arrays returned by `to_arrays`.
+        """
+
+        return AccordTable(data['metre'], data['tempo'], data['length'], data['wait'], data['flags'],
+                           data['note_offsets'], data['note_keys'], data['note_lengths'], data['track'],
+                           track_names)
+
+    @property
+    def names(self) -> TrackNames:
+        """
+        Names of tracks of every accord.
+        """
+
+        return TrackNames(self)
+
+    def notes_of(self, i: int) -> list[Tuple[int, NoteLength]]:
+        """
+        Returns notes of single accord.
+        """
+
+        start, end = self.note_offsets[i], self.note_offsets[i + 1]
+        return [(n, NoteLength(l)) for (n, l) in zip(self.note_keys[start:end].tolist(),
+                                                     self.note_lengths[start:end].tolist())]
+
+    def __len__(self):
+        return self.tempo.shape[0]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, _ = i.indices(len(self))
+            return AccordTable(self.metre[start:stop], self.tempo[start:stop], self.length[start:stop],
+                               self.wait[start:stop], self.flags[start:stop], self.note_offsets[start:stop + 1],
+                               self.note_keys, self.note_lengths, self.track[start:stop], self.track_names)
+        wait = float(self.wait[i])
+        return Accord((int(self.metre[i, 0]), int(self.metre[i, 1])), float(self.tempo[i]), self.notes_of(i),
+                      float(self.length[i]), None if np.isnan(wait) else wait, AccordFlag(int(self.flags[i])))
+
+    def __iter__(self) -> Iterator[Accord]:
+        return (self[i] for i in range(len(self)))
+
+
 def note_to_length(n: Note) -> NoteLength:
     """
     Calculates note length based on duration and tempo.
@@ -111,66 +264,208 @@ def notes_to_accords(notes: list[Note]) -> list[Accord]:
     return result
 
 
-def accords_to_notes(accords: list[Accord]) -> list[Note]:
+def note_length_codes(length: np.ndarray, tempo: np.ndarray) -> np.ndarray:
     """
-    Function converting list of accords into list of notes.
+    Vectorized `note_to_length`, calculates `NoteLength` values of many notes.
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        l = np.log2(length / tempo)
+    codes = np.full(l.shape[0], int(NoteLength.THIRTY_SECOND), dtype=np.int8)
+    for e in sorted(NoteLength)[1:]:
+        codes[l > float(e) - 0.5] = int(e)
+    return codes
+
+
+def segment_notes(start: np.ndarray, length: np.ndarray, tempo: np.ndarray, metre: np.ndarray, note: np.ndarray,
+                  name: str = '') -> AccordTable:
+    """
+    Array based equivalent of `notes_to_accords`. Splits notes into accords and computes their lengths,
+    waits, flags and note lengths in vectorized way.
+
+    :param start: Starts of notes (sorted).
+    :param length: Durations of notes.
+    :param tempo: Tempos of notes.
+    :param metre: Metres of notes, array of shape (n, 2).
+    :param note: Keys of notes.
+    :param name: Name of track.
+    :return: Table of accords of single track.
+    """
+
+    if start.shape[0] == 0:
+        raise IndexError('no notes to convert into accords')
+    # Imported here, so importing accord does not pay for loading numba.
+    from midi_parser import accord_starts
+
+    firsts = accord_starts(start, tempo)
+    n = firsts.shape[0]
+    if n == 1:
+        raise TypeError('track with single accord has no wait')
+    first_start, first_tempo, first_metre = start[firsts], tempo[firsts], metre[firsts]
+
+    # Next note of each accord is the first note of the following one.
+    acc_length = np.ones(n)
+    acc_length[:-1] = (first_start[1:] - first_start[:-1]) / first_tempo[:-1]
+    wait = np.full(n, np.nan)
+    wait[1:] = (first_start[1:] - first_start[:-1]) / first_tempo[1:]
+
+    flags = np.zeros(n, dtype=np.int32)
+    flags[1:-1] |= np.where(first_tempo[2:] != first_tempo[1:-1], int(AccordFlag.TEMPO_CHANGE), 0)
+    flags[1:-1] |= np.where(np.any(first_metre[2:] != first_metre[1:-1], axis=1), int(AccordFlag.METRE_CHANGE), 0)
+    flags[0] = AccordFlag.START
+    flags[-1] = AccordFlag.END
+
+    # Too short notes are dropped from accords.
+    kept = length > 0.01
+    counts = np.add.reduceat(kept.astype(np.int64), firsts)
+    note_offsets = np.zeros(n + 1, dtype=np.int64)
+    note_offsets[1:] = np.cumsum(counts)
+
+    return AccordTable(first_metre.astype(np.int32), first_tempo.astype(np.float64), acc_length, wait, flags,
+                       note_offsets, note[kept].astype(np.int16), note_length_codes(length[kept], tempo[kept]),
+                       np.zeros(n, dtype=np.int32), [name])
+
+
+def notes_to_accord_table(notes: NoteTable, name: str = '') -> AccordTable:
+    """
+    Fast equivalent of `notes_to_accords` operating on table of notes.
+
+    :param notes: Notes of track (in any order).
+    :param name: Name of track.
+    :return: Table of accords of track.
+    """
+
+    data = notes.sorted_by_start().data
+    return segment_notes(data['start'], data['length'], data['tempo'], data['metre'], data['note'], name)
+
+
+def iter_notes(accords: Iterable[Accord], time: float = 0.0) -> Iterator[Note]:
+    """
+    Generator converting accords into notes as they come.
+
+    :param accords: Accords of track.
+    :param time: Start time of first accord.
     """
 
-    res = []
-    time = 0.0
     for a in accords:
         for (note, length) in a.notes:
-            res.append(Note(note, time, 2 ** length * a.tempo, a.tempo, a.metre, 64))
+            yield Note(note, time, 2 ** length * a.tempo, a.tempo, a.metre, 64)
         time += a.length * a.tempo
 
-    return res
 
-
-def save_accords(accords: list[Accord], basename: str | None = None, name: str | None = None, path: str = 'output'):
+def accords_to_notes(accords: list[Accord]) -> list[Note]:
+    """
+    Function converting list of accords into list of notes.
     """
-    Procedure saving accords as midi file.
 
-    :param accords: Accords of track to be saved.
-    :param basename: Base name of track.
-    :param name: Full name of track.
-    :param path: Path to folder where track should be saved.
+    return list(iter_notes(accords))
+
+
+def accord_messages(accords: Iterable[Accord]) -> Iterator[Tuple[float, float, Message | MetaMessage]]:
     """
-    mid = MidiFile()
-    track = MidiTrack()
-    mid.tracks.append(track)
+    Generator converting accords into time ordered midi messages. Note offs are kept in a heap only until
+    the next accord starts after them, so memory used is bounded by number of held notes.
 
-    if name is None:
-        if basename is None:
-            name = f"composer-{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}"
-        else:
-            name = f"{basename}-{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}"
+    :param accords: Accords of track.
+    :return: Iterator of tuples of time (in seconds), tempo and message.
+    """
 
+    pending = []
+    order = itertools.count()
     time = 0.0
-    msgs = []
     prev_tempo = None
     prev_metre = None
 
-    track.append(MetaMessage('track_name', name=name, time=0))
-    track.append(MetaMessage('instrument_name', name='python_composer', time=0))
-
     for a in accords:
+        while pending and pending[0][0] <= time:
+            (off_time, _, tempo, msg) = heapq.heappop(pending)
+            yield off_time, tempo, msg
         if a.tempo != prev_tempo:
             prev_tempo = a.tempo
-            msgs.append((time, a.tempo, MetaMessage('set_tempo', tempo=int(a.tempo * 1000000))))
+            yield time, a.tempo, MetaMessage('set_tempo', tempo=int(a.tempo * 1000000))
         if a.metre != prev_metre:
             prev_metre = a.metre
-            msgs.append((time, a.tempo, MetaMessage('time_signature', numerator=a.metre[0], denominator=a.metre[1])))
+            yield time, a.tempo, MetaMessage('time_signature', numerator=a.metre[0], denominator=a.metre[1])
         for (note, length) in a.notes:
-            msgs.append((time, a.tempo, Message('note_on', note=note, velocity=64)))
-            msgs.append((time + 2 ** length * a.tempo, a.tempo, Message('note_off', note=note, velocity=0)))
+            yield time, a.tempo, Message('note_on', note=note, velocity=64)
+            heapq.heappush(pending, (time + 2 ** length * a.tempo, next(order), a.tempo,
+                                     Message('note_off', note=note, velocity=0)))
         time += a.length * a.tempo
 
-    msgs.append((time, prev_tempo, MetaMessage('end_of_track')))
+    while pending and pending[0][0] <= time:
+        (off_time, _, tempo, msg) = heapq.heappop(pending)
+        yield off_time, tempo, msg
+    yield time, prev_tempo, MetaMessage('end_of_track')
+    while pending:
+        (off_time, _, tempo, msg) = heapq.heappop(pending)
+        yield off_time, tempo, msg
+
+
+def track_name(basename: str | None = None, name: str | None = None) -> str:
+    """
+    Returns name of track, generating it from base name and current time if full name is not provided.
+    """
+
+    if name is None:
+        if basename is None:
+            name = f"composer-{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}"
+        else:
+            name = f"{basename}-{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}"
+    return name
+
+
+def start_track(writer: MidiStreamWriter, name: str):
+    """
+    Writes header messages of composed track.
+    """
+
+    writer.send(MetaMessage('track_name', name=name, time=0))
+    writer.send(MetaMessage('instrument_name', name='python_composer', time=0))
 
-    prev = 0.0
-    for (time, tempo, msg) in sorted(msgs, key=lambda x: x[0]):
-        msg.time = int(second2tick(time - prev, mid.ticks_per_beat, tempo * 1000000))
-        track.append(msg)
-        prev = time
 
-    mid.save(path + '/' + name + '.mid')
\ No newline at end of file
+def save_accords(accords: Iterable[Accord] | AccordTable, basename: str | None = None, name: str | None = None,
+                 path: str = 'output') -> str:
+    """
+    Procedure saving accords as midi file. Lists and tables of accords are encoded at once by
+    `midi_writer.accords_to_midi`, other iterables are encoded as they come, so it works with generators of accords
+    as well.
+
+    :param accords: Accords of track to be saved.
+    :param basename: Base name of track.
+    :param name: Full name of track.
+    :param path: Path to folder where track should be saved.
+    :return: Path of saved file.
+    """
+
+    name = track_name(basename, name)
+    file_path = path + '/' + name + '.mid'
+    if isinstance(accords, (list, tuple, AccordTable)):
+        # Imported here, so importing accord does not pay for loading numba.
+        from midi_writer import accords_to_midi
+
+        with open(file_path, 'wb') as f:
+            f.write(accords_to_midi(accords, name))
+        return file_path
+    with MidiStreamWriter(file_path) as writer:
+        start_track(writer, name)
+        for (time, tempo, msg) in accord_messages(accords):
+            writer.send_at(time, tempo, msg)
+    return file_path
+
+
+def save_accords_many(tracks: Iterable[Iterable[Accord] | AccordTable], basename: str | None = None,
+                      path: str = 'output') -> List[str]:
+    """
+    Saves many tracks into folder in one call. Track `i` is saved as `save_accords` would save it with base name
+    `{basename}-{i}`.
+
+    :param tracks: Accords of every track.
+    :param basename: Base name of tracks.
+    :param path: Path to folder where tracks should be saved.
+    :return: Paths of saved files.
+    """
+
+    os.makedirs(path, exist_ok=True)
+    base = 'composer' if basename is None else basename
+    return [save_accords(list(t) if not isinstance(t, AccordTable) else t, f'{base}-{i}', path=path)
+            for i, t in enumerate(tracks)]
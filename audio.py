@@ -0,0 +1,137 @@
+import os
+import sys
+import wave
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from keyboard import SAMPLE_FOLDER, SAMPLE_BANK, SAMPLE_RATE, LOWEST_KEY, HIGHEST_KEY, read_sample, open_sample_bank
+from midi_parser import fast_midi_to_notes
+from notes import Note
+
+__all__ = ['FADEOUT', 'load_samples', 'sound_events', 'render_notes', 'save_wav', 'render_wav']
+
+# Length of fade out of released key in seconds (the same as in `notes.play_notes`).
+FADEOUT = 0.8
+
+_samples = {}
+
+
+def load_samples(keys: Iterable[int], folder: str = SAMPLE_FOLDER, bank: str = SAMPLE_BANK) \
+        -> Dict[int, np.ndarray]:
+    """
+    Loads samples of given piano keys as float arrays of shape (n, 2). Samples are read from memory mapped
+    sample bank if it exists and from wav files otherwise. Loaded samples are cached.
+
+    :param keys: Ids of keys.
+    :param folder: Folder containing wav samples.
+    :param bank: Path of sample bank (see `keyboard.build_sample_bank`).
+    :return: Dictionary of samples by key id.
+    """
+
+    res = {}
+    stored = None
+    for key in set(keys):
+        if (folder, key) not in _samples:
+            if stored is None:
+                stored = open_sample_bank(bank) or {}
+            data = stored[key] if key in stored else read_sample(key, folder)
+            _samples[(folder, key)] = data.astype(np.float32) / 32768
+        res[key] = _samples[(folder, key)]
+    return res
+
+
+def sound_events(notes: Iterable[Note]) -> List[Tuple[int, float, float, int]]:
+    """
+    Converts notes into samples played, following `notes.play_notes`: sample is played when key is pressed
+    and replayed when one of notes of still pressed key ends. All samples of key fade out when it is released.
+
+    :param notes: Notes to be played.
+    :return: List of tuples of key, time of playing sample, time of release and velocity.
+    """
+
+    by_key = {}
+    for note in notes:
+        by_key.setdefault(note.note, []).append(note)
+
+    res = []
+    for key, key_notes in by_key.items():
+        key_notes.sort(key=lambda n: n.start)
+        i = 0
+        while i < len(key_notes):
+            # Notes overlapping with the first one keep key pressed.
+            release = key_notes[i].end
+            j = i + 1
+            while j < len(key_notes) and key_notes[j].start <= release:
+                release = max(release, key_notes[j].end)
+                j += 1
+            res.append((key, key_notes[i].start, release, key_notes[i].velocity))
+            for n in key_notes[i:j]:
+                if n.end < release:
+                    last = max((m for m in key_notes[i:j] if m.start <= n.end), key=lambda m: m.start)
+                    res.append((key, n.end, release, last.velocity))
+            i = j
+    res.sort(key=lambda e: e[1])
+    return res
+
+
+def render_notes(notes: Iterable[Note], folder: str = SAMPLE_FOLDER, rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Mixes samples of played notes into single buffer. Notes outside of piano range have no sample, they are
+    skipped and their number is reported.
+
+    :param notes: Notes to be rendered.
+    :param folder: Folder containing samples.
+    :param rate: Sample rate (has to match samples).
+    :return: Float array of shape (n, 2) with values (mostly) in range [-1, 1].
+    """
+
+    notes = list(notes)
+    playable = [n for n in notes if LOWEST_KEY <= n.note <= HIGHEST_KEY]
+    if len(playable) < len(notes):
+        print(f"Skipped {len(notes) - len(playable)} notes outside of piano range")
+    events = sound_events(playable)
+    samples = load_samples([e[0] for e in events], folder)
+    fade = int(FADEOUT * rate)
+
+    starts = [int(round(start * rate)) for (_, start, _, _) in events]
+    lengths = [min(samples[key].shape[0], int(round(release * rate)) - s + fade)
+               for (key, _, release, _), s in zip(events, starts)]
+    out = np.zeros((max((s + l for s, l in zip(starts, lengths)), default=0), 2), dtype=np.float32)
+    ramp = np.arange(max(lengths, default=0), dtype=np.float32)
+    for (key, _, release, velocity), start, length in zip(events, starts, lengths):
+        # Volume stays constant until release and then linearly drops to zero.
+        end = int(round(release * rate)) - start + fade
+        envelope = np.minimum((end - ramp[:length]) * (velocity / 127 / fade), velocity / 127)
+        out[start:start + length] += samples[key][:length] * envelope[:, None]
+    return out
+
+
+def save_wav(path: str, audio: np.ndarray, rate: int = SAMPLE_RATE):
+    """
+    Saves float buffer as 16 bit stereo wav file. Values out of range [-1, 1] are clipped.
+    """
+
+    data = (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(data.tobytes())
+
+
+def render_wav(notes: Iterable[Note], path: str, folder: str = SAMPLE_FOLDER):
+    """
+    Renders notes into wav file, without using display or sound card.
+
+    :param notes: Notes to be rendered.
+    :param path: Path of output file.
+    :param folder: Folder containing samples.
+    """
+
+    save_wav(path, render_notes(notes, folder))
+
+
+if __name__ == '__main__':
+    for midi_path in sys.argv[1:]:
+        render_wav(fast_midi_to_notes(midi_path), os.path.splitext(midi_path)[0] + '.wav')
@@ -0,0 +1,50 @@
+"""
+Reports how much `selection.CompactCorpus` shrinks corpus (exact duplicates and vectors equal after uint16 and
+uint8 quantization), together with memory and time of `composer.select_bit` step on compacted corpus.
+
+Run from repository root: python -m benchmarks.compact_corpus [midi folder]
+"""
+import sys
+import time
+
+import numpy as np
+
+from composer import select_bit
+from corpus_cache import load_folder_cached
+from selection import CompactCorpus
+
+STEPS = 50
+
+
+def time_per_step(corpus, states: np.ndarray, weights: np.ndarray) -> float:
+    """
+    Returns mean time of single selection in seconds.
+    """
+
+    select_bit(states[0], corpus, weights=weights)
+    start = time.perf_counter()
+    for state in states:
+        select_bit(state, corpus, weights=weights)
+    return (time.perf_counter() - start) / len(states)
+
+
+def main(folder: str = 'midi'):
+    _, _, corpus, _ = load_folder_cached(folder)
+    corpus = np.ascontiguousarray(corpus, dtype=np.float32)
+    states = corpus[np.random.default_rng(0).choice(len(corpus), STEPS)].astype(np.float64)
+    weights = np.empty(len(corpus))
+
+    print(f"{'corpus':>10} {'entries':>8} {'MB':>7} {'ms/step':>8}")
+    print(f"{'original':>10} {len(corpus):>8} {corpus.nbytes / 2 ** 20:>7.2f} "
+          f"{1000 * time_per_step(corpus, states, weights):>8.3f}")
+    for name, dtype in (('exact', None), ('uint16', np.uint16), ('uint8', np.uint8)):
+        start = time.perf_counter()
+        compact = CompactCorpus(corpus, dtype)
+        built = time.perf_counter() - start
+        print(f"{name:>10} {len(compact.multiplicity):>8} {compact.nbytes / 2 ** 20:>7.2f} "
+              f"{1000 * time_per_step(compact, states, weights):>8.3f}  (built in {built:.2f} s, "
+              f"largest entry {int(compact.multiplicity.max(initial=0))})")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
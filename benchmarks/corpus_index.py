@@ -0,0 +1,88 @@
+"""
+Benchmark of `corpus_index.CorpusIndex` against plain `composer.select_bit` on states of real composition
+(recorded from `composer.music_generator`), for corpus of folder and for corpus tiled to `TILES` times its size.
+Reports time per step, speedup and mean number of corpus vectors scanned for several tolerances.
+
+Run from repository root: python -m benchmarks.corpus_index [midi folder]
+"""
+import contextlib
+import io
+import sys
+import time
+
+import numpy as np
+
+from composer import music_generator, select_bit
+from corpus_cache import load_folder_cached
+from corpus_index import CorpusIndex
+
+STEPS = 400
+TILES = 16
+TOLERANCES = (0.001, 0.05, 0.2)
+
+
+class StateRecorder:
+    """
+    Index passed to `music_generator`, recording states and delegating selection to `select_bit`.
+    """
+    def __init__(self, corpus: np.ndarray):
+        self.corpus = corpus
+        self.weights = np.empty(len(corpus))
+        self.states = []
+
+    def select(self, state, rng=np.random):
+        self.states.append(np.array(state, dtype=np.float64))
+        return select_bit(state, self.corpus, weights=self.weights)
+
+
+def record_states(vectors, accords, names, corpus: np.ndarray) -> np.ndarray:
+    """
+    Returns states of first `STEPS` steps of composition.
+    """
+
+    np.random.seed(0)
+    recorder = StateRecorder(corpus)
+    generator = music_generator(vectors, accords, names, corpus, recorder)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(STEPS):
+            next(generator)
+    return np.array(recorder.states)
+
+
+def time_per_step(select, states: np.ndarray) -> float:
+    """
+    Returns mean time of single selection in seconds.
+    """
+
+    select(states[0])
+    start = time.perf_counter()
+    for state in states:
+        select(state)
+    return (time.perf_counter() - start) / len(states)
+
+
+def main(folder: str = 'midi'):
+    accords, vectors, convolved, names = load_folder_cached(folder)
+    convolved = np.ascontiguousarray(convolved, dtype=np.float32)
+    states = record_states(vectors, accords, names, convolved)
+
+    print(f"{'N':>7} {'selection':>16} {'ms/step':>8} {'speedup':>8} {'scanned':>8}")
+    for corpus in (convolved, np.ascontiguousarray(np.tile(convolved, (TILES, 1, 1)))):
+        weights = np.empty(len(corpus))
+        plain = time_per_step(lambda s: select_bit(s, corpus, weights=weights), states)
+        print(f"{len(corpus):>7} {'select_bit':>16} {1000 * plain:>8.3f} {1.0:>8.2f} {len(corpus):>8}")
+        for tolerance in TOLERANCES:
+            index = CorpusIndex(corpus, tolerance)
+            scanned = []
+
+            def select(state):
+                index.select(state)
+                scanned.append(index.scanned)
+
+            indexed = time_per_step(select, states)
+            print(f"{len(corpus):>7} {f'index tol={tolerance}':>16} {1000 * indexed:>8.3f} "
+                  f"{plain / indexed:>8.2f} {np.mean(scanned[1:]):>8.0f}")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
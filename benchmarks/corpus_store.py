@@ -0,0 +1,73 @@
+"""
+Compares ingestion of synthetic corpus into `corpus_store.CorpusStore` with loading it into memory
+(`vectorization.load_folder_parallel` and convolution): time and peak of memory allocated (by tracemalloc,
+memory maps are not counted). Then compares `select_bit` reading memory mapped corpus with in-memory one.
+
+Run from repository root: python -m benchmarks.corpus_store [synthetic corpus options]
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.synthetic import generate_corpus, add_arguments
+from composer import select_bit, convolve_known
+from corpus_store import ingest_folder
+from vectorization import load_folder_parallel
+
+STEPS = 20
+
+
+def measure(function):
+    """
+    Returns result of function, time of call and peak of allocated memory in MB.
+    """
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        res = function()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return res, elapsed, peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks out of core corpus store.')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        corpus = os.path.join(folder, 'corpus')
+        generate_corpus(corpus, args.files, args.seconds, args.density, args.tempo_changes, args.seed)
+
+        # Warm up of jit compiled functions.
+        measure(lambda: load_folder_parallel(corpus, workers=1))
+        (_, vectors, _, _), loaded, loaded_peak = measure(lambda: load_folder_parallel(corpus, workers=1))
+        convolved, conv_time, conv_peak = measure(lambda: convolve_known(vectors))
+        store, ingested, ingest_peak = measure(lambda: ingest_folder(corpus, os.path.join(folder, 'store')))
+        print(f"{len(store)} vectors ({convolved.nbytes / 2 ** 20:.1f} MB convolved)")
+        print(f"{'in memory':>10}: {loaded + conv_time:8.2f} s, peak {max(loaded_peak, conv_peak):8.1f} MB")
+        print(f"{'store':>10}: {ingested:8.2f} s, peak {ingest_peak:8.1f} MB")
+
+        mapped = store.convolved
+        print(f"identical: {np.array_equal(mapped, convolved)}")
+        states = convolved[np.random.default_rng(0).choice(len(convolved), STEPS)].astype(np.float64)
+        weights = np.empty(len(convolved))
+        for name, corpus_vec in (('in memory', convolved), ('store', mapped)):
+            select_bit(states[0], corpus_vec, weights=weights)
+            start = time.perf_counter()
+            for state in states:
+                select_bit(state, corpus_vec, weights=weights)
+            print(f"{name:>10}: select_bit {1000 * (time.perf_counter() - start) / STEPS:.3f} ms/step")
+        del mapped, store
+
+
+if __name__ == '__main__':
+    main()
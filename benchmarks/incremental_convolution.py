@@ -0,0 +1,40 @@
+"""
+Compares speed of convolved state maintained by `vectorization.apply_accord_convolved` and `composer.convolve` of
+the vector along tracks of corpus (equality of results is checked by `tests/test_incremental_convolution.py`).
+
+Run from repository root: python -m benchmarks.incremental_convolution [midi folder]
+"""
+import sys
+import time
+
+import numpy as np
+
+from composer import CONVOLUTION, RESYNC_STEPS, convolve
+from vectorization import apply_accord, apply_accord_convolved, empty_vector, list_tracks, vectorize_file
+
+
+def main(folder: str = 'midi'):
+    full_time, incremental_time, recomputed, steps = 0.0, 0.0, 0, 0
+    for path in list_tracks(folder):
+        accords, _ = vectorize_file(path)
+        pressed, vector = np.zeros(128), empty_vector()
+        reference_pressed, reference = np.zeros(128), empty_vector()
+        state = convolve(vector)
+        for i, accord in enumerate(accords):
+            start = time.perf_counter()
+            recomputed += apply_accord_convolved(accord, pressed, vector, state, CONVOLUTION,
+                                                 (i + 1) % RESYNC_STEPS == 0)
+            incremental_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            reference_pressed, reference = apply_accord(accord, reference_pressed, reference)
+            convolve(reference)
+            full_time += time.perf_counter() - start
+            steps += 1
+    print(f"{steps} accords, recomputed {recomputed / steps:.1f} of 128 positions per accord")
+    print(f"apply_accord + convolve: {1e6 * full_time / steps:.1f} us/accord, "
+          f"incremental: {1e6 * incremental_time / steps:.1f} us/accord")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
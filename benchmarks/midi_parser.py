@@ -0,0 +1,32 @@
+"""
+Compares speed of `midi_parser.fast_midi_to_notes` and `notes.midi_to_notes` (equality of results is checked by
+`tests/test_midi_parser.py`).
+
+Run from repository root: python -m benchmarks.midi_parser [midi folder]
+"""
+import os
+import sys
+import time
+
+from midi_parser import fast_midi_to_notes
+from notes import midi_to_notes, load_midi
+from vectorization import list_tracks
+
+
+def main(folder: str = 'midi'):
+    paths = list_tracks(folder)
+    fast_midi_to_notes(paths[0])
+    mido_time, fast_time = 0.0, 0.0
+    for path in paths:
+        start = time.perf_counter()
+        notes = midi_to_notes(load_midi(path))
+        mido_time += time.perf_counter() - start
+        start = time.perf_counter()
+        fast_midi_to_notes(path)
+        fast_time += time.perf_counter() - start
+        print(f"{os.path.basename(path):>30} {len(notes):>8} notes")
+    print(f"mido: {mido_time:.3f}s, fast parser: {fast_time:.3f}s")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,57 @@
+"""
+Compares `midi_writer.accords_to_midi` with streaming accords through `midi_stream.MidiStreamWriter` (previous
+implementation of `save_accords`) on tracks cut from corpus. Checks that both produce the same bytes and reports
+time per track, together with time of `save_accords_many` writing all tracks into folder.
+
+Run from repository root: python -m benchmarks.midi_writer [midi folder] [tracks] [accords per track]
+"""
+import io
+import sys
+import tempfile
+import time
+
+from accord import accord_messages, start_track, save_accords_many
+from corpus_cache import load_folder_cached
+from midi_stream import MidiStreamWriter
+from midi_writer import accords_to_midi
+
+
+def stream_midi(accords, name: str) -> bytes:
+    """
+    Encodes accords message by message with mido.
+    """
+
+    buffer = io.BytesIO()
+    with MidiStreamWriter(buffer) as writer:
+        start_track(writer, name)
+        for (t, tempo, msg) in accord_messages(accords):
+            writer.send_at(t, tempo, msg)
+    return buffer.getvalue()
+
+
+def main(folder: str = 'midi', tracks: int = 200, size: int = 500):
+    table, _, _, _ = load_folder_cached(folder)
+    tracks, size = int(tracks), min(int(size), len(table))
+    lists = [list(table[i:i + size]) for i in (j * 7919 % (len(table) - size + 1) for j in range(tracks))]
+    accords_to_midi(lists[0], 'warm up')
+
+    start = time.perf_counter()
+    expected = [stream_midi(accords, 'bench') for accords in lists]
+    streamed = time.perf_counter() - start
+    start = time.perf_counter()
+    encoded = [accords_to_midi(accords, 'bench') for accords in lists]
+    fast = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as output:
+        start = time.perf_counter()
+        save_accords_many(lists, 'bench', output)
+        saved = time.perf_counter() - start
+
+    same = sum(a == b for a, b in zip(expected, encoded))
+    print(f"{tracks} tracks of {size} accords, {same} identical")
+    print(f"{'stream':>18}: {1000 * streamed / tracks:.3f} ms/track")
+    print(f"{'accords_to_midi':>18}: {1000 * fast / tracks:.3f} ms/track ({streamed / fast:.1f}x)")
+    print(f"{'save_accords_many':>18}: {1000 * saved / tracks:.3f} ms/track")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
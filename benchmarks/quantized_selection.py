@@ -0,0 +1,66 @@
+"""
+Accuracy report of `selection.QuantizedCorpus`: compares selection distributions of `composer.select_bit`
+on quantized corpus with float32 corpus (built from midi folder), together with memory and time per step.
+
+Run from repository root: python -m benchmarks.quantized_selection [midi folder]
+"""
+import sys
+import time
+
+import numpy as np
+
+from composer import select_bit
+from corpus_cache import load_folder_cached
+from selection import QuantizedCorpus
+
+STATES = 200
+REPEATS = 20
+
+
+def distribution(corpus, state: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Returns selection probabilities of every corpus entry for given state.
+    """
+
+    select_bit(state, corpus, weights=weights)
+    return weights / np.sum(weights)
+
+
+def time_per_step(corpus, states: np.ndarray, weights: np.ndarray) -> float:
+    """
+    Returns mean time of single selection in seconds.
+    """
+
+    select_bit(states[0], corpus, weights=weights)
+    start = time.perf_counter()
+    for i in range(REPEATS):
+        select_bit(states[i % len(states)], corpus, weights=weights)
+    return (time.perf_counter() - start) / REPEATS
+
+
+def main(folder: str = 'midi'):
+    _, _, corpus, _ = load_folder_cached(folder)
+    corpus = np.ascontiguousarray(corpus, dtype=np.float32)
+    rng = np.random.default_rng(0)
+    # States of composed tracks are convolved vectors similar to the ones in corpus.
+    states = corpus[rng.choice(len(corpus), STATES)].astype(np.float64)
+    weights = np.empty(len(corpus))
+    reference = [distribution(corpus, s, weights).copy() for s in states]
+
+    print(f"{len(corpus)} vectors, {STATES} states")
+    print(f"{'format':>8} {'MB':>7} {'ms/step':>8} {'mean TV':>9} {'max TV':>9} {'same argmax':>12}")
+    print(f"{'float32':>8} {corpus.nbytes / 2 ** 20:>7.2f} {1000 * time_per_step(corpus, states, weights):>8.3f}")
+    for dtype in (np.uint16, np.uint8):
+        quantized = QuantizedCorpus(corpus, dtype)
+        tv, same = [], 0
+        for s, p in zip(states, reference):
+            q = distribution(quantized, s, weights)
+            tv.append(0.5 * np.sum(np.abs(p - q)))
+            same += np.argmax(p) == np.argmax(q)
+        print(f"{np.dtype(dtype).name:>8} {quantized.nbytes / 2 ** 20:>7.2f} "
+              f"{1000 * time_per_step(quantized, states, weights):>8.3f} {np.mean(tv):>9.5f} {np.max(tv):>9.5f} "
+              f"{same / STATES:>12.3f}")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
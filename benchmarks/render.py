@@ -0,0 +1,73 @@
+"""
+Compares `visualisation.Renderer` with drawing every frame by `draw_falling_notes` and `draw_piano`
+on dense synthetic piece using all 88 keys. Checks that both produce the same frames and reports frame times.
+Pixels at rounded corners of piano keys are not compared, full redraw shows notes hidden under keyboard there.
+
+Run from repository root: python -m benchmarks.render [seconds]
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import numpy as np
+import pygame as pg
+
+from notes import Note, Timeline, BITS_PER_SECOND
+from visualisation import Renderer, draw_falling_notes, draw_piano
+
+WIDTH = 52 * 35
+HEIGHT = 800
+
+
+def dense_piece(seconds: float, seed: int = 0) -> Timeline:
+    """
+    Creates timeline with chords of 4-12 notes every 1/8 s spread over whole keyboard.
+    """
+
+    rng = np.random.default_rng(seed)
+    timeline = Timeline()
+    for start in np.arange(0.0, seconds, 0.125):
+        for key in sorted(rng.choice(np.arange(21, 109), rng.integers(4, 13), replace=False)):
+            timeline.append(Note(int(key), float(start), float(rng.uniform(0.05, 2.0))))
+    return timeline
+
+
+def main(seconds: float = 30.0):
+    pg.init()
+    timeline = dense_piece(seconds)
+    reference = pg.Surface((WIDTH, HEIGHT))
+    screen = pg.Surface((WIDTH, HEIGHT))
+    reference_view = timeline.view()
+    sound_view = timeline.view()
+    renderer = Renderer(screen, timeline.view(), history=int(seconds * BITS_PER_SECOND))
+
+    gray = np.array(pg.Color('gray')[:3])
+    corners = np.all(pg.surfarray.pixels3d(renderer.piano) == gray, axis=2)
+    corners[:, :renderer.notes_area.height] = False
+
+    full_time, differences = 0.0, 0
+    for frame in range(0, int(seconds * BITS_PER_SECOND)):
+        pressed = {note.note for note in sound_view.advance(frame - 500)[0]}
+        start = time.perf_counter()
+        reference.fill('gray')
+        draw_falling_notes(reference, reference_view, frame)
+        draw_piano(pressed, reference)
+        full_time += time.perf_counter() - start
+
+        renderer.draw(frame, pressed)
+        if frame % 10 == 0:
+            different = np.any(pg.surfarray.pixels3d(reference) != pg.surfarray.pixels3d(screen), axis=2)
+            differences += int(np.count_nonzero(different & ~corners))
+
+    frames = int(seconds * BITS_PER_SECOND)
+    mean, worst = renderer.frame_time()
+    print(f"{len(timeline)} notes, {frames} frames, different pixels in checked frames: {differences}")
+    print(f"full redraw: {1000 * full_time / frames:8.3f} ms/frame")
+    print(f"renderer:    {1000 * mean:8.3f} ms/frame (max {1000 * worst:.3f} ms), budget {1000 / BITS_PER_SECOND:.1f} ms")
+
+
+if __name__ == '__main__':
+    main(*map(float, sys.argv[1:2]))
@@ -0,0 +1,66 @@
+"""
+Benchmark of `composer.select_bit` (fused kernel) against `composer.select_bit_cdist` (reference).
+
+Run from repository root: python -m benchmarks.select_bit [midi folder]
+"""
+import contextlib
+import io
+import sys
+import time
+
+import numpy as np
+
+from composer import select_bit, select_bit_cdist, convolve
+from vectorization import load_folder_parallel
+
+REPEATS = 20
+
+
+def time_per_step(select, states: np.ndarray, corpus: np.ndarray, **kwargs) -> float:
+    """
+    Returns mean time of single selection in seconds.
+    """
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        select(states[0], corpus, **kwargs)
+        start = time.perf_counter()
+        for i in range(REPEATS):
+            select(states[i % len(states)], corpus, **kwargs)
+    return (time.perf_counter() - start) / REPEATS
+
+
+def agreement(states: np.ndarray, corpus: np.ndarray) -> float:
+    """
+    Returns fraction of selections in which both implementations choose the same index for the same seed.
+    """
+
+    same = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, state in enumerate(states):
+            np.random.seed(i)
+            a, _ = select_bit_cdist(state, corpus)
+            np.random.seed(i)
+            b, _ = select_bit(state, corpus)
+            same += a == b
+    return same / len(states)
+
+
+def main(folder: str = 'midi'):
+    _, vec, _, _ = load_folder_parallel(folder)
+    base = convolve(vec).astype(np.float32)
+    states = base[np.random.default_rng(0).choice(len(base), REPEATS)].astype(np.float64)
+    print(f"agreement with reference: {agreement(states, base):.3f}")
+    print(f"{'corpus':>10} {'cdist ms':>10} {'fused ms':>10} {'top-64 ms':>10} {'threshold ms':>13}")
+    for copies in (1, 4, 16, 64):
+        corpus = np.ascontiguousarray(np.concatenate([base] * copies))
+        weights = np.empty(len(corpus))
+        reference = time_per_step(select_bit_cdist, states, corpus)
+        fused = time_per_step(select_bit, states, corpus, weights=weights)
+        top = time_per_step(select_bit, states, corpus, weights=weights, top_k=64)
+        threshold = time_per_step(select_bit, states, corpus, weights=weights, threshold=1e-6)
+        print(f"{len(corpus):>10} {reference * 1e3:>10.2f} {fused * 1e3:>10.2f} {top * 1e3:>10.2f} "
+              f"{threshold * 1e3:>13.2f}")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
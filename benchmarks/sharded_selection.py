@@ -0,0 +1,64 @@
+"""
+Compares selection of `sharded_corpus.ShardedCorpus` with `composer.select_bit`: sum of weights, empirical
+distribution of selected vectors (total variation distance to exact distribution, for both methods with the same
+number of samples) and latency per step for growing number of shards.
+
+Run from repository root: python -m benchmarks.sharded_selection [midi folder]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+from composer import select_bit, IMPORTANCES, SELECTION_CURVE_PARAM
+from corpus_cache import load_folder_cached
+from selection import selection_weights
+from sharded_corpus import ShardedCorpus
+
+SAMPLES = 3000
+STEPS = 50
+COPIES = 4
+
+
+def total_variation(selected: np.ndarray, exact: np.ndarray) -> float:
+    """
+    Returns total variation distance between empirical distribution of selected indexes and exact one.
+    """
+
+    empirical = np.bincount(selected, minlength=len(exact)) / len(selected)
+    return 0.5 * float(np.sum(np.abs(empirical - exact)))
+
+
+def main(folder: str = 'midi'):
+    _, _, corpus, _ = load_folder_cached(folder)
+    corpus = np.ascontiguousarray(np.concatenate([corpus] * COPIES), dtype=np.float32)
+    rng = np.random.default_rng(0)
+    state = corpus[rng.integers(len(corpus))].astype(np.float64)
+    weights = np.empty(len(corpus))
+    total, _ = selection_weights(corpus, state, IMPORTANCES, SELECTION_CURVE_PARAM, weights)
+    exact = weights / total
+    print(f"{len(corpus)} vectors, {os.cpu_count()} cores")
+
+    local = np.array([select_bit(state, corpus, weights=weights)[0] for _ in range(SAMPLES)])
+    print(f"select_bit: TV of {SAMPLES} samples {total_variation(local, exact):.4f}")
+    states = corpus[rng.choice(len(corpus), STEPS)].astype(np.float64)
+    start = time.perf_counter()
+    for s in states:
+        select_bit(s, corpus, weights=weights)
+    print(f"select_bit: {1000 * (time.perf_counter() - start) / STEPS:.3f} ms/step")
+
+    for shards in sorted({1, 2, 4, os.cpu_count() or 1}):
+        with ShardedCorpus(corpus, shards) as sharded:
+            totals, _, _, _ = sharded.weights(state)
+            selected = np.array([sharded.select(state)[0] for _ in range(SAMPLES)])
+            start = time.perf_counter()
+            for s in states:
+                sharded.select(s)
+            elapsed = (time.perf_counter() - start) / STEPS
+        print(f"{shards:>3} shards: sum error {abs(np.sum(totals) - total) / total:.1e}, "
+              f"TV {total_variation(selected, exact):.4f}, {1000 * elapsed:.3f} ms/step")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,48 @@
+"""
+Measures time of importing modules of project in fresh interpreter and reports which heavy dependencies
+(pygame, scipy.stats) they pulled in.
+
+Run from repository root: python -m benchmarks.startup [module ...]
+"""
+import subprocess
+import sys
+import time
+
+MODULES = ['accord', 'vectorization', 'composer', 'corpus_cache', 'audio', 'keyboard']
+REPEATS = 3
+HEAVY = ['pygame', 'scipy.stats', 'numba']
+
+PROBE = "import sys, {module}; print(' '.join(str(int(m in sys.modules)) for m in {heavy!r}))"
+
+
+def import_time(module: str) -> tuple:
+    """
+    Returns best time (in seconds) of importing module in new interpreter and list of loaded heavy modules
+    (None if import failed).
+    """
+
+    best, loaded = float('inf'), None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        res = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)],
+                             capture_output=True, text=True)
+        best = min(best, time.perf_counter() - start)
+        if res.returncode != 0:
+            return best, None
+        loaded = [name for name, flag in zip(HEAVY, res.stdout.split()[-len(HEAVY):]) if flag == '1']
+    return best, loaded
+
+
+def main(modules=None):
+    baseline, _ = import_time('sys')
+    print(f"{'interpreter':>15} {1000 * baseline:8.0f} ms")
+    for module in modules or MODULES:
+        elapsed, loaded = import_time(module)
+        if loaded is None:
+            print(f"{module:>15} {1000 * elapsed:8.0f} ms  import failed")
+        else:
+            print(f"{module:>15} {1000 * elapsed:8.0f} ms  loads: {', '.join(loaded) or '-'}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
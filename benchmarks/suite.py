@@ -0,0 +1,178 @@
+"""
+Benchmark suite of hot paths: ingestion (`load_folder`, `vectorize_notes`), corpus convolution, per-step
+`select_bit` latency for growing corpus, `apply_accord`, export (`save_accords`) and headless frame of `draw_falling_notes`.
+Every benchmark reports best time of few runs and peak of memory allocated during single run (by tracemalloc).
+Results are written as json, tagged with commit, so runs of different commits can be compared.
+
+Run from repository root:
+    python -m benchmarks.suite [--output results.json] [--compare old.json] [synthetic corpus options]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import numpy as np
+
+from accord import save_accords
+from benchmarks.synthetic import generate_corpus, add_arguments
+from composer import select_bit, convolve
+from midi_parser import fast_midi_to_notes
+from notes import Timeline, BITS_PER_SECOND
+from vectorization import load_folder, vectorize_notes, apply_accord, empty_vector
+
+REPEATS = 3
+SELECT_STEPS = 20
+CORPUS_COPIES = (1, 4, 16)
+FRAMES = 60
+
+
+def measure(function: Callable[[], object], repeats: int = REPEATS) -> Dict[str, float]:
+    """
+    Returns best time of calling function (in seconds) and peak memory allocated by single call (in MB).
+    Output printed by function is suppressed.
+    """
+
+    best = float('inf')
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_mb': peak / 2 ** 20}
+
+
+def commit() -> Dict[str, object]:
+    """
+    Returns hash of current commit and whether working tree has uncommitted changes.
+    """
+
+    def git(*args) -> str:
+        return subprocess.run(['git', *args], capture_output=True, text=True).stdout.strip()
+
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': git('status', '--porcelain', '--untracked-files=no') != ''}
+
+
+def run(folder: str) -> Dict[str, Dict[str, float]]:
+    """
+    Runs all benchmarks on corpus in folder.
+    """
+
+    results = {}
+    results['load_folder'] = measure(lambda: load_folder(folder), repeats=1)
+
+    paths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.mid'))
+    notes = fast_midi_to_notes(paths[0])
+    results['vectorize_notes'] = dict(measure(lambda: vectorize_notes(notes)), notes=len(notes))
+
+    track, _ = vectorize_notes(notes)
+
+    def apply_all():
+        pressed, v = np.zeros(128), empty_vector()
+        for accord in track:
+            pressed, v = apply_accord(accord, pressed, v)
+
+    results['apply_accord'] = dict(measure(apply_all), accords=len(track))
+
+    accords, vectors, _ = load_folder(folder)
+    vectors = np.array(vectors, dtype=np.float32)
+    results['convolution'] = dict(measure(lambda: convolve(vectors)), vectors=len(vectors))
+
+    # Float32 corpus as used by composition, so `select_bit` does not copy it on every call.
+    base = convolve(vectors).astype(np.float32)
+    states = base[np.random.default_rng(0).choice(len(base), SELECT_STEPS)].astype(np.float64)
+    for copies in CORPUS_COPIES:
+        corpus = np.ascontiguousarray(np.concatenate([base] * copies))
+        weights = np.empty(len(corpus))
+
+        def steps():
+            for state in states:
+                select_bit(state, corpus, weights=weights)
+
+        res = measure(steps)
+        results[f'select_bit_{len(corpus)}'] = {'seconds': res['seconds'] / SELECT_STEPS, 'peak_mb': res['peak_mb'],
+                                                'vectors': len(corpus)}
+
+    with tempfile.TemporaryDirectory() as output:
+        results['save_accords'] = dict(measure(lambda: save_accords(accords, name='bench', path=output)),
+                                       accords=len(accords))
+
+    import pygame as pg
+    from visualisation import draw_falling_notes
+    screen = pg.Surface((52 * 35, 800))
+    timeline = Timeline()
+    timeline.extend(sorted(notes, key=lambda n: n.start))
+    middle = int(notes[len(notes) // 2].start * BITS_PER_SECOND)
+
+    def frames():
+        view = timeline.view()
+        for frame in range(middle, middle + FRAMES):
+            screen.fill('gray')
+            draw_falling_notes(screen, view, frame)
+
+    res = measure(frames)
+    results['draw_falling_notes'] = {'seconds': res['seconds'] / FRAMES, 'peak_mb': res['peak_mb']}
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]):
+    """
+    Prints results together with ratio of times to baseline.
+    """
+
+    print(f"{'benchmark':>24} {'ms':>10} {'peak MB':>9} {'baseline ms':>12} {'ratio':>7}")
+    for name, res in results.items():
+        line = f"{name:>24} {1000 * res['seconds']:>10.3f} {res['peak_mb']:>9.1f}"
+        if name in baseline:
+            old = baseline[name]['seconds']
+            line += f" {1000 * old:>12.3f} {res['seconds'] / old:>7.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks hot paths on synthetic corpus.')
+    parser.add_argument('--folder', help='existing corpus to use instead of synthetic one')
+    parser.add_argument('--output', help='path of json file with results')
+    parser.add_argument('--compare', help='json file with results of other run')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        if args.folder is None:
+            generate_corpus(folder, args.files, args.seconds, args.density, args.tempo_changes, args.seed)
+        results = run(args.folder or folder)
+
+    report = {
+        **commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'corpus': args.folder or {k: getattr(args, k) for k in ('files', 'seconds', 'density', 'tempo_changes',
+                                                                 'seed')},
+        'results': results,
+    }
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    compare(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Generator of synthetic midi corpus used by benchmarks.
+
+Run from repository root: python -m benchmarks.synthetic folder [--files N] [--seconds S] [--density D]
+[--tempo-changes T] [--seed X]
+"""
+import argparse
+import os
+from typing import List
+
+import mido
+import numpy as np
+
+TICKS_PER_BEAT = 480
+
+
+def synthetic_track(seconds: float, density: float, tempo_changes: int, rng: np.random.Generator) -> mido.MidiFile:
+    """
+    Creates single track midi file with random chords.
+
+    :param seconds: Approximate length of track.
+    :param density: Mean number of notes per second.
+    :param tempo_changes: Number of tempo changes (uniformly spread over track).
+    :param rng: Source of randomness.
+    :return: Midi file.
+    """
+
+    events = []
+    time, tempo = 0.0, 0.5
+    changes = set(np.linspace(0, seconds, tempo_changes + 2)[1:-1].tolist())
+    events.append((0, 0, mido.MetaMessage('time_signature', numerator=int(rng.choice([3, 4])), denominator=4)))
+    events.append((0, 0, mido.MetaMessage('set_tempo', tempo=int(tempo * 1e6))))
+    # Tempo changes are kept in separate list to convert seconds into ticks piecewise.
+    tempo_map = [(0.0, 0, tempo)]
+
+    def to_ticks(t: float) -> int:
+        start, ticks, current = [m for m in tempo_map if m[0] <= t][-1]
+        return ticks + int(round((t - start) / current * TICKS_PER_BEAT))
+
+    while time < seconds:
+        for change in sorted(c for c in changes if c <= time):
+            changes.discard(change)
+            tempo = float(rng.uniform(0.3, 0.8))
+            tempo_map.append((time, to_ticks(time), tempo))
+            events.append((to_ticks(time), 0, mido.MetaMessage('set_tempo', tempo=int(tempo * 1e6))))
+        chord = rng.choice(np.arange(21, 109), int(rng.integers(1, 6)), replace=False)
+        for key in chord:
+            length = tempo * 2.0 ** float(rng.integers(-3, 3))
+            events.append((to_ticks(time), 2, mido.Message('note_on', note=int(key), velocity=64)))
+            events.append((to_ticks(time + length), 1, mido.Message('note_off', note=int(key), velocity=0)))
+        time += float(rng.exponential(len(chord) / density))
+
+    track = mido.MidiTrack()
+    last = 0
+    for ticks, _, msg in sorted(events, key=lambda e: (e[0], e[1])):
+        track.append(msg.copy(time=ticks - last))
+        last = ticks
+    midi = mido.MidiFile(ticks_per_beat=TICKS_PER_BEAT)
+    midi.tracks.append(track)
+    return midi
+
+
+def generate_corpus(folder: str, files: int = 20, seconds: float = 60.0, density: float = 8.0,
+                    tempo_changes: int = 4, seed: int = 0) -> List[str]:
+    """
+    Writes synthetic corpus into folder.
+
+    :param folder: Output folder.
+    :param files: Number of tracks.
+    :param seconds: Approximate length of each track.
+    :param density: Mean number of notes per second.
+    :param tempo_changes: Number of tempo changes in each track.
+    :param seed: Seed of random generator.
+    :return: Paths of created files.
+    """
+
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(files):
+        path = os.path.join(folder, f'synthetic_{i:04d}.mid')
+        synthetic_track(seconds, density, tempo_changes, rng).save(path)
+        paths.append(path)
+    return paths
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds options of synthetic corpus to argument parser.
+    """
+
+    parser.add_argument('--files', type=int, default=20, help='number of tracks')
+    parser.add_argument('--seconds', type=float, default=60.0, help='length of each track')
+    parser.add_argument('--density', type=float, default=8.0, help='notes per second')
+    parser.add_argument('--tempo-changes', type=int, default=4, help='tempo changes per track')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates synthetic midi corpus.')
+    parser.add_argument('folder')
+    add_arguments(parser)
+    args = parser.parse_args()
+    generate_corpus(args.folder, args.files, args.seconds, args.density, args.tempo_changes, args.seed)
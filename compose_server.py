@@ -0,0 +1,330 @@
+"""
+Long running composition service. Corpora are loaded (and convolved) once and kept in memory, compose requests
+are queued per corpus and requests waiting at the same time are composed together in lockstep, sharing every scan
+of the corpus (see `composer.batch_music_generator`).
+
+HTTP interface (over TCP or unix socket):
+    POST /compose   json body (or query) with `corpus`, `length`, `base_name` and `seed`, returns midi file
+                    with latency of request in `X-Queue-Seconds`, `X-Compose-Seconds` and `X-Batch-Size` headers
+    GET /corpora    names and sizes of loaded corpora
+    GET /metrics    summary of latency of recent requests
+
+Run from repository root: python compose_server.py [name=]folder ... [--port P | --unix PATH] [--fraction F]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from http import HTTPStatus
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+
+from accord import AccordTable, track_name
+from composer import compose_accords_batch
+from corpus_cache import load_folder_cached
+from midi_writer import accords_to_midi
+from vectorization import Vector
+
+__all__ = ['ComposeRequest', 'ComposeServer', 'load_corpora', 'MAX_BATCH', 'BATCH_WINDOW', 'MAX_LENGTH']
+
+# Maximal number of requests composed together.
+MAX_BATCH = 16
+# Time (in seconds) scheduler waits after first queued request for others to join its batch.
+BATCH_WINDOW = 0.01
+# Maximal length of composed track in seconds.
+MAX_LENGTH = 30 * 60
+# Number of recent requests included in metrics.
+HISTORY = 1000
+
+
+class ComposeRequest:
+    """
+    Queued request of composition together with future of its result.
+    """
+    __slots__ = ('corpus', 'length', 'base_name', 'seed', 'future', 'received', 'started', 'finished', 'batch')
+
+    def __init__(self, corpus: str, length: float, base_name: str, seed: int | None, future: asyncio.Future):
+        self.corpus = corpus
+        self.length = length
+        self.base_name = base_name
+        self.seed = seed
+        self.future = future
+        self.received = time.perf_counter()
+        self.started = 0.0
+        self.finished = 0.0
+        self.batch = 0
+
+    def latency(self) -> Dict[str, float]:
+        """
+        Returns time spent in queue, time of composition and total time (in seconds) and size of batch.
+        """
+
+        return {'queue': self.started - self.received, 'compose': self.finished - self.started,
+                'total': self.finished - self.received, 'batch': self.batch}
+
+
+def load_corpora(folders: Dict[str, str], fraction: float = 1.0) \
+        -> Dict[str, Tuple[AccordTable, Vector, Vector]]:
+    """
+    Loads corpora through corpus cache.
+
+    :param folders: Folders of corpora by their names.
+    :param fraction: Fraction of tracks of every folder to load.
+    :return: Accords, vectors and convolved vectors of every corpus by name.
+    """
+
+    res = {}
+    for name, folder in folders.items():
+        accords, vectors, convolved, _ = load_folder_cached(folder, fraction=fraction)
+        res[name] = (accords, vectors, np.ascontiguousarray(convolved, dtype=np.float32))
+    return res
+
+
+def _response(status: HTTPStatus, body: bytes, content_type: str = 'application/json',
+              headers: Dict[str, str] | None = None) -> bytes:
+    """
+    Encodes HTTP response (connection is closed after it).
+    """
+
+    lines = [f'HTTP/1.1 {status.value} {status.phrase}', f'Content-Type: {content_type}',
+             f'Content-Length: {len(body)}', 'Connection: close']
+    lines.extend(f'{k}: {v}' for k, v in (headers or {}).items())
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+def _json_response(status: HTTPStatus, data) -> bytes:
+    return _response(status, json.dumps(data).encode())
+
+
+class ComposeServer:
+    """
+    Service composing tracks from corpora kept in memory. Every corpus has its own queue served by scheduler
+    task, which composes up to `max_batch` waiting requests together in thread pool, so event loop keeps
+    accepting requests meanwhile.
+    """
+    def __init__(self, corpora: Dict[str, Tuple[AccordTable, Vector, Vector]], max_batch: int = MAX_BATCH,
+                 batch_window: float = BATCH_WINDOW):
+        """
+        :param corpora: Accords, vectors and convolved vectors of every corpus by name (see `load_corpora`).
+        :param max_batch: Maximal number of requests composed together.
+        :param batch_window: Time (in seconds) scheduler waits for other requests to join batch.
+        """
+
+        self.corpora = corpora
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.schedulers: List[asyncio.Task] = []
+        self.history = deque(maxlen=HISTORY)
+
+    def start(self):
+        """
+        Starts schedulers of all corpora (has to be called from running event loop).
+        """
+
+        for name in self.corpora:
+            self.queues[name] = asyncio.Queue()
+            self.schedulers.append(asyncio.create_task(self._scheduler(name)))
+
+    async def stop(self):
+        """
+        Cancels schedulers.
+        """
+
+        for task in self.schedulers:
+            task.cancel()
+        await asyncio.gather(*self.schedulers, return_exceptions=True)
+        self.schedulers = []
+
+    async def compose(self, corpus: str, length: float, base_name: str = 'composer', seed: int | None = None) \
+            -> Tuple[bytes, Dict[str, float]]:
+        """
+        Queues composition of single track and waits for it.
+
+        :param corpus: Name of corpus.
+        :param length: Length of track in seconds.
+        :param base_name: Base name of track (stored in midi file).
+        :param seed: Seed of random generator (random if None).
+        :return: Pair of midi file and latency of request (see `ComposeRequest.latency`).
+        """
+
+        if corpus not in self.queues:
+            raise KeyError(f'unknown corpus {corpus}')
+        if not 0 < length <= MAX_LENGTH:
+            raise ValueError(f'length has to be in range (0, {MAX_LENGTH}]')
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int) or seed < 0):
+            raise ValueError('seed has to be non-negative integer')
+        request = ComposeRequest(corpus, length, base_name, seed, asyncio.get_running_loop().create_future())
+        await self.queues[corpus].put(request)
+        midi = await request.future
+        latency = request.latency()
+        self.history.append(latency)
+        return midi, latency
+
+    async def _scheduler(self, corpus: str):
+        """
+        Composes queued requests of corpus in batches.
+        """
+
+        queue = self.queues[corpus]
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            await asyncio.sleep(self.batch_window)
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            start = time.perf_counter()
+            for request in batch:
+                request.started = start
+                request.batch = len(batch)
+            try:
+                res = await loop.run_in_executor(None, self._compose_batch, corpus, batch)
+            except Exception as e:
+                res = [e]
+                if len(batch) > 1:
+                    # Requests are composed again one by one, so only the one causing failure fails.
+                    res = []
+                    for request in batch:
+                        try:
+                            res.extend(await loop.run_in_executor(None, self._compose_batch, corpus, [request]))
+                        except Exception as error:
+                            res.append(error)
+            finish = time.perf_counter()
+            for request, midi in zip(batch, res):
+                request.finished = finish
+                if request.future.done():
+                    continue
+                if isinstance(midi, Exception):
+                    request.future.set_exception(midi)
+                else:
+                    request.future.set_result(midi)
+
+    def _compose_batch(self, corpus: str, batch: List[ComposeRequest]) -> List[bytes]:
+        """
+        Composes tracks of all requests in batch and encodes them as midi files.
+        """
+
+        accords, vectors, convolved = self.corpora[corpus]
+        seeds = [r.seed if r.seed is not None else np.random.SeedSequence() for r in batch]
+        tracks = compose_accords_batch(vectors, accords, [r.length for r in batch], seeds, convolved)
+        return [accords_to_midi(track, track_name(r.base_name.replace('/', '-'))) for r, track in zip(batch, tracks)]
+
+    def summary(self) -> Dict:
+        """
+        Returns number of recent requests and mean and 95th percentile of their latencies and batch sizes.
+        """
+
+        res = {'requests': len(self.history)}
+        if self.history:
+            for field in ('queue', 'compose', 'total', 'batch'):
+                values = np.array([h[field] for h in self.history])
+                res[field] = {'mean': float(np.mean(values)), 'p95': float(np.percentile(values, 95))}
+        return res
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serves single HTTP request.
+        """
+
+        try:
+            method, target, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            writer.write(await self._route(method, target, body))
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            writer.write(_json_response(HTTPStatus.BAD_REQUEST, {'error': str(e)}))
+        finally:
+            await writer.drain()
+            writer.close()
+
+    async def _route(self, method: str, target: str, body: bytes) -> bytes:
+        """
+        Returns response to request.
+        """
+
+        url = urlsplit(target)
+        if method == 'GET' and url.path == '/corpora':
+            return _json_response(HTTPStatus.OK, {name: len(c[0]) for name, c in self.corpora.items()})
+        if method == 'GET' and url.path == '/metrics':
+            return _json_response(HTTPStatus.OK, self.summary())
+        if url.path != '/compose':
+            return _json_response(HTTPStatus.NOT_FOUND, {'error': f'unknown path {url.path}'})
+        if method not in ('GET', 'POST'):
+            return _json_response(HTTPStatus.METHOD_NOT_ALLOWED, {'error': f'unsupported method {method}'})
+
+        params = dict(parse_qsl(url.query))
+        if body:
+            data = json.loads(body)
+            if not isinstance(data, dict):
+                raise ValueError('body has to be json object')
+            params.update(data)
+        corpus = params.get('corpus', next(iter(self.corpora), ''))
+        seed = params.get('seed')
+        if isinstance(seed, str):
+            seed = int(seed)
+        try:
+            midi, latency = await self.compose(corpus, float(params.get('length', 60.0)),
+                                               str(params.get('base_name', 'composer')), seed)
+        except KeyError as e:
+            return _json_response(HTTPStatus.NOT_FOUND, {'error': e.args[0]})
+        except ValueError as e:
+            return _json_response(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+        except Exception as e:
+            return _json_response(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f'{type(e).__name__}: {e}'})
+        return _response(HTTPStatus.OK, midi, 'audio/midi', {
+            'X-Queue-Seconds': f"{latency['queue']:.6f}",
+            'X-Compose-Seconds': f"{latency['compose']:.6f}",
+            'X-Batch-Size': str(latency['batch']),
+        })
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, unix: str | None = None):
+        """
+        Starts schedulers and serves requests forever.
+
+        :param host: Host of TCP server.
+        :param port: Port of TCP server.
+        :param unix: Path of unix socket (used instead of TCP if provided).
+        """
+
+        self.start()
+        if unix is not None:
+            server = await asyncio.start_unix_server(self.handle, unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        print(f"serving {', '.join(self.corpora)} on {unix or f'http://{host}:{port}'}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves composition requests from corpora kept in memory.')
+    parser.add_argument('corpora', nargs='+', help='folders of corpora, optionally prefixed with name=')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='path of unix socket to listen on instead of TCP')
+    parser.add_argument('--fraction', type=float, default=1.0, help='fraction of tracks of every corpus')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--batch-window', type=float, default=BATCH_WINDOW)
+    args = parser.parse_args()
+
+    folders = {}
+    for spec in args.corpora:
+        name, _, folder = spec.rpartition('=')
+        folders[name or os.path.basename(os.path.normpath(folder))] = folder
+    server = ComposeServer(load_corpora(folders, args.fraction), args.max_batch, args.batch_window)
+    asyncio.run(server.serve(args.host, args.port, args.unix))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,17 @@
-from typing import List, Tuple, Iterator
+from collections import deque
+from copy import copy
+from typing import List, Tuple, Iterator, Callable
+from time import perf_counter
 
-from scipy.spatial.distance import cdist
 
-from accord import Accord, accords_to_notes, AccordFlag, save_accords
-from convolutions import get_gaussian_curve, maxvolve
+from accord import Accord, accords_to_notes, AccordFlag, save_accords, save_accords_many, iter_notes, \
+    accord_messages, track_name, start_track
+from convolutions import get_gaussian_curve, batch_maxvolve
+from metrics import Metrics
+from midi_stream import MidiStreamWriter
 from notes import Note
-from vectorization import Vector, apply_accord, empty_vector
+from selection import selection_weights, sample_index, batch_weights, truncate_top_k, QuantizedCorpus, CompactCorpus
+from vectorization import Vector, apply_accord, apply_accord_convolved, empty_vector
 
 import numpy as np
 
@@ -16,14 +22,78 @@ PANIC_THRESHOLD = SELECTION_CURVE_PARAM * np.exp(- 0.2 * SELECTION_CURVE_PARAM)
 LONG_IMPORTANCE = 0.2
 SHORT_IMPORTANCE = 0.6
 CUMULATIVE_IMPORTANCE = 0.2
+IMPORTANCES = np.array([LONG_IMPORTANCE, SHORT_IMPORTANCE, CUMULATIVE_IMPORTANCE])
 
+# Convolved state of composed track is updated incrementally and fully recomputed every that many accords.
+RESYNC_STEPS = 64
 
-def select_bit(current_state: Vector, known_vec) -> Tuple[int, float]:
+
+def select_bit(current_state: Vector, known_vec: np.ndarray, index=None, weights: np.ndarray | None = None,
+               threshold: float = 0.0, top_k: int = 0, stats: dict | None = None) -> Tuple[int, float]:
     """
     Based on current state of composed track and provided data set of known accords, selects
     randomly accord to be played with probability depending on similarity to current state.
+    If `index` (`corpus_index.CorpusIndex` or `sharded_corpus.ShardedCorpus` built over `known_vec`) is provided,
+    it is used for selection.
+
+    :param current_state: Convolved state of composed track.
+    :param known_vec: Convolved known vectors, preferably contiguous float32 array (otherwise it is copied),
+        `selection.QuantizedCorpus` or `selection.CompactCorpus`.
+    :param index: Index over known vectors (optional).
+    :param weights: Preallocated buffer for weights of known vectors (optional).
+    :param threshold: Weights lower than threshold are truncated to zero.
+    :param top_k: If positive, only `top_k` known vectors with largest weights are considered.
+    :param stats: If provided, times of distance and sampling phases and sum and maximum of weights
+        are stored in it (see `metrics.FIELDS`).
+    :return: Pair of selected index (-1 if every weight was truncated) and its weight.
+    """
+
+    if index is not None:
+        start = perf_counter()
+        res = index.select(current_state)
+        if stats is not None:
+            stats['sampling'] = perf_counter() - start
+        return res
+
+    compact = None
+    if isinstance(known_vec, CompactCorpus):
+        compact, known_vec = known_vec, known_vec.vectors
+    if isinstance(known_vec, QuantizedCorpus):
+        corpus = known_vec.codes
+        state, importances = known_vec.rescale(current_state, IMPORTANCES)
+    else:
+        corpus = np.ascontiguousarray(known_vec, dtype=np.float32)
+        state, importances = np.asarray(current_state, dtype=np.float64), IMPORTANCES
+    weights = np.empty(corpus.shape[0]) if weights is None else weights[:corpus.shape[0]]
+    start = perf_counter()
+    sum_of_dist, max_dist = selection_weights(corpus, state, importances, SELECTION_CURVE_PARAM, weights, threshold,
+                                              top_k if compact is None else 0)
+    if compact is not None:
+        # Every entry stands for all its members, so `top_k` counts them. Threshold applies to weight of single
+        # member and is already applied.
+        if 0 < top_k < len(compact):
+            truncate_top_k(weights, compact.multiplicity, top_k)
+        weights *= compact.multiplicity
+        sum_of_dist = float(np.sum(weights))
+    middle = perf_counter()
+    selected, weight = sample_index(weights, sum_of_dist, np.random.uniform(0.0, 1.0))
+    if compact is not None and selected >= 0:
+        weight /= compact.multiplicity[selected]
+        selected = compact.member(selected, np.random.uniform(0.0, 1.0))
+    if stats is not None:
+        stats.update(distance=middle - start, sampling=perf_counter() - middle, mass=sum_of_dist, max=max_dist)
+
+    return selected, weight
+
+
+def select_bit_cdist(current_state: Vector, known_vec) -> Tuple[int, float]:
+    """
+    Reference implementation of `select_bit` based on `cdist`, kept for comparison.
     """
 
+    # Imported here, so composing does not pay for loading scipy.
+    from scipy.spatial.distance import cdist
+
     dist_long = cdist(np.array(known_vec[:, 0]), np.array([current_state[0]]), metric='chebyshev')[:, 0]
     dist_short = cdist(np.array(known_vec[:, 1]), np.array([current_state[1]]), metric='chebyshev')[:, 0]
     dist_cumulative = cdist(np.array(known_vec[:, 2]), np.array([current_state[2]]), metric='chebyshev')[:, 0]
@@ -43,47 +113,93 @@ def select_bit(current_state: Vector, known_vec) -> Tuple[int, float]:
 
 def convolve(x: Vector) -> Vector:
     """
-    Calculates maxvolve on state vector.
+    Calculates maxvolve on state vector (or array of state vectors).
+    """
+
+    return batch_maxvolve(x, CONVOLUTION)
+
+
+def convolve_known(known_vec: List[Vector], convolved_vec: np.ndarray | QuantizedCorpus | CompactCorpus | None = None) \
+        -> np.ndarray | QuantizedCorpus | CompactCorpus:
+    """
+    Returns convolved known vectors as contiguous float32 array (or quantized or compact corpus if it was provided).
+    Calculates convolution if it is not provided.
+    """
+
+    if isinstance(convolved_vec, (QuantizedCorpus, CompactCorpus)):
+        return convolved_vec
+    if convolved_vec is None:
+        known_vec = np.asarray(known_vec, dtype=np.float32)
+        convolved_vec = batch_maxvolve(known_vec, CONVOLUTION, np.empty(known_vec.shape, dtype=np.float32))
+        print("convoluted")
+    return np.ascontiguousarray(convolved_vec, dtype=np.float32)
+
+
+def play_accord(accord: Accord, tempo: float | None, rng=np.random) -> Tuple[Accord, float | None]:
+    """
+    Adjusts copy of selected accord to tempo of composed track.
+
+    :param accord: Selected accord.
+    :param tempo: Current tempo of composed track (None if it should be drawn again).
+    :param rng: Source of randomness.
+    :return: Pair of accord to be played and tempo for the next accord.
     """
 
-    r0 = maxvolve(x[0], CONVOLUTION)
-    r1 = maxvolve(x[1], CONVOLUTION)
-    r2 = maxvolve(x[2], CONVOLUTION)
-    return np.array([r0, r1, r2])
+    accord_played = copy(accord)
+    if tempo is None:
+        tempo = rng.lognormal(np.log(accord_played.tempo), 0.05)
+    accord_played.tempo = tempo
+    if AccordFlag.TEMPO_CHANGE in accord_played.flags or accord_played.length > 8.0:
+        tempo = None
+    accord_played.length = min(accord_played.length, 8.0)
+    return accord_played, tempo
 
 
-def music_generator(known_vec: List[Vector], known_accords: List[Accord], known_names: List[str])\
+def music_generator(known_vec: List[Vector], known_accords: List[Accord], known_names: List[str],
+                    convolved_vec: np.ndarray | QuantizedCorpus | CompactCorpus | None = None, index=None,
+                    metrics: Metrics | None = None) \
         -> Iterator[Accord]:
     """
-    Based on provided data set composes consecutive accords.
+    Based on provided data set composes consecutive accords. Convolution of known vectors can be provided
+    in `convolved_vec` (e.g. read from corpus cache), otherwise it is calculated. Optional `index` over
+    convolved vectors speeds up selection of accords. Every step is reported to `metrics` (if enabled).
+    Convolved state of composed track is updated incrementally (see `vectorization.apply_accord_convolved`).
     """
 
+    if metrics is None:
+        metrics = Metrics()
     vector = empty_vector()
-    known_vec = np.array(list(map(convolve, known_vec)))
-    print("convoluted")
+    state = convolve(vector)
+    known_vec = convolve_known(known_vec, convolved_vec)
+    weights = np.empty(len(known_vec))
     prev = 0
     tempo = None
     pressed = np.zeros(128)
+    step = 0
     while True:
-        selected, confidence = select_bit(convolve(vector), known_vec)
-        if confidence < PANIC_THRESHOLD:
-            print('panic')
+        stats = {} if metrics.enabled else None
+        selected, confidence = select_bit(state, known_vec, index, weights, stats=stats)
+        panic = bool(confidence < PANIC_THRESHOLD)
+        if panic:
             selected = (prev + 1) % len(known_vec)
-        print(known_names[selected], selected)
         prev = selected
-        accord_played = known_accords[selected]
-        if tempo is None:
-            tempo = np.random.lognormal(np.log(accord_played.tempo), 0.05)
-        accord_played.tempo = tempo
-        if AccordFlag.TEMPO_CHANGE in accord_played.flags or accord_played.length > 8.0:
-            tempo = None
-        accord_played.length = min(accord_played.length, 8.0)
-        pressed, vector = apply_accord(accord_played, pressed, vector)
+        accord_played, tempo = play_accord(known_accords[selected], tempo)
+
+        # Convolved state is maintained incrementally instead of calling `convolve(vector)`.
+        start = perf_counter() if stats is not None else 0.0
+        step += 1
+        apply_accord_convolved(accord_played, pressed, vector, state, CONVOLUTION, step % RESYNC_STEPS == 0)
+        if stats is not None:
+            stats.update(convolution=perf_counter() - start, confidence=confidence, panic=panic, selected=selected,
+                         track=known_names[selected])
+            metrics.step(stats)
         yield accord_played
 
 
 def compose_music(known_vec: List[Vector], known_accords: List[Accord], known_names: List[str],
-                  length: float | None = None, base_name: str = "composer") -> List[Note]:
+                  length: float | None = None, base_name: str = "composer",
+                  convolved_vec: np.ndarray | QuantizedCorpus | CompactCorpus | None = None, index=None,
+                  metrics: Metrics | None = None) -> List[Note]:
     """
     Function returning list of composed notes of track of specified length. In addition,
     saves copy of composed track as midi file with specified based name.
@@ -93,19 +209,179 @@ def compose_music(known_vec: List[Vector], known_accords: List[Accord], known_na
     :param known_names: Known names of tracks from data set.
     :param length: Length in seconds of composed track.
     :param base_name: Base name of tracks used in file naming.
+    :param convolved_vec: Precalculated convolution of known vectors (optional, can be quantized or compact corpus).
+    :param index: Index over convolved known vectors (optional, see `corpus_index.CorpusIndex`).
+    :param metrics: Metrics of composition steps (optional, see `metrics.MetricsRecorder`), summary is
+        printed at the end.
     :return: List of composed notes
     """
 
-    mg = music_generator(known_vec, known_accords, known_names)
+    mg = music_generator(known_vec, known_accords, known_names, convolved_vec, index, metrics)
     time = 0.0
     res = []
     for accord in mg:
         res.append(accord)
         time += accord.tempo * accord.length
-        if length is None and accord.flags in AccordFlag.END:
-            break
-        if length is not None and time > length:
+        if is_finished(accord, time, length):
             break
     save_accords(res, basename=base_name.replace("/", "-"))
+    if metrics is not None and metrics.enabled:
+        print(metrics.format_summary())
     return accords_to_notes(res)
 
+
+def compose_stream(known_vec: List[Vector], known_accords: List[Accord], known_names: List[str],
+                   length: float | None = None, base_name: str = "composer",
+                   convolved_vec: np.ndarray | QuantizedCorpus | CompactCorpus | None = None, index=None,
+                   path: str = 'output', callback: Callable | None = None, metrics: Metrics | None = None) \
+        -> Iterator[Note]:
+    """
+    Streaming version of `compose_music`. Yields composed notes as soon as each accord is generated, while
+    midi file is written incrementally. Memory used does not depend on length of track, so with
+    `length=math.inf` composition never ends.
+
+    :param known_vec: Known vectors from data set.
+    :param known_accords: Known accords from data set.
+    :param known_names: Known names of tracks from data set.
+    :param length: Length in seconds of composed track.
+    :param base_name: Base name of tracks used in file naming.
+    :param convolved_vec: Precalculated convolution of known vectors (optional, can be quantized or compact corpus).
+    :param index: Index over convolved known vectors (optional, see `corpus_index.CorpusIndex`).
+    :param path: Path to folder where track should be saved.
+    :param callback: Function called with time (in seconds) and every midi message written (optional).
+    :param metrics: Metrics of composition steps (optional), summary is printed at the end.
+    :return: Iterator of composed notes
+    """
+
+    ready = deque()
+
+    def accords() -> Iterator[Accord]:
+        time = 0.0
+        for accord in music_generator(known_vec, known_accords, known_names, convolved_vec, index, metrics):
+            ready.extend(iter_notes([accord], time))
+            yield accord
+            time += accord.tempo * accord.length
+            if is_finished(accord, time, length):
+                break
+
+    name = track_name(base_name.replace("/", "-"))
+    with MidiStreamWriter(path + '/' + name + '.mid') as writer:
+        start_track(writer, name)
+        for (time, tempo, msg) in accord_messages(accords()):
+            writer.send_at(time, tempo, msg)
+            if callback is not None:
+                callback(time, msg)
+            while ready:
+                yield ready.popleft()
+    if metrics is not None and metrics.enabled:
+        print(metrics.format_summary())
+
+
+def is_finished(accord: Accord, time: float, length: float | None) -> bool:
+    """
+    Checks if composition should end after accord played at given time.
+    """
+
+    if length is None:
+        return accord.flags in AccordFlag.END
+    return time > length
+
+
+def batch_music_generator(known_vec: List[Vector], known_accords: List[Accord], batch: int,
+                          seeds: List[int] | None = None, convolved_vec: np.ndarray | None = None) \
+        -> Iterator[List[Accord]]:
+    """
+    Composes consecutive accords of `batch` independent tracks in lockstep. Weights of all known vectors
+    for all tracks are calculated in single pass over the data set.
+
+    :param known_vec: Known vectors from data set.
+    :param known_accords: Known accords from data set.
+    :param batch: Number of composed tracks.
+    :param seeds: Seeds of random generators of each track (random if None).
+    :param convolved_vec: Precalculated convolution of known vectors (optional, quantized or compact corpus is
+        expanded).
+    :return: Iterator of lists of next accords of every track.
+    """
+
+    if seeds is None:
+        seeds = np.random.SeedSequence().spawn(batch)
+    rngs = [np.random.default_rng(seed) for seed in seeds]
+    known_vec = convolve_known(known_vec, convolved_vec)
+    if isinstance(known_vec, (QuantizedCorpus, CompactCorpus)):
+        known_vec = known_vec.dequantize()
+    weights = np.empty((batch, known_vec.shape[0]))
+    vectors = np.zeros((batch, 3, 128), dtype=np.float32)
+    pressed = np.zeros((batch, 128))
+    prev = [0] * batch
+    tempo = [None] * batch
+    while True:
+        states = convolve(vectors)
+        batch_weights(known_vec, states, IMPORTANCES, SELECTION_CURVE_PARAM, weights)
+        cumulative = np.cumsum(weights, axis=1, out=weights)
+        accords = []
+        for b in range(batch):
+            rand = rngs[b].uniform(0.0, cumulative[b, -1])
+            selected = min(int(np.searchsorted(cumulative[b], rand, side='right')), known_vec.shape[0] - 1)
+            confidence = cumulative[b, selected] - (cumulative[b, selected - 1] if selected > 0 else 0.0)
+            if confidence < PANIC_THRESHOLD:
+                selected = (prev[b] + 1) % known_vec.shape[0]
+            prev[b] = selected
+            accord_played, tempo[b] = play_accord(known_accords[selected], tempo[b], rngs[b])
+            pressed[b], vectors[b] = apply_accord(accord_played, pressed[b], vectors[b])
+            accords.append(accord_played)
+        yield accords
+
+
+def compose_accords_batch(known_vec: List[Vector], known_accords: List[Accord], lengths: List[float | None],
+                          seeds: List[int] | None = None, convolved_vec: np.ndarray | None = None) \
+        -> List[List[Accord]]:
+    """
+    Composes accords of independent tracks at once (see `batch_music_generator`), each of its own length.
+
+    :param known_vec: Known vectors from data set.
+    :param known_accords: Known accords from data set.
+    :param lengths: Length in seconds of every composed track (None to end with track of data set).
+    :param seeds: Seeds of random generators of each track (random if None).
+    :param convolved_vec: Precalculated convolution of known vectors (optional, quantized or compact corpus is
+        expanded).
+    :return: Lists of composed accords of every track.
+    """
+
+    batch = len(lengths)
+    mg = batch_music_generator(known_vec, known_accords, batch, seeds, convolved_vec)
+    times = [0.0] * batch
+    res = [[] for _ in range(batch)]
+    finished = [False] * batch
+    for accords in mg:
+        for b, accord in enumerate(accords):
+            if finished[b]:
+                continue
+            res[b].append(accord)
+            times[b] += accord.tempo * accord.length
+            finished[b] = is_finished(accord, times[b], lengths[b])
+        if all(finished):
+            break
+    return res
+
+
+def compose_music_batch(known_vec: List[Vector], known_accords: List[Accord], batch: int,
+                        length: float | None = None, base_name: str = "composer", seeds: List[int] | None = None,
+                        convolved_vec: np.ndarray | None = None, path: str = 'output') -> List[List[Note]]:
+    """
+    Function composing `batch` independent tracks at once. Every track is saved as midi file.
+
+    :param known_vec: Known vectors from data set.
+    :param known_accords: Known accords from data set.
+    :param batch: Number of composed tracks.
+    :param length: Length in seconds of each composed track.
+    :param base_name: Base name of tracks used in file naming.
+    :param seeds: Seeds of random generators of each track (random if None).
+    :param convolved_vec: Precalculated convolution of known vectors (optional, quantized or compact corpus is
+        expanded).
+    :param path: Path to folder where tracks should be saved.
+    :return: Lists of composed notes of every track.
+    """
+
+    res = compose_accords_batch(known_vec, known_accords, [length] * batch, seeds, convolved_vec)
+    save_accords_many(res, base_name.replace('/', '-'), path)
+    return [accords_to_notes(r) for r in res]
@@ -1,6 +1,5 @@
-import scipy
 import numpy as np
-from numba import jit
+from numba import jit, prange
 
 
 def get_gaussian_curve(length: int, sigma=1) -> np.ndarray[np.float32]:
@@ -13,13 +12,15 @@ def get_gaussian_curve(length: int, sigma=1) -> np.ndarray[np.float32]:
     """
 
     x = np.arange(-length / 2 + 0.5, length / 2 + 1)
-    y = scipy.stats.norm.pdf(x, scale=sigma)
+    # Density of normal distribution, computed like `scipy.stats.norm.pdf(x, scale=sigma)`.
+    y = np.exp(-(x / sigma) ** 2 / 2.0) / np.sqrt(2 * np.pi) / sigma
     return y / np.max(y)
 
 
 def gen_convolve(x: np.ndarray, y: np.ndarray, op, zipper) -> np.ndarray:
     """
-    Generalized convolution operation.
+    Generalized convolution operation. If both `op` and `zipper` are numpy ufuncs,
+    the work is done by `convolve_general`.
     :param x: First vector.
     :param y: Second vector.
     :param op: Function of two elements of each vector.
@@ -27,6 +28,9 @@ def gen_convolve(x: np.ndarray, y: np.ndarray, op, zipper) -> np.ndarray:
     :return: Convoluted vector.
     """
 
+    if isinstance(op, np.ufunc) and isinstance(zipper, np.ufunc):
+        return convolve_general(x, y, op, zipper)
+
     n = x.shape[0] + y.shape[0] - 1
     res = np.zeros(n)
     for i in range(n):
@@ -62,3 +66,153 @@ def maxvolve(x: np.ndarray, y: np.ndarray) -> np.ndarray:
             y_pos += 1
         res[i - y_size // 2] = tmp
     return res
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _batch_maxvolve(x: np.ndarray, y: np.ndarray, out: np.ndarray):
+    """
+    Performs `maxvolve` of every row of two-dimensional array `x` with `y`, writing results into `out`.
+    Loops are ordered by position in `y`, so the inner loop runs over contiguous memory.
+    """
+
+    x_size = x.shape[1]
+    y_size = y.shape[0]
+    half = y_size // 2
+    for r in prange(x.shape[0]):
+        out[r] = -np.inf
+        for y_pos in range(y_size):
+            shift = y_pos - half
+            for x_pos in range(max(0, -shift), min(x_size, x_size - shift)):
+                out[r, x_pos + shift] = max(out[r, x_pos + shift], x[r, x_pos] * y[y_pos])
+
+
+def batch_maxvolve(x: np.ndarray, y: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Performs `maxvolve` of every vector along last axis of `x` with `y` in single compiled call,
+    processing vectors in parallel.
+
+    :param x: Array of shape (..., n).
+    :param y: Second vector (e.g. result of `get_gaussian_curve`).
+    :param out: Preallocated output of the same shape as `x` (float64 array is created if None).
+    :return: Array of convoluted vectors.
+    """
+
+    if out is None:
+        out = np.empty(x.shape)
+    _batch_maxvolve(np.ascontiguousarray(x).reshape(-1, x.shape[-1]), np.ascontiguousarray(y, dtype=np.float64),
+                    out.reshape(-1, x.shape[-1]))
+    return out
+
+
+@jit(nopython=True)
+def _add(a, b):
+    return a + b
+
+
+@jit(nopython=True)
+def _subtract(a, b):
+    return a - b
+
+
+@jit(nopython=True)
+def _multiply(a, b):
+    return a * b
+
+
+@jit(nopython=True)
+def _maximum(a, b):
+    return max(a, b)
+
+
+@jit(nopython=True)
+def _minimum(a, b):
+    return min(a, b)
+
+
+# Ufuncs with compiled scalar equivalents.
+COMPILED_UFUNCS = {np.add: _add, np.subtract: _subtract, np.multiply: _multiply,
+                   np.maximum: _maximum, np.minimum: _minimum}
+_kernels = {}
+
+
+def _compiled_kernel(op: np.ufunc, reduce: np.ufunc):
+    """
+    Returns (compiling on first use) kernel of generalized convolution for given pair of ufuncs.
+    """
+
+    if (op, reduce) not in _kernels:
+        op_fn = COMPILED_UFUNCS[op]
+        reduce_fn = COMPILED_UFUNCS[reduce]
+
+        @jit(nopython=True, parallel=True)
+        def kernel(x: np.ndarray, y: np.ndarray, out: np.ndarray, start: int):
+            x_size = x.shape[1]
+            y_size = y.shape[0]
+            for r in prange(x.shape[0]):
+                for o in range(out.shape[1]):
+                    i = o + start
+                    offset = max(0, i - x_size + 1)
+                    tmp = op_fn(x[r, i - offset], y[offset])
+                    for y_pos in range(offset + 1, min(i, y_size - 1) + 1):
+                        tmp = reduce_fn(tmp, op_fn(x[r, i - y_pos], y[y_pos]))
+                    out[r, o] = tmp
+
+        _kernels[(op, reduce)] = kernel
+    return _kernels[(op, reduce)]
+
+
+def _sliding_convolve(x: np.ndarray, y: np.ndarray, op, reduce, out: np.ndarray):
+    """
+    Full generalized convolution of every row of `x` with `y`, vectorized over rows and positions.
+    Each step applies `op` to whole `x` and one element of `y` and combines it into shifted window of `out`.
+    """
+
+    x_size = x.shape[1]
+    out[:, :x_size] = op(x, y[0])
+    for y_pos in range(1, y.shape[0]):
+        window = out[:, y_pos:y_pos + x_size - 1]
+        window[...] = reduce(window, op(x[:, :-1], y[y_pos]))
+        out[:, y_pos + x_size - 1] = op(x[:, -1], y[y_pos])
+
+
+def convolve_general(x: np.ndarray, y: np.ndarray, op=np.multiply, reduce=np.add, mode: str = 'full',
+                     method: str = 'auto') -> np.ndarray:
+    """
+    Generalized convolution of every vector along last axis of `x` with `y`. Result at each position is
+    `reduce` of `op(x[i - j], y[j])` over all valid `j` (in increasing order of `j`), e.g. `(multiply, add)` is
+    standard convolution, `(multiply, maximum)` is `maxvolve` and `(add, maximum)` is max-plus convolution.
+
+    :param x: Array of shape (..., n).
+    :param y: Second vector.
+    :param op: Binary ufunc (or function vectorized over arrays) applied to pairs of elements.
+    :param reduce: Binary ufunc (or function vectorized over arrays) combining results in single position.
+    :param mode: 'full' (output of size n + len(y) - 1) or 'same' (output of size n, centered as in `maxvolve`).
+    :param method: 'compiled', 'vectorized' or 'auto' (compiled if both ufuncs have compiled equivalents).
+    :return: Array of convoluted vectors.
+    """
+
+    if mode not in ('full', 'same'):
+        raise ValueError(f"Unknown mode {mode}")
+    x = np.asarray(x)
+    y = np.ascontiguousarray(y)
+    rows = np.ascontiguousarray(x).reshape(-1, x.shape[-1])
+    x_size, y_size = rows.shape[1], y.shape[0]
+    if method == 'auto':
+        method = 'compiled' if op in COMPILED_UFUNCS and reduce in COMPILED_UFUNCS else 'vectorized'
+    dtype = np.result_type(x, y, np.float64)
+
+    if method == 'compiled' and mode == 'same' and op is np.multiply and reduce is np.maximum:
+        out = np.empty(rows.shape, dtype=dtype)
+        _batch_maxvolve(rows, y.astype(np.float64), out)
+    elif method == 'compiled':
+        start, size = (0, x_size + y_size - 1) if mode == 'full' else (y_size // 2, x_size)
+        out = np.empty((rows.shape[0], size), dtype=dtype)
+        _compiled_kernel(op, reduce)(rows, y, out, start)
+    elif method == 'vectorized':
+        out = np.empty((rows.shape[0], x_size + y_size - 1), dtype=dtype)
+        _sliding_convolve(rows, y, op, reduce, out)
+        if mode == 'same':
+            out = out[:, y_size // 2:y_size // 2 + x_size]
+    else:
+        raise ValueError(f"Unknown method {method}")
+    return out.reshape(x.shape[:-1] + (out.shape[-1],))
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import random
+from typing import Sequence, Tuple, Dict
+
+import numpy as np
+
+import vectorization
+from accord import AccordTable
+from composer import CONVOLUTION
+from convolutions import batch_maxvolve
+from vectorization import Vector, empty_corpus, list_tracks, vectorize_tracks
+
+# Bump whenever layout of cache files or vectorization algorithm changes.
+CACHE_VERSION = 2
+CACHE_FOLDER = 'cache'
+
+__all__ = ['CACHE_VERSION', 'CACHE_FOLDER', 'load_folder_cached', 'cache_fingerprint']
+
+
+def cache_fingerprint() -> str:
+    """
+    Returns hash of all constants that influence content of cache (decay factors and convolution kernel).
+    """
+
+    constants = {
+        'version': CACHE_VERSION,
+        'decay': [vectorization.LONG_HELD_FACTOR, vectorization.LONG_RELEASED_FACTOR,
+                  vectorization.SHORT_HELD_FACTOR, vectorization.SHORT_RELEASED_FACTOR,
+                  vectorization.CUMULATIVE_INCREMENT, vectorization.CUMULATIVE_HELD_FACTOR,
+                  vectorization.CUMULATIVE_RELEASED_FACTOR],
+        'convolution': [float(x) for x in CONVOLUTION],
+    }
+    return hashlib.sha1(json.dumps(constants, sort_keys=True).encode()).hexdigest()
+
+
+def _file_hash(path: str) -> str:
+    """
+    Calculates hash of file content.
+    """
+
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _cache_paths(folder: str, cache_folder: str) -> Tuple[str, str]:
+    """
+    Returns paths of data bundle and manifest used for caching given folder.
+    """
+
+    key = os.path.normpath(folder).strip(os.sep).replace(os.sep, '-') or 'root'
+    base = os.path.join(cache_folder, key)
+    return base + '.npz', base + '.json'
+
+
+def _read_cache(bundle_path: str, manifest_path: str) -> Tuple[Dict, Dict[str, Tuple]]:
+    """
+    Reads cache of folder. Returns manifest entries and cached data (accords, vectors and convolved vectors)
+    of each file. Returns empty cache if it is missing or out of date.
+    """
+
+    if not os.path.exists(bundle_path) or not os.path.exists(manifest_path):
+        return {}, {}
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('fingerprint') != cache_fingerprint():
+        return {}, {}
+
+    data = {}
+    with np.load(bundle_path) as bundle:
+        arrays = {k: bundle[k] for k in bundle.files}
+    accords = AccordTable.from_arrays(arrays, [])
+    for rel, entry in manifest['files'].items():
+        start, end = entry['start'], entry['end']
+        table = accords[start:end]
+        table.track = np.zeros(end - start, dtype=np.int32)
+        table.track_names = [os.path.basename(rel)]
+        data[rel] = (table, arrays['vectors'][start:end], arrays['convolved'][start:end])
+    return manifest['files'], data
+
+
+def _write_cache(bundle_path: str, manifest_path: str, entries: Dict, data: Dict[str, Tuple]):
+    """
+    Writes cache of folder as single bundle of arrays and json manifest.
+    """
+
+    os.makedirs(os.path.dirname(bundle_path) or '.', exist_ok=True)
+    tables, vectors, convolved = [], [], []
+    files = {}
+    start = 0
+    for rel in sorted(entries.keys()):
+        if rel not in data:
+            files[rel] = dict(entries[rel], start=start, end=start)
+            continue
+        table, vec, conv = data[rel]
+        files[rel] = dict(entries[rel], start=start, end=start + len(table))
+        start += len(table)
+        tables.append(table)
+        vectors.append(vec)
+        convolved.append(conv)
+
+    arrays = AccordTable.concatenate(tables).to_arrays()
+    arrays['vectors'] = np.concatenate(vectors) if vectors else empty_corpus()
+    arrays['convolved'] = np.concatenate(convolved) if convolved else empty_corpus()
+
+    np.savez(bundle_path + '.tmp.npz', **arrays)
+    os.replace(bundle_path + '.tmp.npz', bundle_path)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'fingerprint': cache_fingerprint(), 'files': files}, f, indent=1)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def load_folder_cached(folder: str, fraction: float = 1.0, cache_folder: str = CACHE_FOLDER,
+                       workers: int | None = 1) -> Tuple[AccordTable, Vector, Vector, Sequence[str]]:
+    """
+    Version of `vectorization.load_folder` backed by persistent on-disk cache. Only files that were added or
+    modified since last call are parsed and vectorized, rest of data is read from cache.
+
+    :param folder: Folder containing tracks to be vectorized.
+    :param fraction: Fraction of tracks to vectorize (for performance optimization).
+    :param cache_folder: Folder where cache files are stored.
+    :param workers: Number of processes vectorizing new tracks (all cores if None).
+    :return: Tuple of table of accords, vectors, convolved vectors and names of tracks of every accord.
+    """
+
+    bundle_path, manifest_path = _cache_paths(folder, cache_folder)
+    cached_entries, cached_data = _read_cache(bundle_path, manifest_path)
+
+    entries, data = {}, {}
+    selected, pending = [], []
+    changed = False
+    for full_path in list_tracks(folder):
+        rel = os.path.relpath(full_path, folder)
+        stat = os.stat(full_path)
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        old = cached_entries.get(rel)
+
+        if old is not None and old['size'] == entry['size'] and old['mtime'] == entry['mtime']:
+            entries[rel] = old
+            data[rel] = cached_data[rel]
+        elif old is not None and old['size'] == entry['size'] and old['hash'] == _file_hash(full_path):
+            entries[rel] = dict(old, mtime=entry['mtime'])
+            data[rel] = cached_data[rel]
+            changed = True
+
+        if random.uniform(0.0, 1.0) > fraction:
+            continue
+        selected.append(rel)
+        if rel not in entries:
+            entry['hash'] = _file_hash(full_path)
+            pending.append(full_path)
+            entries[rel] = entry
+
+    for full_path, table, vec, error in vectorize_tracks(pending, workers):
+        rel = os.path.relpath(full_path, folder)
+        changed = True
+        entries[rel]['corrupted'] = error is not None
+        if error is not None:
+            print(f"Corrupted {full_path}: {error}")
+            continue
+        conv = batch_maxvolve(vec, CONVOLUTION, np.empty(vec.shape, dtype=np.float32))
+        data[rel] = (table, vec, conv)
+
+    if changed or set(entries.keys()) != set(cached_entries.keys()):
+        _write_cache(bundle_path, manifest_path, entries, data)
+
+    tables, vectors, convolved = [], [], []
+    for rel in selected:
+        if rel not in data:
+            continue
+        table, vec, conv = data[rel]
+        tables.append(table)
+        vectors.append(vec)
+        convolved.append(conv)
+
+    accords = AccordTable.concatenate(tables)
+    if len(vectors) == 0:
+        return accords, empty_corpus(), empty_corpus(), accords.names
+    return accords, np.concatenate(vectors), np.concatenate(convolved), accords.names
@@ -0,0 +1,256 @@
+from typing import Tuple
+
+import numpy as np
+from numba import jit
+
+from composer import IMPORTANCES, SELECTION_CURVE_PARAM
+from vectorization import Vector
+
+__all__ = ['CorpusIndex', 'weighted_distance', 'LEAF_SIZE', 'FANOUT']
+
+# Number of consecutive corpus vectors in leaf block and number of leaves in super block.
+LEAF_SIZE = 4
+FANOUT = 16
+
+
+def weighted_distance(vectors: np.ndarray, state: Vector) -> np.ndarray:
+    """
+    Calculates distance used by `select_bit` (weighted sum of chebyshev distances of each sub-vector)
+    between every vector and a state.
+
+    :param vectors: Array of shape (n, 3, 128).
+    :param state: Single vector.
+    :return: Array of n distances.
+    """
+
+    return np.abs(vectors - state).max(axis=2) @ IMPORTANCES
+
+
+def _block_boxes(vectors: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns minimum and maximum of every coordinate over consecutive blocks of vectors of given size.
+    """
+
+    starts = np.arange(0, vectors.shape[0], size)
+    return np.minimum.reduceat(vectors, starts, axis=0), np.maximum.reduceat(vectors, starts, axis=0)
+
+
+@jit(nopython=True, cache=True)
+def _box_distance(lo: np.ndarray, hi: np.ndarray, state: np.ndarray, importances: np.ndarray) -> float:
+    """
+    Lower bound of weighted distance between state and any vector inside box: per sub-vector, the largest
+    distance of state coordinate from interval of the box.
+    """
+
+    d = 0.0
+    for k in range(3):
+        m = 0.0
+        for j in range(128):
+            x = max(np.float64(lo[k, j]) - state[k, j], state[k, j] - np.float64(hi[k, j]))
+            if x > m:
+                m = x
+        d += importances[k] * m
+    return d
+
+
+@jit(nopython=True, cache=True)
+def _heap_push(keys: np.ndarray, nodes: np.ndarray, size: int, key: float, node: int) -> int:
+    """
+    Pushes node on min heap ordered by key and returns new size of heap.
+    """
+
+    i = size
+    keys[i], nodes[i] = key, node
+    while i > 0 and keys[(i - 1) // 2] > keys[i]:
+        parent = (i - 1) // 2
+        keys[i], keys[parent] = keys[parent], keys[i]
+        nodes[i], nodes[parent] = nodes[parent], nodes[i]
+        i = parent
+    return size + 1
+
+
+@jit(nopython=True, cache=True)
+def _heap_pop(keys: np.ndarray, nodes: np.ndarray, size: int) -> int:
+    """
+    Removes root of min heap (moved to position `size - 1`) and returns new size of heap.
+    """
+
+    size -= 1
+    keys[0], keys[size] = keys[size], keys[0]
+    nodes[0], nodes[size] = nodes[size], nodes[0]
+    i = 0
+    while True:
+        smallest = i
+        for child in (2 * i + 1, 2 * i + 2):
+            if child < size and keys[child] < keys[smallest]:
+                smallest = child
+        if smallest == i:
+            break
+        keys[i], keys[smallest] = keys[smallest], keys[i]
+        nodes[i], nodes[smallest] = nodes[smallest], nodes[i]
+        i = smallest
+    return size
+
+
+@jit(nopython=True, cache=True)
+def _scan(vectors: np.ndarray, super_lo: np.ndarray, super_hi: np.ndarray, leaf_lo: np.ndarray,
+          leaf_hi: np.ndarray, state: np.ndarray, importances: np.ndarray, curve: float, tolerance: float,
+          leaf_size: int, fanout: int, indexes: np.ndarray, weights: np.ndarray, keys: np.ndarray,
+          nodes: np.ndarray):
+    """
+    Best first search over two level hierarchy of boxes. Node with the smallest distance bound is taken from heap:
+    super block is replaced by its leaves, vectors of leaf are scored exactly. Search stops when bound of weight
+    of all nodes left in heap drops to `tolerance` of weight found.
+
+    Nodes `0..s-1` are super blocks, nodes `s..` are leaves. Scored vectors are written into `indexes` and
+    `weights`, nodes left are kept in `keys` (distance bounds) and `nodes`.
+
+    :return: Tuple of number of scored vectors, their sum of weights and number of nodes left.
+    """
+
+    n = vectors.shape[0]
+    supers = super_lo.shape[0]
+    size = 0
+    rest = 0.0
+    for s in range(supers):
+        d = _box_distance(super_lo[s], super_hi[s], state, importances)
+        size = _heap_push(keys, nodes, size, d, s)
+        rest += (min(n, (s + 1) * leaf_size * fanout) - s * leaf_size * fanout) * curve * np.exp(-curve * d)
+
+    count = 0
+    found = 0.0
+    while size > 0 and (found == 0.0 or rest > tolerance * found):
+        size = _heap_pop(keys, nodes, size)
+        d, node = keys[size], nodes[size]
+        if node < supers:
+            start, end = node * leaf_size * fanout, min(n, (node + 1) * leaf_size * fanout)
+            rest -= (end - start) * curve * np.exp(-curve * d)
+            for leaf in range(node * fanout, min(leaf_lo.shape[0], (node + 1) * fanout)):
+                d = _box_distance(leaf_lo[leaf], leaf_hi[leaf], state, importances)
+                size = _heap_push(keys, nodes, size, d, supers + leaf)
+                rest += (min(n, (leaf + 1) * leaf_size) - leaf * leaf_size) * curve * np.exp(-curve * d)
+            continue
+
+        leaf = node - supers
+        start, end = leaf * leaf_size, min(n, (leaf + 1) * leaf_size)
+        rest -= (end - start) * curve * np.exp(-curve * d)
+        for i in range(start, end):
+            d = 0.0
+            for k in range(3):
+                m = 0.0
+                for j in range(128):
+                    x = abs(np.float64(vectors[i, k, j]) - state[k, j])
+                    if x > m:
+                        m = x
+                d += importances[k] * m
+            w = curve * np.exp(-curve * d)
+            indexes[count] = i
+            weights[count] = w
+            found += w
+            count += 1
+    return count, found, size
+
+
+class CorpusIndex:
+    """
+    Index over convolved vectors of corpus, speeding up random selection performed by `select_bit`.
+
+    Corpus is split into leaves of `leaf_size` consecutive vectors, grouped into super blocks of `fanout` leaves.
+    Consecutive accords of a track have similar states, so bounding boxes (minimum and maximum of every
+    coordinate) of blocks are tight. Distance of state from a box bounds distance of all vectors inside it and so
+    their weights. Boxes are searched from the closest one and search stops when bound of weight left in not
+    scanned boxes drops below `tolerance` of weight found so far.
+
+    In exact mode, the not scanned rest is sampled by rejection, so selection follows exactly the same
+    distribution as `select_bit`. In approximate mode, the rest is ignored, which loses at most `tolerance`
+    fraction of probability mass. Lower tolerance means better recall, higher one means fewer scanned vectors.
+    """
+    def __init__(self, known_vec: np.ndarray, tolerance: float = 0.05, exact: bool = True,
+                 leaf_size: int = LEAF_SIZE, fanout: int = FANOUT):
+        """
+        Builds index.
+
+        :param known_vec: Convolved vectors of corpus, array of shape (n, 3, 128) in corpus order.
+        :param tolerance: Fraction of weight left not scanned.
+        :param exact: If true, selection follows exact distribution of `select_bit`.
+        :param leaf_size: Number of consecutive vectors in leaf block.
+        :param fanout: Number of leaves in super block.
+        """
+
+        self.vectors = np.ascontiguousarray(known_vec, dtype=np.float32)
+        self.tolerance = tolerance
+        self.exact = exact
+        self.leaf_size = leaf_size
+        self.fanout = fanout
+        n = self.vectors.shape[0]
+        if n == 0:
+            raise ValueError('cannot index empty corpus')
+        self.leaf_lo, self.leaf_hi = _block_boxes(self.vectors, leaf_size)
+        self.super_lo, self.super_hi = _block_boxes(self.vectors, leaf_size * fanout)
+
+        # Buffers of scan (index is not meant to be shared between threads).
+        self._indexes = np.empty(n, dtype=np.int64)
+        self._weights = np.empty(n)
+        self._keys = np.empty(self.leaf_lo.shape[0] + self.super_lo.shape[0])
+        self._nodes = np.empty(self._keys.shape[0], dtype=np.int64)
+        self.scanned = 0
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def _node_range(self, nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns corpus ranges `[start, end)` covered by nodes.
+        """
+
+        supers = self.super_lo.shape[0]
+        size = np.where(nodes < supers, self.leaf_size * self.fanout, self.leaf_size)
+        start = np.where(nodes < supers, nodes, nodes - supers) * size
+        return start, np.minimum(start + size, len(self))
+
+    def candidates(self, state: Vector) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Scans boxes closest to the state.
+
+        :param state: Convolved state of composed track.
+        :return: Tuple of corpus indexes and weights of scanned vectors, and corpus ranges (starts and ends) and
+            member weight bounds of not scanned boxes.
+        """
+
+        count, _, size = _scan(self.vectors, self.super_lo, self.super_hi, self.leaf_lo, self.leaf_hi,
+                               np.asarray(state, dtype=np.float64), IMPORTANCES, SELECTION_CURVE_PARAM,
+                               self.tolerance, self.leaf_size, self.fanout, self._indexes, self._weights,
+                               self._keys, self._nodes)
+        self.scanned = count
+        start, end = self._node_range(self._nodes[:size])
+        bound = SELECTION_CURVE_PARAM * np.exp(-SELECTION_CURVE_PARAM * self._keys[:size])
+        return self._indexes[:count], self._weights[:count], start, end, bound
+
+    def select(self, state: Vector, rng=np.random) -> Tuple[int, float]:
+        """
+        Selects randomly corpus vector with probability depending on similarity to current state.
+
+        :param state: Convolved state of composed track.
+        :param rng: Source of randomness (`np.random` or `np.random.Generator`).
+        :return: Pair of selected corpus index and its weight.
+        """
+
+        indexes, weights, start, end, bound = self.candidates(state)
+        cumulative = np.cumsum(weights)
+        found = cumulative[-1] if len(cumulative) > 0 else 0.0
+        rest_cumulative = np.cumsum((end - start) * bound)
+        rest = rest_cumulative[-1] if self.exact and len(rest_cumulative) > 0 else 0.0
+
+        while True:
+            rand = rng.uniform(0.0, found + rest)
+            if rand < found or rest == 0.0:
+                selected = min(int(np.searchsorted(cumulative, rand, side='right')), len(cumulative) - 1)
+                return int(indexes[selected]), float(weights[selected])
+
+            # Rejection sampling of not scanned boxes.
+            i = min(int(np.searchsorted(rest_cumulative, rand - found, side='right')), len(start) - 1)
+            position = start[i] + min(int(rng.uniform(0.0, end[i] - start[i])), end[i] - start[i] - 1)
+            dist = weighted_distance(self.vectors[position:position + 1].astype(np.float64), state)[0]
+            weight = SELECTION_CURVE_PARAM * np.exp(-dist * SELECTION_CURVE_PARAM)
+            if rng.uniform(0.0, bound[i]) < weight:
+                return int(position), float(weight)
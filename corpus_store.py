@@ -0,0 +1,230 @@
+import json
+import os
+from typing import Iterator, Sequence, Tuple
+
+import numpy as np
+
+from accord import AccordTable
+from composer import CONVOLUTION
+from convolutions import batch_maxvolve
+from corpus_cache import cache_fingerprint
+from vectorization import Vector, empty_corpus, list_tracks, vectorize_tracks
+
+__all__ = ['STORE_COLUMNS', 'CorpusStore', 'iter_folder', 'ingest_folder']
+
+# Columns of store: type and shape of single row. Every column is kept in its own raw file of rows, growing as
+# tracks are appended. Column `note_offsets` starts with extra zero row (like `AccordTable.note_offsets`), note
+# columns have one row per note, other columns one row per accord.
+STORE_COLUMNS = {
+    'vectors': (np.float32, (3, 128)),
+    'convolved': (np.float32, (3, 128)),
+    'metre': (np.int32, (2,)),
+    'tempo': (np.float64, ()),
+    'length': (np.float64, ()),
+    'wait': (np.float64, ()),
+    'flags': (np.int32, ()),
+    'track': (np.int32, ()),
+    'note_offsets': (np.int64, ()),
+    'note_keys': (np.int16, ()),
+    'note_lengths': (np.int8, ()),
+}
+NOTE_COLUMNS = ('note_keys', 'note_lengths')
+
+# Manifest is rewritten after that many appended tracks (and when ingestion ends).
+COMMIT_TRACKS = 64
+
+
+class CorpusStore:
+    """
+    Corpus stored on disk as memory mapped columns, so it can be larger than memory. Tracks are appended one by
+    one, reading returns memory maps, so selection (`composer.select_bit`) pages in only what it scans and
+    resident memory stays bounded.
+
+    Sizes of columns are recorded in json manifest, which is written after columns. Data appended after last
+    manifest write (e.g. by interrupted ingestion) is ignored and overwritten by the next append.
+    """
+    def __init__(self, path: str):
+        """
+        Opens store in folder, creating empty one if it does not exist.
+
+        :param path: Folder of store.
+        """
+
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+            if self.manifest['fingerprint'] != cache_fingerprint():
+                raise ValueError(f'store {path} was built with different vectorization, remove it to rebuild')
+        else:
+            self.manifest = {'fingerprint': cache_fingerprint(), 'accords': 0, 'notes': 0, 'tracks': [],
+                             'files': {}}
+        self.dirty = False
+        self._truncate()
+
+    def _column_path(self, column: str) -> str:
+        return os.path.join(self.path, column + '.bin')
+
+    def _rows(self, column: str) -> int:
+        """
+        Returns number of committed rows of column.
+        """
+
+        if column in NOTE_COLUMNS:
+            return self.manifest['notes']
+        if column == 'note_offsets':
+            return self.manifest['accords'] + 1
+        return self.manifest['accords']
+
+    def _truncate(self):
+        """
+        Cuts columns to sizes recorded in manifest.
+        """
+
+        for column, (dtype, shape) in STORE_COLUMNS.items():
+            size = self._rows(column) * int(np.prod(shape)) * np.dtype(dtype).itemsize
+            path = self._column_path(column)
+            if column == 'note_offsets' and size == np.dtype(dtype).itemsize and not os.path.exists(path):
+                np.zeros(1, dtype=dtype).tofile(path)
+            elif not os.path.exists(path) or os.path.getsize(path) != size:
+                with open(path, 'ab') as f:
+                    f.truncate(size)
+
+    def column(self, column: str) -> np.ndarray:
+        """
+        Returns committed rows of column as read only memory map.
+        """
+
+        dtype, shape = STORE_COLUMNS[column]
+        rows = self._rows(column)
+        if rows == 0:
+            return np.zeros((0, *shape), dtype=dtype)
+        return np.memmap(self._column_path(column), dtype=dtype, mode='r', shape=(rows, *shape))
+
+    def __len__(self):
+        return self.manifest['accords']
+
+    def __contains__(self, key: str):
+        return key in self.manifest['files']
+
+    def append(self, key: str, table: AccordTable, vectors: Vector, convolved: Vector):
+        """
+        Appends single track. Track is committed when manifest is written (see `commit`).
+
+        :param key: Unique key of track (e.g. path relative to corpus folder).
+        :param table: Accords of track (with single name in `track_names`).
+        :param vectors: Vectors of accords.
+        :param convolved: Convolved vectors of accords.
+        """
+
+        start, notes = self.manifest['accords'], self.manifest['notes']
+        first = table.note_offsets[0]
+        track = len(self.manifest['tracks'])
+        rows = {
+            'vectors': vectors, 'convolved': convolved, 'metre': table.metre, 'tempo': table.tempo,
+            'length': table.length, 'wait': table.wait, 'flags': table.flags,
+            'track': np.full(len(table), track), 'note_offsets': table.note_offsets[1:] - first + notes,
+            'note_keys': table.note_keys[first:table.note_offsets[-1]],
+            'note_lengths': table.note_lengths[first:table.note_offsets[-1]],
+        }
+        for column, (dtype, _) in STORE_COLUMNS.items():
+            with open(self._column_path(column), 'ab') as f:
+                np.ascontiguousarray(rows[column], dtype=dtype).tofile(f)
+
+        self.manifest['accords'] = start + len(table)
+        self.manifest['notes'] = notes + int(table.note_offsets[-1] - first)
+        self.manifest['tracks'].append(table.track_names[0])
+        self.manifest['files'][key] = [start, start + len(table)]
+        self.dirty = True
+
+    def commit(self):
+        """
+        Writes manifest, making appended tracks visible to readers.
+        """
+
+        if not self.dirty:
+            return
+        manifest_path = os.path.join(self.path, 'manifest.json')
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        self.dirty = False
+
+    @property
+    def accords(self) -> AccordTable:
+        """
+        Table of all accords backed by memory maps.
+        """
+
+        columns = {c: self.column(c) for c in STORE_COLUMNS if c not in ('vectors', 'convolved')}
+        return AccordTable.from_arrays(columns, self.manifest['tracks'])
+
+    @property
+    def vectors(self) -> Vector:
+        return self.column('vectors')
+
+    @property
+    def convolved(self) -> Vector:
+        return self.column('convolved')
+
+    def load(self) -> Tuple[AccordTable, Vector, Vector, Sequence[str]]:
+        """
+        Returns accords, vectors, convolved vectors and names of tracks of every accord (like
+        `corpus_cache.load_folder_cached`), all backed by memory maps.
+        """
+
+        accords = self.accords
+        return accords, self.vectors, self.convolved, accords.names
+
+
+def iter_folder(folder: str, fraction: float = 1.0, workers: int | None = 1, skip: Sequence[str] = ()) \
+        -> Iterator[Tuple[str, AccordTable | None, Vector | None, Vector | None, str | None]]:
+    """
+    Streams vectorized tracks of folder one file at a time, so memory used does not depend on size of corpus.
+
+    :param folder: Folder containing tracks to be vectorized.
+    :param fraction: Fraction of tracks to vectorize.
+    :param workers: Number of worker processes (all cores if None).
+    :param skip: Paths (relative to folder) of tracks to be skipped.
+    :return: Iterator of tuples of path, accords, vectors, convolved vectors and error message (None if
+        successful, otherwise the rest is None).
+    """
+
+    skip = set(skip)
+    paths = [p for p in list_tracks(folder, fraction) if os.path.relpath(p, folder) not in skip]
+    for path, table, vectors, error in vectorize_tracks(paths, workers):
+        if error is not None:
+            yield path, None, None, None, error
+            continue
+        if len(vectors) == 0:
+            vectors = empty_corpus()
+        convolved = batch_maxvolve(vectors, CONVOLUTION, np.empty(vectors.shape, dtype=np.float32))
+        yield path, table, vectors, convolved, None
+
+
+def ingest_folder(folder: str, store_path: str, fraction: float = 1.0, workers: int | None = 1) -> CorpusStore:
+    """
+    Appends tracks of folder into store on disk. Tracks already present in store are skipped, so interrupted
+    ingestion can be resumed (modified tracks are not updated).
+
+    :param folder: Folder containing tracks to be vectorized.
+    :param store_path: Folder of store.
+    :param fraction: Fraction of tracks to vectorize.
+    :param workers: Number of worker processes (all cores if None).
+    :return: Store.
+    """
+
+    store = CorpusStore(store_path)
+    appended = 0
+    for path, table, vectors, convolved, error in iter_folder(folder, fraction, workers, store.manifest['files']):
+        if error is not None:
+            print(f"Corrupted {path}: {error}")
+            continue
+        store.append(os.path.relpath(path, folder), table, vectors, convolved)
+        appended += 1
+        if appended % COMMIT_TRACKS == 0:
+            store.commit()
+    store.commit()
+    return store
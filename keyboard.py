@@ -1,10 +1,17 @@
+import os
+import wave
 from typing import Tuple, Dict, List, Iterable
 
-import pygame as pg
+import numpy as np
 
-pg.mixer.init()
+__all__ = ['piano_notes', 'get_sound_keys', 'is_white', 'position_of_note', 'into_blacks_and_whites', 'black_pos',
+           'SAMPLE_FOLDER', 'SAMPLE_BANK', 'sample_path', 'read_sample', 'build_sample_bank', 'open_sample_bank',
+           'SoundKeys', 'LOWEST_KEY', 'HIGHEST_KEY']
 
-__all__ = ['piano_notes', 'get_sound_keys', 'is_white', 'position_of_note', 'into_blacks_and_whites', 'black_pos']
+SAMPLE_FOLDER = 'notes'
+# Pre-decoded samples of all keys, stored as single array (`.npy`) with offsets of each key (`.offsets.npy`).
+SAMPLE_BANK = os.path.join('cache', 'samples')
+SAMPLE_RATE = 44100
 
 piano_notes = ['A0', 'Bb0', 'B0', 'C1', 'Db1', 'D1', 'Eb1', 'E1', 'F1', 'Gb1', 'G1', 'Ab1',
                'A1', 'Bb1', 'B1', 'C2', 'Db2', 'D2', 'Eb2', 'E2', 'F2', 'Gb2', 'G2', 'Ab2',
@@ -28,8 +35,102 @@ for n in piano_notes:
         white_and_blacks.append(w)
         w += 1
 
-keys_color = {i + 21: white_and_blacks[i] for i in range(len(piano_notes))}
-keys = {i + 21: pg.mixer.Sound(f'notes/{piano_notes[i]}.wav') for i in range(len(piano_notes))}
+# Ids (midi numbers) of the lowest and the highest key of piano.
+LOWEST_KEY = 21
+HIGHEST_KEY = LOWEST_KEY + len(piano_notes) - 1
+
+keys_color = {i + LOWEST_KEY: white_and_blacks[i] for i in range(len(piano_notes))}
+
+
+def sample_path(key: int, folder: str = SAMPLE_FOLDER) -> str:
+    """
+    Returns path of wav file with sample of key. Raises `ValueError` if key is outside of piano range.
+    """
+
+    if not LOWEST_KEY <= key <= HIGHEST_KEY:
+        raise ValueError(f'key {key} is outside of piano range {LOWEST_KEY}..{HIGHEST_KEY}')
+    return os.path.join(folder, f'{piano_notes[key - LOWEST_KEY]}.wav')
+
+
+def read_sample(key: int, folder: str = SAMPLE_FOLDER) -> np.ndarray:
+    """
+    Decodes sample of key into 16 bit stereo array of shape (n, 2).
+    """
+
+    with wave.open(sample_path(key, folder)) as f:
+        if f.getsampwidth() != 2 or f.getframerate() != SAMPLE_RATE:
+            raise ValueError(f'sample of key {key} is not 16 bit {SAMPLE_RATE} Hz')
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2').reshape(-1, f.getnchannels())
+    if data.shape[1] == 1:
+        data = np.repeat(data, 2, axis=1)
+    return data
+
+
+def build_sample_bank(folder: str = SAMPLE_FOLDER, bank: str = SAMPLE_BANK):
+    """
+    Decodes samples of all keys into sample bank, which can be later memory mapped by `open_sample_bank`.
+
+    :param folder: Folder containing wav samples.
+    :param bank: Path of bank (without extension).
+    """
+
+    samples = [read_sample(key, folder) for key in sorted(keys_color)]
+    offsets = np.zeros(len(samples) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([s.shape[0] for s in samples])
+    os.makedirs(os.path.dirname(bank) or '.', exist_ok=True)
+    np.save(bank + '.npy', np.concatenate(samples))
+    np.save(bank + '.offsets.npy', offsets)
+
+
+def open_sample_bank(bank: str = SAMPLE_BANK) -> Dict[int, np.ndarray] | None:
+    """
+    Memory maps sample bank created by `build_sample_bank`.
+
+    :param bank: Path of bank (without extension).
+    :return: Dictionary of 16 bit stereo samples by key id, or None if there is no bank.
+    """
+
+    if not os.path.exists(bank + '.npy') or not os.path.exists(bank + '.offsets.npy'):
+        return None
+    data = np.load(bank + '.npy', mmap_mode='r')
+    offsets = np.load(bank + '.offsets.npy')
+    return {key: data[offsets[i]:offsets[i + 1]] for i, key in enumerate(sorted(keys_color))}
+
+
+class SoundKeys(dict):
+    """
+    Dictionary of key ids with corresponding piano sounds, loading each sound on first use.
+    Pygame mixer is initialized when first sound is needed.
+    """
+    def __init__(self, folder: str = SAMPLE_FOLDER, bank: str = SAMPLE_BANK):
+        """
+        :param folder: Folder containing wav samples.
+        :param bank: Path of sample bank used instead of wav files if it exists.
+        """
+
+        super().__init__()
+        self.folder = folder
+        self.bank = bank
+        self.samples = None
+
+    def __missing__(self, key: int):
+        import pygame as pg
+
+        if key not in keys_color:
+            raise KeyError(key)
+        if not pg.mixer.get_init():
+            pg.mixer.init()
+        if self.samples is None:
+            self.samples = open_sample_bank(self.bank) or {}
+        if key in self.samples and pg.mixer.get_init() == (SAMPLE_RATE, -16, 2):
+            sound = pg.mixer.Sound(buffer=np.ascontiguousarray(self.samples[key]).tobytes())
+        else:
+            sound = pg.mixer.Sound(sample_path(key, self.folder))
+        self[key] = sound
+        return sound
+
+
+keys = SoundKeys()
 
 
 def into_blacks_and_whites(list_of_keys: Iterable[int]) -> Tuple[List[int], List[int]]:
@@ -41,9 +142,9 @@ def into_blacks_and_whites(list_of_keys: Iterable[int]) -> Tuple[List[int], List
     return whites, blacks
 
 
-def get_sound_keys() -> Dict[int, pg.mixer.Sound]:
+def get_sound_keys() -> SoundKeys:
     """
-    Returns dictionary of key ids with corresponding piano sounds
+    Returns dictionary of key ids with corresponding piano sounds (loaded lazily)
     """
     return keys
 
@@ -72,3 +173,7 @@ def position_of_note(note: int) -> Tuple[int, int]:
     else:
         black_p = black_pos[-key_pos - 1]
         return 26 + black_p * 35, 18
+
+
+if __name__ == '__main__':
+    build_sample_bank()
@@ -1,10 +1,10 @@
 import pygame as pg
 
-from composer import compose_music
+from composer import compose_stream
+from corpus_cache import load_folder_cached
 from keyboard import get_sound_keys
-from notes import play_notes, BITS_PER_SECOND
-from vectorization import load_folder
-from visualisation import draw_falling_notes, draw_piano
+from notes import play_notes, BITS_PER_SECOND, Timeline
+from visualisation import Renderer
 
 pg.init()
 pg.mixer.init()
@@ -17,23 +17,28 @@ timer = pg.time.Clock()
 if __name__ == '__main__':
     folder = "midi"
 
-    accords, vec, names = load_folder(f'midi/{folder}', fraction=0.25)
+    accords, vec, conv_vec, names = load_folder_cached(f'midi/{folder}', fraction=0.25)
 
-    comp_notes = compose_music(vec, accords, names, length=3 * 60, base_name=folder)
+    comp_notes = compose_stream(vec, accords, names, length=3 * 60, base_name=folder, convolved_vec=conv_vec)
 
-    # Display and play composed track
-    notes_display = sorted(comp_notes, key=lambda x: x.start)
-    notes_sound = notes_display.copy()
+    # Display and play composed track, composing it just ahead of displayed part
+    timeline = Timeline()
+    notes_sound = timeline.view()
+    renderer = Renderer(screen, timeline.view())
+    next_note = next(comp_notes, None)
     run = True
     frame = 400
     active = set()
     while run:
         timer.tick(BITS_PER_SECOND)
-        screen.fill('gray')
+        while next_note is not None and next_note.start * BITS_PER_SECOND < frame + BITS_PER_SECOND:
+            timeline.append(next_note)
+            next_note = next(comp_notes, None)
         active = play_notes(notes_sound, get_sound_keys(), active, frame - 500)
-        draw_falling_notes(screen, notes_display, frame)
-        draw_piano(active, screen)
-        pg.display.flip()
+        pg.display.update(renderer.draw(frame, active))
+        if frame % BITS_PER_SECOND == 0:
+            mean, worst = renderer.frame_time()
+            pg.display.set_caption(f'frame {1000 * mean:.1f} ms (max {1000 * worst:.1f} ms)')
         frame += 1
         for event in pg.event.get():
             if event.type == pg.QUIT:
@@ -0,0 +1,127 @@
+import csv
+import json
+from collections import Counter
+from typing import Dict, List
+
+import numpy as np
+
+__all__ = ['Metrics', 'MetricsRecorder', 'PHASES', 'FIELDS']
+
+# Phases of single composition step, timed separately.
+PHASES = ('convolution', 'distance', 'sampling')
+
+# Fields recorded for every step: times of phases (in seconds), sum and maximum of weights of known vectors,
+# confidence (weight) of selected accord, whether generator panicked, index of selected accord and its track.
+FIELDS = PHASES + ('mass', 'max', 'confidence', 'panic', 'selected', 'track')
+
+
+class Metrics:
+    """
+    Sink of metrics of composition steps, ignoring all of them. Generators skip measuring if metrics
+    are not `enabled`, so using it costs nothing.
+    """
+    enabled = False
+
+    def step(self, values: Dict[str, float | int | str]):
+        """
+        Records single composition step.
+
+        :param values: Values of `FIELDS` (some may be missing).
+        """
+
+        pass
+
+    def summary(self) -> Dict:
+        """
+        Returns aggregated metrics.
+        """
+
+        return {}
+
+
+class MetricsRecorder(Metrics):
+    """
+    Metrics recording every composition step, which can be summarized or exported to json or csv.
+    """
+    enabled = True
+
+    def __init__(self, top: int = 10):
+        """
+        :param top: Number of most frequent source tracks included in summary.
+        """
+
+        self.steps: List[Dict] = []
+        self.top = top
+
+    def step(self, values: Dict[str, float | int | str]):
+        self.steps.append(values)
+
+    def column(self, field: str) -> np.ndarray:
+        """
+        Returns values of numeric field in all steps in which it was recorded.
+        """
+
+        return np.array([s[field] for s in self.steps if field in s], dtype=np.float64)
+
+    def summary(self) -> Dict:
+        """
+        Returns number of steps, mean and 95th percentile of latency of each phase and whole step,
+        mean candidate mass and confidence, panic rate and distribution of source tracks.
+        """
+
+        if not self.steps:
+            return {'steps': 0}
+        latency = {}
+        total = np.zeros(len(self.steps))
+        for phase in PHASES:
+            times = np.array([s.get(phase, 0.0) for s in self.steps])
+            total += times
+            latency[phase] = {'mean': float(np.mean(times)), 'p95': float(np.percentile(times, 95))}
+        latency['step'] = {'mean': float(np.mean(total)), 'p95': float(np.percentile(total, 95))}
+
+        tracks = Counter(s['track'] for s in self.steps if 'track' in s)
+        mass, confidence = self.column('mass'), self.column('confidence')
+        return {
+            'steps': len(self.steps),
+            'latency': latency,
+            'mass': float(np.mean(mass)) if len(mass) else None,
+            'confidence': float(np.mean(confidence)) if len(confidence) else None,
+            'panic_rate': float(np.mean(self.column('panic'))),
+            'tracks': len(tracks),
+            'top_tracks': {name: count / len(self.steps) for name, count in tracks.most_common(self.top)},
+        }
+
+    def format_summary(self) -> str:
+        """
+        Returns summary as human readable text.
+        """
+
+        s = self.summary()
+        if s['steps'] == 0:
+            return 'no steps recorded'
+        lines = [f"steps: {s['steps']}, panic rate: {s['panic_rate']:.3f}, mean mass: {s['mass']}, "
+                 f"mean confidence: {s['confidence']}"]
+        for phase, t in s['latency'].items():
+            lines.append(f"  {phase:>12}: mean {1000 * t['mean']:.3f} ms, p95 {1000 * t['p95']:.3f} ms")
+        lines.append(f"  source tracks: {s['tracks']}")
+        for name, share in s['top_tracks'].items():
+            lines.append(f"    {share:6.1%} {name}")
+        return '\n'.join(lines)
+
+    def to_json(self, path: str):
+        """
+        Saves summary and all recorded steps as json.
+        """
+
+        with open(path, 'w') as f:
+            json.dump({'summary': self.summary(), 'steps': self.steps}, f, indent=1, default=float)
+
+    def to_csv(self, path: str):
+        """
+        Saves all recorded steps as csv, one row per step.
+        """
+
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.steps)
@@ -0,0 +1,313 @@
+from typing import List
+
+import numpy as np
+from mido.messages import SPEC_BY_STATUS
+from mido.midifiles.meta import _META_SPECS
+from numba import jit
+
+from notes import Note, NOTE_DTYPE, NoteTable
+
+__all__ = ['read_notes', 'read_note_table', 'notes_from_array', 'fast_midi_to_notes', 'accord_starts']
+
+DEFAULT_TEMPO = 500000
+
+# Kinds of parsed events.
+OTHER = 0
+NOTE_ON = 1
+NOTE_OFF = 2
+SET_TEMPO = 3
+TIME_SIGNATURE = 4
+END_OF_TRACK = 5
+
+# Error codes of track parser.
+ERRORS = {1: EOFError('unexpected end of file'), 2: OSError('running status without last_status'),
+          3: OSError('undefined status byte'), 4: OSError('data byte must be in range 0..127'),
+          5: OSError('invalid meta message')}
+
+# Lengths of channel and system messages by status byte (0 for undefined ones).
+MESSAGE_LENGTHS = np.zeros(256, dtype=np.int64)
+for status, spec in SPEC_BY_STATUS.items():
+    if status not in (0xf0, 0xff):
+        MESSAGE_LENGTHS[status] = spec['length']
+
+# Mido drops delta time of meta messages of unknown type, which is mimicked here.
+KNOWN_META = np.zeros(256, dtype=np.bool_)
+for meta_type in _META_SPECS:
+    if isinstance(meta_type, int):
+        KNOWN_META[meta_type] = True
+
+
+@jit(nopython=True, cache=True)
+def _read_variable_int(data: np.ndarray, pos: int, end: int):
+    """
+    Reads variable length quantity. Returns value and position after it (-1 if data ended).
+    """
+
+    value = 0
+    while pos < end:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7f)
+        if byte < 0x80:
+            return value, pos
+    return 0, -1
+
+
+@jit(nopython=True, cache=True)
+def _parse_track(data: np.ndarray, start: int, end: int, lengths: np.ndarray, known_meta: np.ndarray,
+                 ticks: np.ndarray, kinds: np.ndarray, values: np.ndarray, extras: np.ndarray):
+    """
+    Parses events of single track chunk. Writes absolute tick, kind and parameters of every event.
+    Returns number of events and error code (0 on success).
+    """
+
+    pos = start
+    count = 0
+    now = 0
+    last_status = -1
+    while pos < end:
+        delta, pos = _read_variable_int(data, pos, end)
+        if pos < 0 or pos >= end:
+            return count, 1
+        status = np.int64(data[pos])
+        pos += 1
+        peek = -1
+        if status < 0x80:
+            if last_status < 0:
+                return count, 2
+            peek = status
+            status = last_status
+        elif status != 0xff:
+            last_status = status
+
+        kind = OTHER
+        value = 0
+        extra = 0
+        if status == 0xff:
+            if pos >= end:
+                return count, 1
+            meta_type = data[pos]
+            size, pos = _read_variable_int(data, pos + 1, end)
+            if pos < 0 or pos + size > end:
+                return count, 1
+            if not known_meta[meta_type]:
+                delta = 0
+            elif meta_type == 0x51:
+                if size < 3:
+                    return count, 5
+                kind = SET_TEMPO
+                value = (np.int64(data[pos]) << 16) | (np.int64(data[pos + 1]) << 8) | np.int64(data[pos + 2])
+            elif meta_type == 0x58:
+                if size < 4:
+                    return count, 5
+                kind = TIME_SIGNATURE
+                value = data[pos]
+                extra = 2 ** np.int64(data[pos + 1])
+            elif meta_type == 0x2f:
+                kind = END_OF_TRACK
+            pos += size
+        elif status == 0xf0 or status == 0xf7:
+            size, pos = _read_variable_int(data, pos, end)
+            if pos < 0 or pos + size > end:
+                return count, 1
+            pos += size
+        else:
+            size = lengths[status] - 1
+            if size < 0:
+                return count, 3
+            first = peek
+            if peek < 0 and size > 0:
+                if pos >= end:
+                    return count, 1
+                first = data[pos]
+                pos += 1
+            second = 0
+            if size > 1:
+                if pos >= end:
+                    return count, 1
+                second = data[pos]
+                pos += 1
+            if first > 127 or second > 127:
+                return count, 4
+            if status >> 4 == 0x9 and second > 0:
+                kind = NOTE_ON
+            elif status >> 4 == 0x9 or status >> 4 == 0x8:
+                kind = NOTE_OFF
+            value = first
+            extra = second
+
+        now += delta
+        ticks[count] = now
+        kinds[count] = kind
+        values[count] = value
+        extras[count] = extra
+        count += 1
+    return count, 0
+
+
+@jit(nopython=True, cache=True)
+def _pair_notes(timing: np.ndarray, kinds: np.ndarray, values: np.ndarray, extras: np.ndarray,
+                out_note: np.ndarray, out_start: np.ndarray, out_length: np.ndarray, out_tempo: np.ndarray,
+                out_metre: np.ndarray, out_velocity: np.ndarray):
+    """
+    Pairs note on and off events into notes, following exactly `notes.midi_to_notes`
+    (including restoring tempo and metre of released note). Returns number of notes.
+    """
+
+    tempo = 0.5
+    numerator = 4
+    denominator = 4
+    pressed = np.zeros(128, dtype=np.bool_)
+    p_start = np.zeros(128)
+    p_velocity = np.zeros(128, dtype=np.int64)
+    p_tempo = np.zeros(128)
+    p_numerator = np.zeros(128, dtype=np.int64)
+    p_denominator = np.zeros(128, dtype=np.int64)
+    count = 0
+    for i in range(kinds.shape[0]):
+        kind = kinds[i]
+        if kind == TIME_SIGNATURE:
+            numerator = values[i]
+            denominator = extras[i]
+        elif kind == SET_TEMPO:
+            tempo = values[i] / 1000000
+        elif kind == NOTE_ON:
+            n = values[i]
+            pressed[n] = True
+            p_start[n] = timing[i]
+            p_velocity[n] = extras[i]
+            p_tempo[n] = tempo
+            p_numerator[n] = numerator
+            p_denominator[n] = denominator
+        elif kind == NOTE_OFF and pressed[values[i]]:
+            n = values[i]
+            pressed[n] = False
+            tempo = p_tempo[n]
+            numerator = p_numerator[n]
+            denominator = p_denominator[n]
+            out_note[count] = n
+            out_start[count] = p_start[n]
+            out_length[count] = timing[i] - p_start[n]
+            out_tempo[count] = tempo
+            out_metre[count, 0] = numerator
+            out_metre[count, 1] = denominator
+            out_velocity[count] = p_velocity[n]
+            count += 1
+    return count
+
+
+def read_notes(path: str) -> np.ndarray:
+    """
+    Reads notes of midi file into structured array of `NOTE_DTYPE`, with the same content as
+    `notes.midi_to_notes` of the file read by mido.
+
+    :param path: Path to midi file.
+    :return: Structured array of notes.
+    """
+
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    if data.shape[0] < 14 or bytes(data[:4]) != b'MThd':
+        raise OSError('MThd not found. Probably not a MIDI file')
+    header_size = int.from_bytes(bytes(data[4:8]), 'big')
+    file_type, num_tracks, ticks_per_beat = (int.from_bytes(bytes(data[i:i + 2]), 'big', signed=True)
+                                             for i in (8, 10, 12))
+    if file_type == 2:
+        raise TypeError("can't merge tracks in type 2 (asynchronous) file")
+
+    all_ticks, all_kinds, all_values, all_extras = [], [], [], []
+    pos = 8 + header_size
+    for _ in range(num_tracks):
+        if pos + 8 > data.shape[0]:
+            raise EOFError
+        if bytes(data[pos:pos + 4]) != b'MTrk':
+            raise OSError('no MTrk header at start of track')
+        end = pos + 8 + int.from_bytes(bytes(data[pos + 4:pos + 8]), 'big')
+        capacity = (end - pos) // 2 + 1
+        ticks = np.empty(capacity, dtype=np.int64)
+        kinds = np.empty(capacity, dtype=np.int8)
+        values = np.empty(capacity, dtype=np.int64)
+        extras = np.empty(capacity, dtype=np.int64)
+        count, error = _parse_track(data.view(np.ndarray), pos + 8, min(end, data.shape[0]), MESSAGE_LENGTHS, KNOWN_META,
+                                    ticks, kinds, values, extras)
+        if error == 0 and end > data.shape[0]:
+            error = 1
+        if error != 0:
+            raise ERRORS[error]
+        all_ticks.append(ticks[:count])
+        all_kinds.append(kinds[:count])
+        all_values.append(values[:count])
+        all_extras.append(extras[:count])
+        pos = end
+
+    # Merge tracks like mido: stable sort by absolute time, end of track messages are removed
+    # and their delta time is moved to the next message.
+    ticks = np.concatenate(all_ticks) if all_ticks else np.zeros(0, dtype=np.int64)
+    order = np.argsort(ticks, kind='stable')
+    kinds = np.concatenate(all_kinds)[order] if all_kinds else np.zeros(0, dtype=np.int8)
+    values = np.concatenate(all_values)[order] if all_values else np.zeros(0, dtype=np.int64)
+    extras = np.concatenate(all_extras)[order] if all_extras else np.zeros(0, dtype=np.int64)
+    ticks = ticks[order]
+    kept = kinds != END_OF_TRACK
+    ticks, kinds, values, extras = ticks[kept], kinds[kept], values[kept], extras[kept]
+    delta = np.diff(ticks, prepend=0)
+
+    # Tempo in effect for each message is the one set by the last preceding set_tempo message.
+    is_tempo = kinds == SET_TEMPO
+    tempo_index = np.cumsum(is_tempo) - is_tempo
+    tempo_map = np.concatenate([[DEFAULT_TEMPO], values[is_tempo]])
+    tempo = tempo_map[tempo_index]
+    seconds = np.where(delta > 0, delta * (tempo * 1e-6 / ticks_per_beat), 0.0)
+    timing = np.cumsum(seconds)
+
+    size = np.count_nonzero(kinds == NOTE_OFF)
+    note, velocity = np.empty(size, dtype=np.int64), np.empty(size, dtype=np.int64)
+    start, length, tempo = np.empty(size), np.empty(size), np.empty(size)
+    metre = np.empty((size, 2), dtype=np.int64)
+    count = _pair_notes(timing, kinds, values, extras, note, start, length, tempo, metre, velocity)
+
+    out = np.empty(count, dtype=NOTE_DTYPE)
+    out['note'], out['start'], out['length'] = note[:count], start[:count], length[:count]
+    out['tempo'], out['metre'], out['velocity'] = tempo[:count], metre[:count], velocity[:count]
+    return out
+
+
+def read_note_table(path: str) -> NoteTable:
+    """
+    Reads notes of midi file into `NoteTable`.
+    """
+
+    return NoteTable(read_notes(path))
+
+
+def notes_from_array(notes: np.ndarray) -> List[Note]:
+    """
+    Converts structured array of notes into list of `Note`\\s.
+    """
+
+    return NoteTable(notes).to_notes()
+
+
+def fast_midi_to_notes(path: str) -> List[Note]:
+    """
+    Fast equivalent of `notes.midi_to_notes(notes.load_midi(path))`.
+    """
+
+    return notes_from_array(read_notes(path))
+
+
+@jit(nopython=True, cache=True)
+def accord_starts(start: np.ndarray, tempo: np.ndarray) -> np.ndarray:
+    """
+    Finds indexes of first notes of accords in notes sorted by start. Note joins current accord if it
+    starts less than 0.1 beat (in tempo of first note of accord) after the first note.
+    """
+
+    res = np.empty(start.shape[0], dtype=np.int64)
+    count = 0
+    first = 0
+    for i in range(start.shape[0]):
+        if count == 0 or (start[i] - start[first]) / tempo[first] >= 0.1:
+            first = i
+            res[count] = i
+            count += 1
+    return res[:count]
@@ -0,0 +1,93 @@
+import struct
+from typing import BinaryIO
+
+from mido import Message, MetaMessage, second2tick
+from mido.midifiles.meta import encode_variable_int
+
+__all__ = ['MidiStreamWriter']
+
+
+class MidiStreamWriter:
+    """
+    Writer of single track midi file, encoding messages as soon as they are sent. Produces the same bytes
+    as `mido.MidiFile.save` of equivalent track. Output file has to be seekable, as length of track chunk
+    is written when the writer is closed.
+    """
+    def __init__(self, file: str | BinaryIO, ticks_per_beat: int = 480):
+        """
+        Starts midi file.
+
+        :param file: Path or binary file object.
+        :param ticks_per_beat: Resolution of midi file.
+        """
+
+        self.owned = isinstance(file, str)
+        self.file = open(file, 'wb') if self.owned else file
+        self.ticks_per_beat = ticks_per_beat
+        self.prev_time = 0.0
+        self.accumulated = 0
+        self.running_status = None
+        self.length = 0
+
+        self.file.write(b'MThd' + struct.pack('>L', 6) + struct.pack('>hhh', 1, 1, ticks_per_beat))
+        self.chunk_start = self.file.tell()
+        self.file.write(b'MTrk' + struct.pack('>L', 0))
+
+    def send(self, msg: Message | MetaMessage):
+        """
+        Writes message with delta time (in ticks) stored in `msg.time`.
+        """
+
+        # Like mido, end of track is moved to the end of file.
+        if msg.type == 'end_of_track':
+            self.accumulated += msg.time
+            return
+
+        data = bytearray(encode_variable_int(msg.time + self.accumulated))
+        self.accumulated = 0
+        msg_bytes = msg.bytes()
+        if msg.is_meta:
+            data.extend(msg_bytes)
+            self.running_status = None
+        elif msg_bytes[0] == self.running_status:
+            data.extend(msg_bytes[1:])
+        else:
+            data.extend(msg_bytes)
+            self.running_status = msg_bytes[0]
+        self.file.write(data)
+        self.length += len(data)
+
+    def send_at(self, time: float, tempo: float, msg: Message | MetaMessage):
+        """
+        Writes message played at given time.
+
+        :param time: Time of message in seconds.
+        :param tempo: Tempo (seconds per beat) used to convert time from previous message into ticks.
+        :param msg: Message to be written.
+        """
+
+        msg.time = int(second2tick(time - self.prev_time, self.ticks_per_beat, tempo * 1000000))
+        self.prev_time = time
+        self.send(msg)
+
+    def close(self):
+        """
+        Writes end of track and finishes file.
+        """
+
+        data = encode_variable_int(self.accumulated) + MetaMessage('end_of_track').bytes()
+        self.file.write(bytes(data))
+        self.length += len(data)
+        end = self.file.tell()
+        self.file.seek(self.chunk_start + 4)
+        self.file.write(struct.pack('>L', self.length))
+        self.file.seek(end)
+        self.file.flush()
+        if self.owned:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,181 @@
+"""
+Encoding of accords into midi files at once, producing the same bytes as streaming them through
+`midi_stream.MidiStreamWriter` (see `accord.save_accords`).
+"""
+import struct
+from typing import Iterable, Tuple
+
+import numpy as np
+from mido import MetaMessage
+from numba import jit
+
+from accord import Accord, AccordTable
+
+__all__ = ['accords_to_midi']
+
+# Kinds of events encoded by `_encode_events`.
+_NOTE_ON, _NOTE_OFF, _SET_TEMPO, _TIME_SIGNATURE, _END_OF_TRACK = range(5)
+
+
+@jit(nopython=True, cache=True)
+def _write_variable_int(out: np.ndarray, pos: int, value: int) -> int:
+    """
+    Writes midi variable length quantity at position of buffer and returns position after it.
+    """
+
+    size = 1
+    while value >> (7 * size) > 0:
+        size += 1
+    for i in range(size):
+        byte = (value >> (7 * (size - 1 - i))) & 0x7f
+        out[pos + i] = byte | 0x80 if i < size - 1 else byte
+    return pos + size
+
+
+@jit(nopython=True, cache=True)
+def _encode_events(ticks: np.ndarray, kinds: np.ndarray, values: np.ndarray, extra: np.ndarray,
+                   out: np.ndarray) -> int:
+    """
+    Encodes time ordered events into body of track chunk the same way as `MidiStreamWriter`: with running
+    status and end of track moved to the end of chunk.
+
+    :param ticks: Delta time of every event in ticks.
+    :param kinds: Kind of every event (`_NOTE_ON`, ...).
+    :param values: Key of note, tempo in microseconds per beat or numerator of metre.
+    :param extra: Binary logarithm of denominator of metre.
+    :param out: Output buffer (large enough).
+    :return: Number of bytes written.
+    """
+
+    pos = 0
+    accumulated = 0
+    running = -1
+    for i in range(ticks.shape[0]):
+        kind = kinds[i]
+        if kind == _END_OF_TRACK:
+            accumulated += ticks[i]
+            continue
+        pos = _write_variable_int(out, pos, ticks[i] + accumulated)
+        accumulated = 0
+        if kind == _NOTE_ON or kind == _NOTE_OFF:
+            status = 0x90 if kind == _NOTE_ON else 0x80
+            if status != running:
+                out[pos] = status
+                pos += 1
+                running = status
+            out[pos] = values[i]
+            out[pos + 1] = 64 if kind == _NOTE_ON else 0
+            pos += 2
+        elif kind == _SET_TEMPO:
+            out[pos], out[pos + 1], out[pos + 2] = 0xff, 0x51, 3
+            out[pos + 3] = (values[i] >> 16) & 0xff
+            out[pos + 4] = (values[i] >> 8) & 0xff
+            out[pos + 5] = values[i] & 0xff
+            pos += 6
+            running = -1
+        else:
+            out[pos], out[pos + 1], out[pos + 2] = 0xff, 0x58, 4
+            out[pos + 3] = values[i]
+            out[pos + 4] = extra[i]
+            out[pos + 5] = 24
+            out[pos + 6] = 8
+            pos += 7
+            running = -1
+    pos = _write_variable_int(out, pos, accumulated)
+    out[pos], out[pos + 1], out[pos + 2] = 0xff, 0x2f, 0
+    return pos + 3
+
+
+def _track_events(table: AccordTable) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Builds time ordered events of accords in the same order as `accord_messages`. Events of accords (tempo and
+    metre changes and note ons) are already ordered, note offs are sorted separately and both streams are merged.
+
+    :return: Tuple of time (in seconds), tempo, kind, value and extra value of every event.
+    """
+
+    n = len(table)
+    first = table.note_offsets[0]
+    offsets = table.note_offsets - first
+    keys = table.note_keys[first:table.note_offsets[-1]].astype(np.int64)
+    lengths = table.note_lengths[first:table.note_offsets[-1]].astype(np.int64)
+    counts = np.diff(offsets)
+
+    end = np.cumsum(table.length * table.tempo)
+    start = np.concatenate(([0.0], end[:-1]))
+    tempo_changed = np.ones(n, dtype=np.int64)
+    tempo_changed[1:] = table.tempo[1:] != table.tempo[:-1]
+    metre_changed = np.ones(n, dtype=np.int64)
+    metre_changed[1:] = np.any(table.metre[1:] != table.metre[:-1], axis=1)
+
+    # Events of accord: tempo change, metre change and note ons, followed by end of track after all accords.
+    sizes = tempo_changed + metre_changed + counts
+    accord_of_event = np.repeat(np.arange(n), sizes)
+    base = np.cumsum(sizes) - sizes
+    count = accord_of_event.shape[0] + 1
+    times = np.empty(count)
+    times[:-1] = start[accord_of_event]
+    times[-1] = end[-1] if n > 0 else 0.0
+    tempos = np.empty(count)
+    tempos[:-1] = table.tempo[accord_of_event]
+    tempos[-1] = table.tempo[-1] if n > 0 else 1.0
+    kinds = np.full(count, _NOTE_ON, dtype=np.int64)
+    kinds[-1] = _END_OF_TRACK
+    values = np.zeros(count, dtype=np.int64)
+    extra = np.zeros(count, dtype=np.int64)
+
+    changes = base[tempo_changed == 1]
+    kinds[changes] = _SET_TEMPO
+    values[changes] = (table.tempo[tempo_changed == 1] * 1000000).astype(np.int64)
+    changes = (base + tempo_changed)[metre_changed == 1]
+    kinds[changes] = _TIME_SIGNATURE
+    values[changes] = table.metre[metre_changed == 1, 0]
+    extra[changes] = np.log2(table.metre[metre_changed == 1, 1]).astype(np.int64)
+    accord_of_note = np.repeat(np.arange(n), counts)
+    note_ons = (base + tempo_changed + metre_changed)[accord_of_note] + np.arange(keys.shape[0]) - \
+        offsets[accord_of_note]
+    values[note_ons] = keys
+
+    # Note offs ordered by time and then by note on (like in heap of `accord_messages`).
+    off_times = start[accord_of_note] + np.ldexp(table.tempo[accord_of_note], lengths)
+    order = np.argsort(off_times, kind='stable')
+    off_times = off_times[order]
+
+    # Note offs are played before accords starting at the same time, but after the ones starting earlier.
+    positions = np.arange(count) + np.searchsorted(off_times, times, side='right')
+    off_positions = np.arange(off_times.shape[0]) + np.searchsorted(times, off_times, side='left')
+    total = count + off_times.shape[0]
+    res = (np.empty(total), np.empty(total), np.full(total, _NOTE_OFF, dtype=np.int64),
+           np.zeros(total, dtype=np.int64), np.zeros(total, dtype=np.int64))
+    for column, events, offs in zip(res, (times, tempos, kinds, values, extra),
+                                    (off_times, table.tempo[accord_of_note][order], None, keys[order], None)):
+        column[positions] = events
+        if offs is not None:
+            column[off_positions] = offs
+    return res
+
+
+def accords_to_midi(accords: Iterable[Accord] | AccordTable, name: str, ticks_per_beat: int = 480) -> bytes:
+    """
+    Encodes accords as midi file in memory. Produces the same bytes as `save_accords` streaming accords through
+    `MidiStreamWriter`, but all events are built and encoded at once with numpy.
+
+    :param accords: Accords of track.
+    :param name: Full name of track.
+    :param ticks_per_beat: Resolution of midi file.
+    :return: Content of midi file.
+    """
+
+    table = accords if isinstance(accords, AccordTable) else AccordTable.from_accords(list(accords))
+    times, tempos, kinds, values, extra = _track_events(table)
+    # The same operations as `MidiStreamWriter.send_at` and `mido.second2tick`, so rounding is identical.
+    delta = times - np.concatenate(([0.0], times[:-1]))
+    ticks = np.rint(delta / (tempos * 1000000 * 1e-6 / ticks_per_beat)).astype(np.int64)
+    out = np.empty(12 * ticks.shape[0] + 8, dtype=np.uint8)
+    size = _encode_events(ticks, kinds, values, extra, out)
+
+    header = bytearray()
+    for meta in (MetaMessage('track_name', name=name), MetaMessage('instrument_name', name='python_composer')):
+        header += b'\x00' + bytes(meta.bytes())
+    return b''.join((b'MThd', struct.pack('>L', 6), struct.pack('>hhh', 1, 1, ticks_per_beat),
+                     b'MTrk', struct.pack('>L', len(header) + size), bytes(header), out[:size].tobytes()))
@@ -1,17 +1,26 @@
+import heapq
 import math
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Iterator, Iterable, Tuple, TYPE_CHECKING
 
 import mido
+import numpy as np
 
-import pygame as pg
+if TYPE_CHECKING:
+    import pygame as pg
 
 BITS_PER_SECOND = 60
 
+# Structured type of notes stored in `NoteTable`.
+NOTE_DTYPE = np.dtype([('note', np.int16), ('start', np.float64), ('length', np.float64), ('tempo', np.float64),
+                       ('metre', np.int32, (2,)), ('velocity', np.int16)])
+
 
 class Note:
     """
     Class representing single note.
     """
+    __slots__ = ('note', 'start', 'length', 'end', 'tempo', 'metre', 'velocity')
+
     def __init__(self, note, start, length, tempo=0.5, metre=(4, 4), velocity=64):
         self.note = note
         self.start = start
@@ -28,6 +37,144 @@ class Note:
         return self.__repr__()
 
 
+class NoteTable:
+    """
+    Compact columnar collection of notes, backed by structured array of `NOTE_DTYPE`.
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data: np.ndarray):
+        self.data = data
+
+    @staticmethod
+    def from_notes(notes: List[Note]) -> 'NoteTable':
+        """
+        Creates table from list of notes.
+        """
+
+        data = np.empty(len(notes), dtype=NOTE_DTYPE)
+        data['note'] = [n.note for n in notes]
+        data['start'] = [n.start for n in notes]
+        data['length'] = [n.length for n in notes]
+        data['tempo'] = [n.tempo for n in notes]
+        data['metre'] = np.array([n.metre for n in notes], dtype=np.int32).reshape(-1, 2)
+        data['velocity'] = [n.velocity for n in notes]
+        return NoteTable(data)
+
+    def to_notes(self) -> List[Note]:
+        """
+        Converts table into list of notes.
+        """
+
+        data = self.data
+        return [Note(n, s, l, t, (m[0], m[1]), v) for (n, s, l, t, m, v) in
+                zip(data['note'].tolist(), data['start'].tolist(), data['length'].tolist(),
+                    data['tempo'].tolist(), data['metre'].tolist(), data['velocity'].tolist())]
+
+    def sorted_by_start(self) -> 'NoteTable':
+        """
+        Returns table sorted (stably) by start of notes.
+        """
+
+        return NoteTable(self.data[np.argsort(self.data['start'], kind='stable')])
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, i: int) -> Note:
+        n = self.data[i]
+        return Note(int(n['note']), float(n['start']), float(n['length']), float(n['tempo']),
+                    (int(n['metre'][0]), int(n['metre'][1])), int(n['velocity']))
+
+    def __iter__(self) -> Iterator[Note]:
+        return iter(self.to_notes())
+
+
+class Timeline:
+    """
+    Notes of composed track sorted by start, indexed by frames in which they are displayed or played.
+    Notes are added as they are composed and consumed by any number of `TimelineView`\\s.
+    """
+    __slots__ = ('rate', 'notes', 'starts', 'ends')
+
+    def __init__(self, rate: int = BITS_PER_SECOND):
+        """
+        :param rate: Number of frames per second.
+        """
+
+        self.rate = rate
+        self.notes = []
+        # First frame in which each note is started.
+        self.starts = []
+        # Frame offset after which each note is finished (it is finished in frame f if f - margin > end).
+        self.ends = []
+
+    def append(self, note: Note):
+        """
+        Adds note at the end of timeline. Notes have to be added in order of their starts.
+        """
+
+        if self.notes and note.start < self.notes[-1].start:
+            raise ValueError('notes have to be added in order of their starts')
+        shift = math.floor(-note.start * self.rate)
+        self.notes.append(note)
+        self.starts.append(-shift)
+        self.ends.append(math.floor(note.length * self.rate) - shift)
+
+    def extend(self, notes: Iterable[Note]):
+        """
+        Adds many notes at the end of timeline.
+        """
+
+        for note in notes:
+            self.append(note)
+
+    def view(self) -> 'TimelineView':
+        """
+        Creates new view of timeline, starting at its beginning.
+        """
+
+        return TimelineView(self)
+
+    def __len__(self):
+        return len(self.notes)
+
+
+class TimelineView:
+    """
+    Moving window over `Timeline`. Notes enter the window when they start and leave it when they are finished,
+    which is tracked with heap of their ends, so advancing window costs time proportional to number of
+    notes that entered, left or are inside it.
+    """
+    __slots__ = ('timeline', 'cursor', 'live', 'finishing')
+
+    def __init__(self, timeline: Timeline):
+        self.timeline = timeline
+        self.cursor = 0
+        # Started notes that are not finished yet, by index (in order of starts).
+        self.live = {}
+        self.finishing = []
+
+    def advance(self, frame: int, margin: int = 0) -> Tuple[List[Note], List[Note]]:
+        """
+        Moves window to given frame.
+
+        :param frame: Current frame.
+        :param margin: Number of frames after end of note in which it is still kept in window.
+        :return: Pair of lists of notes in window and notes that left it in this frame.
+        """
+
+        timeline = self.timeline
+        while self.cursor < len(timeline.notes) and timeline.starts[self.cursor] <= frame:
+            self.live[self.cursor] = timeline.notes[self.cursor]
+            heapq.heappush(self.finishing, (timeline.ends[self.cursor], self.cursor))
+            self.cursor += 1
+        finished = []
+        while self.finishing and self.finishing[0][0] < frame - margin:
+            finished.append(self.live.pop(heapq.heappop(self.finishing)[1]))
+        return list(self.live.values()), finished
+
+
 def load_midi(path: str) -> mido.MidiFile:
     """
     Loads midi file.
@@ -62,29 +209,19 @@ def midi_to_notes(midi: mido.MidiFile) -> List[Note]:
     return res
 
 
-def play_notes(notes: List[Note], sounds: Dict[int, pg.mixer.Sound], active: Set[int], frame: int) -> Set[int]:
+def play_notes(notes: TimelineView, sounds: Dict[int, 'pg.mixer.Sound'], active: Set[int], frame: int) -> Set[int]:
     """
-    Function playing all notes in list.
+    Function playing notes of timeline sounding in given frame.
 
-    :param notes: Notes to be played.
+    :param notes: View of timeline of notes to be played.
     :param sounds: Dictionary containing sounds of piano keys.
     :param active: Set of previously pressed keys.
     :param frame: Number of frame to be played. (to be consistent with display)
     :return: Set of currently pressed keys.
     """
 
-    current = set()
-    notes_played = []
-    for note in notes:
-        key = note.note
-        start_pos = math.floor(-note.start * BITS_PER_SECOND + frame)
-        length = math.floor(note.length * BITS_PER_SECOND)
-        if start_pos < 0:
-            break
-        elif start_pos - length > 0:
-            notes_played.append(note)
-        else:
-            current.add(key)
+    sounding, notes_played = notes.advance(frame)
+    current = {note.note for note in sounding}
     for key in current.difference(active):
         sounds[key].play()
     for key in active.difference(current):
@@ -92,5 +229,4 @@ def play_notes(notes: List[Note], sounds: Dict[int, pg.mixer.Sound], active: Set
     for note in notes_played:
         if note.note in current:
             sounds[note.note].play()
-        notes.remove(note)
     return current
@@ -0,0 +1,310 @@
+import numpy as np
+from numba import jit, prange
+
+
+@jit(nopython=True, cache=True)
+def _min_heap_push(heap: np.ndarray, size: int, value: float):
+    """
+    Pushes value on min heap of given size and keeps only `heap.shape[0]` largest values.
+    """
+
+    if size < heap.shape[0]:
+        i = size
+        heap[i] = value
+        while i > 0 and heap[(i - 1) // 2] > heap[i]:
+            parent = (i - 1) // 2
+            heap[i], heap[parent] = heap[parent], heap[i]
+            i = parent
+    elif value > heap[0]:
+        heap[0] = value
+        i = 0
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < heap.shape[0] and heap[child] < heap[smallest]:
+                    smallest = child
+            if smallest == i:
+                break
+            heap[i], heap[smallest] = heap[smallest], heap[i]
+            i = smallest
+
+
+@jit(nopython=True, cache=True)
+def selection_weights(corpus: np.ndarray, state: np.ndarray, importances: np.ndarray, curve: float,
+                      weights: np.ndarray, threshold: float = 0.0, top_k: int = 0):
+    """
+    Computes weighted chebyshev distance of every corpus vector to the state and its selection weight
+    `curve * exp(-curve * distance)`. Weights are written into preallocated buffer.
+
+    :param corpus: Contiguous array of shape (n, 3, 128).
+    :param state: State vector of shape (3, 128).
+    :param importances: Importance of each of 3 sub-vectors.
+    :param curve: Selection curve parameter.
+    :param weights: Buffer of size n for weights.
+    :param threshold: Weights lower than threshold are truncated to zero (computation of their distance
+        is stopped early).
+    :param top_k: If positive, only `top_k` largest weights are kept (with ties).
+    :return: Pair of sum and maximum of weights.
+    """
+
+    n = corpus.shape[0]
+    cut = np.inf
+    if threshold > 0:
+        cut = -np.log(threshold / curve) / curve
+
+    heap = np.zeros(max(top_k, 1))
+    total = 0.0
+    best = 0.0
+    for i in range(n):
+        d = 0.0
+        for k in range(3):
+            m = 0.0
+            for j in range(128):
+                x = abs(np.float64(corpus[i, k, j]) - state[k, j])
+                if x > m:
+                    m = x
+            d += importances[k] * m
+            if d > cut:
+                break
+        w = 0.0
+        if d <= cut:
+            w = curve * np.exp(-curve * d)
+        weights[i] = w
+        total += w
+        if w > best:
+            best = w
+        if top_k > 0:
+            _min_heap_push(heap, min(i, top_k), w)
+
+    if 0 < top_k < n:
+        total = 0.0
+        for i in range(n):
+            if weights[i] < heap[0]:
+                weights[i] = 0.0
+            total += weights[i]
+    return total, best
+
+
+@jit(nopython=True, cache=True)
+def truncate_top_k(weights: np.ndarray, counts: np.ndarray, top_k: int) -> float:
+    """
+    Keeps only `top_k` largest weights (with ties) in place, where every weight stands for `counts` equal
+    weights, so the same weights are kept as `selection_weights` keeps on corpus with all copies.
+
+    :param weights: Weights of entries.
+    :param counts: Number of copies of every entry.
+    :param top_k: Number of weights to keep.
+    :return: Sum of weights left.
+    """
+
+    order = np.argsort(-weights)
+    seen = 0
+    cut = 0.0
+    for i in order:
+        seen += counts[i]
+        if seen >= top_k:
+            cut = weights[i]
+            break
+
+    total = 0.0
+    for i in range(weights.shape[0]):
+        if weights[i] < cut:
+            weights[i] = 0.0
+        total += weights[i]
+    return total
+
+
+@jit(nopython=True, cache=True)
+def sample_index(weights: np.ndarray, total: float, rand: float):
+    """
+    Samples index with probability proportional to weight.
+
+    :param weights: Weights of indexes.
+    :param total: Sum of weights.
+    :param rand: Random number from [0, 1).
+    :return: Pair of selected index (-1 if all weights are zero) and its weight.
+    """
+
+    target = rand * total
+    running = 0.0
+    for i in range(weights.shape[0]):
+        running += weights[i]
+        if running > target:
+            return i, weights[i]
+    return -1, 0.0
+
+
+@jit(nopython=True, cache=True)
+def fused_select(corpus: np.ndarray, state: np.ndarray, importances: np.ndarray, curve: float, rand: float,
+                 weights: np.ndarray, threshold: float = 0.0, top_k: int = 0):
+    """
+    Computes selection weights (see `selection_weights`) and samples index with probability proportional
+    to weight. No corpus sized memory is allocated.
+
+    :param corpus: Contiguous array of shape (n, 3, 128).
+    :param state: State vector of shape (3, 128).
+    :param importances: Importance of each of 3 sub-vectors.
+    :param curve: Selection curve parameter.
+    :param rand: Random number from [0, 1).
+    :param weights: Buffer of size n for weights.
+    :param threshold: Weights lower than threshold are truncated to zero.
+    :param top_k: If positive, only `top_k` largest weights are kept (with ties).
+    :return: Tuple of selected index (-1 if all weights are zero), its weight, sum and maximum of weights.
+    """
+
+    total, best = selection_weights(corpus, state, importances, curve, weights, threshold, top_k)
+    selected, weight = sample_index(weights, total, rand)
+    return selected, weight, total, best
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def batch_weights(corpus: np.ndarray, states: np.ndarray, importances: np.ndarray, curve: float,
+                  weights: np.ndarray):
+    """
+    Computes selection weights of every corpus vector for each of many states. Corpus is read once,
+    rows are processed in parallel.
+
+    :param corpus: Contiguous array of shape (n, 3, 128).
+    :param states: States of shape (b, 3, 128).
+    :param importances: Importance of each of 3 sub-vectors.
+    :param curve: Selection curve parameter.
+    :param weights: Output array of shape (b, n).
+    """
+
+    for i in prange(corpus.shape[0]):
+        for b in range(states.shape[0]):
+            d = 0.0
+            for k in range(3):
+                m = 0.0
+                for j in range(128):
+                    x = abs(np.float64(corpus[i, k, j]) - states[b, k, j])
+                    if x > m:
+                        m = x
+                d += importances[k] * m
+            weights[b, i] = curve * np.exp(-curve * d)
+
+
+class QuantizedCorpus:
+    """
+    Corpus of convolved vectors stored as unsigned integers (`uint8` or `uint16`) with separate scale of each
+    of 3 sub-vectors, cutting memory and bandwidth of selection 4 or 2 times. As chebyshev distance of sub-vector
+    `k` is `scales[k] * max|codes - state / scales[k]|`, selection kernels run directly on codes with state and
+    importances rescaled.
+    """
+    def __init__(self, vectors: np.ndarray, dtype=np.uint8):
+        """
+        Quantizes vectors.
+
+        :param vectors: Array of shape (n, 3, 128) with non-negative values.
+        :param dtype: Type of codes (`np.uint8` or `np.uint16`).
+        """
+
+        levels = np.iinfo(dtype).max
+        top = np.max(vectors, axis=(0, 2)) if len(vectors) > 0 else np.ones(3)
+        self.scales = np.where(top > 0, top / levels, 1.0).astype(np.float64)
+        self.codes = np.ascontiguousarray(
+            np.clip(np.rint(vectors / self.scales[None, :, None]), 0, levels).astype(dtype))
+
+    def rescale(self, state: np.ndarray, importances: np.ndarray):
+        """
+        Returns state and importances to be used with codes instead of original vectors.
+        """
+
+        return np.asarray(state, dtype=np.float64) / self.scales[:, None], importances * self.scales
+
+    def dequantize(self) -> np.ndarray:
+        """
+        Returns approximation of original vectors as float32 array.
+        """
+
+        return (self.codes * self.scales[None, :, None]).astype(np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+
+class CompactCorpus:
+    """
+    Corpus in which duplicate vectors (e.g. empty states at starts of tracks or repeated bars) are merged into
+    single entry with multiplicity equal to number of merged vectors. Selection scores every entry once and samples
+    it with weight multiplied by multiplicity, then picks one of its members uniformly, so distribution over
+    original vectors is unchanged (`top_k` of `composer.select_bit` counts all members of entry). Indexes and
+    length refer to original corpus.
+    """
+    def __init__(self, vectors: np.ndarray, dtype=None):
+        """
+        Merges duplicate vectors.
+
+        :param vectors: Array of shape (n, 3, 128).
+        :param dtype: If provided (`np.uint8` or `np.uint16`), vectors equal after quantization are merged as well
+            and entries are stored as `QuantizedCorpus`.
+        """
+
+        if dtype is not None:
+            self.vectors = QuantizedCorpus(vectors, dtype)
+            keys = self.vectors.codes
+        else:
+            self.vectors = keys = np.ascontiguousarray(vectors, dtype=np.float32)
+        n = keys.shape[0]
+        rows = keys.reshape(n, 3 * 128).view(np.dtype((np.void, keys.dtype.itemsize * 3 * 128)))[:, 0]
+        _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+
+        # Entries are ordered by their first member, so scanning them keeps order of corpus.
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(order.shape[0])
+        self.entries = rank[inverse.reshape(-1)]
+        self.members = np.argsort(self.entries, kind='stable')
+        counts = np.bincount(self.entries, minlength=order.shape[0])
+        self.offsets = np.zeros(order.shape[0] + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(counts)
+        self.multiplicity = counts.astype(np.float64)
+
+        unique = first[order]
+        if dtype is not None:
+            self.vectors.codes = np.ascontiguousarray(self.vectors.codes[unique])
+        else:
+            self.vectors = np.ascontiguousarray(self.vectors[unique])
+
+    def members_of(self, entry: int) -> np.ndarray:
+        """
+        Returns indexes of original vectors (and so accords) merged into entry.
+        """
+
+        return self.members[self.offsets[entry]:self.offsets[entry + 1]]
+
+    def member(self, entry: int, rand: float) -> int:
+        """
+        Returns member of entry selected by random number from [0, 1).
+        """
+
+        start, end = self.offsets[entry], self.offsets[entry + 1]
+        return int(self.members[min(start + int(rand * (end - start)), end - 1)])
+
+    def dequantize(self) -> np.ndarray:
+        """
+        Returns (approximation of) original vectors as float32 array.
+        """
+
+        vectors = self.vectors.dequantize() if isinstance(self.vectors, QuantizedCorpus) else self.vectors
+        return vectors[self.entries]
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.entries.nbytes + self.members.nbytes + self.offsets.nbytes + \
+            self.multiplicity.nbytes
+
+    @property
+    def shape(self):
+        return (len(self), *self.vectors.shape[1:])
+
+    def __len__(self):
+        return self.entries.shape[0]
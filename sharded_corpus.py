@@ -0,0 +1,159 @@
+import os
+import tempfile
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from typing import Tuple
+
+import numpy as np
+
+from composer import IMPORTANCES, SELECTION_CURVE_PARAM
+from selection import selection_weights, sample_index, QuantizedCorpus
+from vectorization import Vector
+
+__all__ = ['ShardedCorpus', 'share_corpus', 'SHARED_FOLDER']
+
+# Folder of shared corpus files, kept in memory (tmpfs) where available.
+SHARED_FOLDER = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def share_corpus(vectors: np.ndarray, path: str | None = None) -> str:
+    """
+    Writes corpus into `.npy` file, which can be memory mapped by any number of processes sharing
+    single copy of data in page cache.
+
+    :param vectors: Convolved vectors (or codes of quantized corpus) of shape (n, 3, 128).
+    :param path: Path of file (new temporary file in `SHARED_FOLDER` if None).
+    :return: Path of file.
+    """
+
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.npy', prefix='corpus-', dir=SHARED_FOLDER)
+        os.close(fd)
+    np.save(path, np.ascontiguousarray(vectors))
+    return path
+
+
+def _shard_worker(connection: Connection, path: str, start: int, end: int):
+    """
+    Serves selection requests on shard `[start, end)` of memory mapped corpus. Every request is a tuple of
+    state, importances, random number and threshold; response is sum and maximum of shard weights and
+    index (relative to shard) and weight of locally sampled vector. Worker stops on None.
+    """
+
+    corpus = np.load(path, mmap_mode='r')[start:end]
+    weights = np.empty(end - start)
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        state, importances, rand, threshold = request
+        total, best = selection_weights(corpus, state, importances, SELECTION_CURVE_PARAM, weights, threshold)
+        selected, weight = sample_index(weights, total, rand)
+        connection.send((total, best, selected, weight))
+    connection.close()
+
+
+class ShardedCorpus:
+    """
+    Corpus of convolved vectors split into shards scanned in parallel by worker processes. Corpus is stored in
+    memory mapped file (see `share_corpus`), so workers, as well as other generators using the same file,
+    share single copy of it.
+
+    Every worker computes sum of weights of its shard and samples vector of the shard proportionally to weight.
+    Coordinator selects shard proportionally to its sum, so selected vector follows exactly the distribution
+    of `select_bit`. Object can be passed as `index` to `composer.select_bit` and generators.
+    """
+    def __init__(self, known_vec: np.ndarray | QuantizedCorpus | str, shards: int | None = None,
+                 path: str | None = None, threshold: float = 0.0):
+        """
+        Writes corpus into shared file and starts workers.
+
+        :param known_vec: Convolved vectors, quantized corpus or path of already shared corpus (`.npy` file).
+        :param shards: Number of shards and worker processes (all cores by default).
+        :param path: Path of shared file (temporary file removed on `close` if None).
+        :param threshold: Weights lower than threshold are truncated to zero.
+        """
+
+        self.quantized = None
+        self.owned = False
+        if isinstance(known_vec, str):
+            self.path = known_vec
+        else:
+            if isinstance(known_vec, QuantizedCorpus):
+                self.quantized = known_vec
+                known_vec = known_vec.codes
+            else:
+                known_vec = np.asarray(known_vec, dtype=np.float32)
+            self.owned = path is None
+            self.path = share_corpus(known_vec, path)
+        self.threshold = threshold
+
+        n = np.load(self.path, mmap_mode='r').shape[0]
+        shards = max(1, min(shards or os.cpu_count() or 1, n))
+        self.offsets = np.linspace(0, n, shards + 1).astype(np.int64)
+        self.connections = []
+        self.workers = []
+        for start, end in zip(self.offsets[:-1], self.offsets[1:]):
+            parent, child = Pipe()
+            worker = Process(target=_shard_worker, args=(child, self.path, int(start), int(end)), daemon=True)
+            worker.start()
+            child.close()
+            self.connections.append(parent)
+            self.workers.append(worker)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def weights(self, state: Vector, rng=np.random) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Sends state to all workers and collects their results.
+
+        :param state: Convolved state of composed track.
+        :param rng: Source of random numbers of local samples.
+        :return: Tuple of sums and maximums of weights of shards and corpus indexes and weights of
+            vectors sampled in shards.
+        """
+
+        state, importances = np.asarray(state, dtype=np.float64), IMPORTANCES
+        if self.quantized is not None:
+            state, importances = self.quantized.rescale(state, importances)
+        for connection in self.connections:
+            connection.send((state, importances, rng.uniform(0.0, 1.0), self.threshold))
+        results = np.array([connection.recv() for connection in self.connections])
+        selected = np.where(results[:, 2] >= 0, results[:, 2] + self.offsets[:-1], -1).astype(np.int64)
+        return results[:, 0], results[:, 1], selected, results[:, 3]
+
+    def select(self, state: Vector, rng=np.random) -> Tuple[int, float]:
+        """
+        Selects randomly corpus vector with probability depending on similarity to current state.
+
+        :param state: Convolved state of composed track.
+        :param rng: Source of randomness (`np.random` or `np.random.Generator`).
+        :return: Pair of selected corpus index (-1 if every weight was truncated) and its weight.
+        """
+
+        totals, _, selected, weights = self.weights(state, rng)
+        shard, _ = sample_index(totals, np.sum(totals), rng.uniform(0.0, 1.0))
+        if shard < 0:
+            return -1, 0.0
+        return int(selected[shard]), float(weights[shard])
+
+    def close(self):
+        """
+        Stops workers and removes shared file if it was created by this object.
+        """
+
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for worker in self.workers:
+            worker.join()
+        self.connections, self.workers = [], []
+        if self.owned and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,26 @@
+import os
+import sys
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from composer import convolve_known
+from vectorization import load_folder
+
+MIDI_FOLDER = os.path.join(ROOT, 'midi')
+
+
+@pytest.fixture(scope='session')
+def corpus():
+    """
+    Accords, vectors and convolved vectors (contiguous float32) of tracks in `midi` folder.
+    """
+
+    accords, vectors, _ = load_folder(MIDI_FOLDER)
+    return accords, np.array(vectors, dtype=np.float32), convolve_known(vectors)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from composer import select_bit
+from selection import CompactCorpus
+
+
+def distribution(state: np.ndarray, corpus, **kwargs) -> np.ndarray:
+    """
+    Returns probabilities of selection of every original corpus vector by `select_bit`.
+    """
+
+    weights = np.empty(len(corpus))
+    select_bit(state, corpus, weights=weights, **kwargs)
+    if isinstance(corpus, CompactCorpus):
+        # Entry is selected with its weight and then one of its members uniformly.
+        weights = weights[:len(corpus.multiplicity)][corpus.entries] / corpus.multiplicity[corpus.entries]
+    return weights / np.sum(weights)
+
+
+@pytest.fixture(scope='module')
+def duplicated(corpus):
+    _, _, convolved = corpus
+    # Corpus with repeated passages, so entries have large multiplicities.
+    rng = np.random.default_rng(0)
+    return np.ascontiguousarray(np.concatenate([convolved, convolved[rng.choice(len(convolved), 2000)]]))
+
+
+@pytest.mark.parametrize('truncation', [{}, {'top_k': 1}, {'top_k': 5}, {'top_k': 50}, {'threshold': 1e-3},
+                                        {'threshold': 1e-3, 'top_k': 20}])
+def test_compact_distribution_matches_full(duplicated, truncation):
+    compact = CompactCorpus(duplicated)
+    assert len(compact.multiplicity) < len(duplicated)
+    rng = np.random.default_rng(1)
+    for i in rng.choice(len(duplicated), 10):
+        state = duplicated[i].astype(np.float64)
+        np.testing.assert_allclose(distribution(state, compact, **truncation),
+                                   distribution(state, duplicated, **truncation), atol=1e-12)
+
+
+def test_top_k_counts_copies(duplicated):
+    compact = CompactCorpus(duplicated)
+    entry = int(np.argmax(compact.multiplicity))
+    state = compact.vectors[entry].astype(np.float64)
+    # Single entry already holds more than `top_k` copies, so nothing else is selected.
+    p = distribution(state, compact, top_k=int(compact.multiplicity[entry]) - 1)
+    assert np.all(p[compact.members_of(entry)] > 0)
+    assert np.isclose(p[compact.members_of(entry)].sum(), 1.0)
@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+
+from compose_server import ComposeServer
+
+
+@pytest.fixture(scope='module')
+def corpora(corpus):
+    accords, vectors, convolved = corpus
+    return {'midi': (accords, vectors, convolved)}
+
+
+def run(server: ComposeServer, coroutine):
+    async def main():
+        server.start()
+        try:
+            return await coroutine()
+        finally:
+            await server.stop()
+
+    return asyncio.run(main())
+
+
+class Writer:
+    """
+    Stream writer collecting response.
+    """
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data: bytes):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def request(server: ComposeServer, body: bytes) -> bytes:
+    """
+    Sends compose request through `ComposeServer.handle` and returns response.
+    """
+
+    async def send():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'POST /compose HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+        reader.feed_eof()
+        writer = Writer()
+        await server.handle(reader, writer)
+        return writer.data
+
+    return run(server, send)
+
+
+@pytest.mark.parametrize('seed', ['-1', '"-1"', '"abc"', '1.5', 'true'])
+def test_invalid_seed_is_rejected(corpora, seed):
+    server = ComposeServer(corpora)
+    composed = []
+    server._compose_batch = lambda corpus, batch: composed.append(batch) or [b''] * len(batch)
+    response = request(server, f'{{"length": 1, "seed": {seed}}}'.encode())
+    assert response.startswith(b'HTTP/1.1 400')
+    # Request is rejected before it is queued.
+    assert not composed
+
+
+def test_valid_seed_is_composed(corpora):
+    server = ComposeServer(corpora)
+    assert request(server, b'{"length": 1, "seed": "7"}').startswith(b'HTTP/1.1 200')
+
+
+def test_failing_request_does_not_fail_its_batch(corpora, monkeypatch):
+    server = ComposeServer(corpora, batch_window=0.05)
+    compose_batch = server._compose_batch
+
+    def failing(corpus, batch):
+        if any(r.base_name == 'bad' for r in batch):
+            raise RuntimeError('bad request')
+        return compose_batch(corpus, batch)
+
+    monkeypatch.setattr(server, '_compose_batch', failing)
+
+    async def requests():
+        return await asyncio.gather(server.compose('midi', 1.0, 'good', 1), server.compose('midi', 1.0, 'bad', 2),
+                                    server.compose('midi', 1.0, 'good', 3), return_exceptions=True)
+
+    good, bad, other = run(server, requests)
+    assert isinstance(bad, RuntimeError)
+    assert good[0].startswith(b'MThd') and other[0].startswith(b'MThd')
+    assert good[1]['batch'] == 3
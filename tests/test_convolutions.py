@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from composer import CONVOLUTION
+from convolutions import batch_maxvolve, convolve_general, gen_convolve, maxvolve
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_batch_maxvolve_matches_maxvolve(dtype):
+    rng = np.random.default_rng(0)
+    x = rng.random((500, 128)).astype(dtype)
+    x[::7] = 0.0
+    x[1::7, rng.integers(128, size=20)] = 0.0
+    out = batch_maxvolve(x, CONVOLUTION)
+    for row, res in zip(x, out):
+        np.testing.assert_array_equal(res, maxvolve(row.astype(np.float64), CONVOLUTION))
+
+
+UFUNCS = [np.add, np.subtract, np.multiply, np.maximum, np.minimum]
+SHAPES = [(1, 1), (1, 5), (7, 1), (5, 12), (40, 9)]
+
+
+@pytest.mark.parametrize('method', ['compiled', 'vectorized'])
+@pytest.mark.parametrize('op', UFUNCS, ids=lambda u: u.__name__)
+@pytest.mark.parametrize('reduce', UFUNCS, ids=lambda u: u.__name__)
+def test_convolve_general_matches_loop(op, reduce, method):
+    rng = np.random.default_rng(0)
+    for x_size, y_size in SHAPES:
+        x = rng.normal(size=(3, x_size))
+        y = rng.normal(size=y_size)
+        res = convolve_general(x, y, op, reduce, method=method)
+        assert res.shape == (3, x_size + y_size - 1)
+        for row, out in zip(x, res):
+            # Plain functions make `gen_convolve` run its reference loop.
+            expected = gen_convolve(row, y, lambda a, b: op(a, b), lambda a, b: reduce(a, b))
+            np.testing.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize('method', ['compiled', 'vectorized'])
+def test_convolve_general_same_mode_is_maxvolve(method):
+    x = np.random.default_rng(1).random((4, 128))
+    res = convolve_general(x, CONVOLUTION, np.multiply, np.maximum, 'same', method)
+    for row, out in zip(x, res):
+        np.testing.assert_array_equal(out, maxvolve(row, CONVOLUTION))
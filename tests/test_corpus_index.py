@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from composer import select_bit
+from corpus_index import CorpusIndex
+
+SAMPLES = 5000
+
+
+def select_bit_distribution(state: np.ndarray, corpus: np.ndarray) -> np.ndarray:
+    """
+    Returns probabilities of selection of every corpus vector by `select_bit`.
+    """
+
+    weights = np.empty(len(corpus))
+    select_bit(state, corpus, weights=weights)
+    return weights / np.sum(weights)
+
+
+def frequencies(select, n: int) -> np.ndarray:
+    counts = np.zeros(n)
+    for _ in range(SAMPLES):
+        counts[select()] += 1
+    return counts / SAMPLES
+
+
+@pytest.fixture(scope='module')
+def states(corpus):
+    _, _, convolved = corpus
+    rng = np.random.default_rng(0)
+    i, j = rng.choice(len(convolved), 2, replace=False)
+    # State of the corpus and state between two distant ones (with less concentrated distribution).
+    return [convolved[i].astype(np.float64), (convolved[i].astype(np.float64) + convolved[j]) / 2]
+
+
+# With high tolerance most of selections come from rejection sampling of not scanned boxes.
+@pytest.mark.parametrize('tolerance', [0.05, 100.0])
+def test_exact_mode_matches_select_bit(corpus, states, tolerance):
+    _, _, convolved = corpus
+    index = CorpusIndex(convolved, tolerance)
+    for state in states:
+        expected = select_bit_distribution(state, convolved)
+
+        rng = np.random.default_rng(1)
+        indexed = frequencies(lambda: index.select(state, rng)[0], len(convolved))
+
+        # Total variation distance from select_bit distribution is within sampling noise of the same size.
+        noise = np.abs(rng.multinomial(SAMPLES, expected) / SAMPLES - expected).sum() / 2
+        assert np.abs(indexed - expected).sum() / 2 < max(2 * noise, 0.02)
+        assert np.all(expected[indexed > 0] > 0)
+
+
+def test_returned_weight_is_select_bit_weight(corpus, states):
+    _, _, convolved = corpus
+    index = CorpusIndex(convolved, 100.0)
+    rng = np.random.default_rng(2)
+    for state in states:
+        weights = np.empty(len(convolved))
+        select_bit(state, convolved, weights=weights)
+        for _ in range(100):
+            selected, weight = index.select(state, rng)
+            assert weight == pytest.approx(weights[selected])
+
+
+def test_tolerance_reduces_scanned_vectors(corpus, states):
+    _, _, convolved = corpus
+    scanned = []
+    for tolerance in (0.0, 0.001, 0.05, 1.0):
+        index = CorpusIndex(convolved, tolerance)
+        index.candidates(states[0])
+        scanned.append(index.scanned)
+    assert scanned[0] == len(convolved)
+    assert scanned == sorted(scanned, reverse=True)
+    assert scanned[2] < len(convolved) / 4
+
+
+def test_approximate_mode_loses_at_most_tolerance(corpus, states):
+    _, _, convolved = corpus
+    index = CorpusIndex(convolved, 0.05, exact=False)
+    for state in states:
+        expected = select_bit_distribution(state, convolved)
+        indexes, _, _, _, _ = index.candidates(state)
+        assert expected[indexes].sum() >= 1 / 1.05 - 1e-9
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from accord import Accord, NoteLength
+from composer import CONVOLUTION, RESYNC_STEPS, convolve
+from conftest import MIDI_FOLDER
+from vectorization import apply_accord_convolved, empty_vector, list_tracks, vectorize_file
+
+STEPS = 3 * RESYNC_STEPS + 10
+
+
+def check_sequence(accords) -> int:
+    """
+    Applies accords like `composer.music_generator` and checks convolved state after every step.
+    Returns total number of recomputed positions.
+    """
+
+    pressed, vector = np.zeros(128), empty_vector()
+    state = convolve(vector)
+    recomputed = 0
+    for step, accord in enumerate(accords, 1):
+        recomputed += apply_accord_convolved(accord, pressed, vector, state, CONVOLUTION, step % RESYNC_STEPS == 0)
+        assert np.allclose(state, convolve(vector)), f'step {step}'
+    return recomputed
+
+
+def accord(notes, length: float) -> Accord:
+    return Accord((4, 4), 0.5, notes, length, None, 0)
+
+
+@pytest.mark.parametrize('path', list_tracks(MIDI_FOLDER))
+def test_corpus_track(path):
+    accords, _ = vectorize_file(path)
+    assert len(accords) > RESYNC_STEPS
+    check_sequence(accords)
+
+
+def test_generated_sequence(corpus):
+    accords, _, _ = corpus
+    rng = np.random.default_rng(0)
+    check_sequence([accords[i] for i in rng.choice(len(accords), STEPS)])
+
+
+def test_random_sequence():
+    rng = np.random.default_rng(1)
+    lengths = list(NoteLength)
+    check_sequence([accord([(int(k), lengths[rng.integers(len(lengths))]) for k in
+                            rng.choice(128, rng.integers(0, 6), replace=False)], float(rng.choice([0.25, 0.5, 1, 4])))
+                    for _ in range(STEPS)])
+
+
+def test_release_recomputes_footprint():
+    pressed, vector = np.zeros(128), empty_vector()
+    state = convolve(vector)
+    apply_accord_convolved(accord([(60, NoteLength.FULL)], 0.5), pressed, vector, state, CONVOLUTION)
+    # Key held from previous accord is released in the middle of this one.
+    assert apply_accord_convolved(accord([], 8.0), pressed, vector, state, CONVOLUTION) > 0
+    assert np.allclose(state, convolve(vector))
+    # Nothing is held any more, so convolution is only scaled.
+    assert apply_accord_convolved(accord([], 1.0), pressed, vector, state, CONVOLUTION) == 0
+    assert np.allclose(state, convolve(vector))
+
+
+def test_wide_chord_recomputes_everything():
+    pressed, vector = np.zeros(128), empty_vector()
+    state = convolve(vector)
+    chord = accord([(k, NoteLength.HALF) for k in range(4, 124)], 1.0)
+    assert apply_accord_convolved(chord, pressed, vector, state, CONVOLUTION) == 128
+    assert np.allclose(state, convolve(vector))
+    assert apply_accord_convolved(accord([(64, NoteLength.EIGHTH)], 4.0), pressed, vector, state, CONVOLUTION) == 128
+    assert np.allclose(state, convolve(vector))
@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+import pytest
+
+from audio import render_notes
+from conftest import ROOT
+from keyboard import LOWEST_KEY, HIGHEST_KEY, sample_path
+from notes import Note
+
+SAMPLES = os.path.join(ROOT, 'notes')
+
+
+def test_sample_path_of_piano_keys():
+    assert sample_path(LOWEST_KEY, SAMPLES) == os.path.join(SAMPLES, 'A0.wav')
+    assert sample_path(HIGHEST_KEY, SAMPLES) == os.path.join(SAMPLES, 'C8.wav')
+    assert all(os.path.exists(sample_path(k, SAMPLES)) for k in range(LOWEST_KEY, HIGHEST_KEY + 1))
+
+
+@pytest.mark.parametrize('key', [0, LOWEST_KEY - 1, HIGHEST_KEY + 1, 127])
+def test_sample_path_rejects_keys_outside_piano(key):
+    with pytest.raises(ValueError, match=f'key {key} '):
+        sample_path(key, SAMPLES)
+
+
+def test_render_skips_keys_outside_piano(capsys):
+    playable = [Note(60, 0.0, 0.5), Note(LOWEST_KEY, 0.25, 0.5)]
+    expected = render_notes(playable, SAMPLES)
+    capsys.readouterr()
+
+    rendered = render_notes(playable + [Note(LOWEST_KEY - 1, 0.0, 1.0), Note(HIGHEST_KEY + 1, 0.5, 0.5)], SAMPLES)
+    np.testing.assert_array_equal(rendered, expected)
+    assert 'Skipped 2 notes' in capsys.readouterr().out
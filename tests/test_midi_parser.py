@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import MIDI_FOLDER
+from midi_parser import fast_midi_to_notes, read_note_table
+from notes import midi_to_notes, load_midi
+from vectorization import list_tracks
+
+FIELDS = ('note', 'start', 'length', 'tempo', 'metre', 'velocity')
+PATHS = list_tracks(MIDI_FOLDER)
+
+
+@pytest.fixture(scope='module', params=PATHS, ids=os.path.basename)
+def track(request):
+    return request.param, midi_to_notes(load_midi(request.param))
+
+
+def test_fast_parser_matches_mido(track):
+    path, expected = track
+    result = fast_midi_to_notes(path)
+    assert len(result) == len(expected)
+    for i, (a, b) in enumerate(zip(result, expected)):
+        for field in FIELDS:
+            assert getattr(a, field) == getattr(b, field), f'note {i}, field {field}'
+
+
+def test_note_table_matches_mido(track):
+    path, expected = track
+    table = read_note_table(path)
+    assert len(table) == len(expected)
+    for field in ('note', 'start', 'length', 'tempo', 'velocity'):
+        np.testing.assert_array_equal(table.data[field], [getattr(n, field) for n in expected], err_msg=field)
+    np.testing.assert_array_equal(table.data['metre'], np.array([n.metre for n in expected]).reshape(-1, 2))
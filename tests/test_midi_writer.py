@@ -0,0 +1,56 @@
+import io
+from copy import copy
+
+import numpy as np
+
+from accord import AccordTable, accord_messages, start_track
+from midi_stream import MidiStreamWriter
+from midi_writer import accords_to_midi
+
+
+def stream_midi(accords, name: str) -> bytes:
+    """
+    Encodes accords message by message with `MidiStreamWriter` (like streaming `save_accords`).
+    """
+
+    buffer = io.BytesIO()
+    with MidiStreamWriter(buffer) as writer:
+        start_track(writer, name)
+        for (t, tempo, msg) in accord_messages(accords):
+            writer.send_at(t, tempo, msg)
+    return buffer.getvalue()
+
+
+def slices(accords, count: int = 50, size: int = 200):
+    rng = np.random.default_rng(0)
+    return [accords[i:i + size] for i in rng.integers(0, len(accords) - size, count)]
+
+
+def test_corpus_slices(corpus):
+    accords, _, _ = corpus
+    for track in slices(accords):
+        assert accords_to_midi(track, 'track') == stream_midi(track, 'track')
+
+
+def test_tempo_and_metre_changes(corpus):
+    accords, _, _ = corpus
+    rng = np.random.default_rng(1)
+    for track in slices(accords, 20):
+        track = [copy(a) for a in track]
+        for a in track:
+            if rng.random() < 0.1:
+                a.tempo = float(rng.choice([0.3, 0.45, 0.5, 0.75]))
+            if rng.random() < 0.05:
+                a.metre = tuple(int(m) for m in rng.choice([(3, 4), (6, 8), (4, 4), (2, 2)]))
+        assert accords_to_midi(track, 'changes') == stream_midi(track, 'changes')
+
+
+def test_accord_table(corpus):
+    accords, _, _ = corpus
+    track = accords[:300]
+    assert accords_to_midi(AccordTable.from_accords(track), 'table') == stream_midi(track, 'table')
+
+
+def test_single_accord(corpus):
+    accords, _, _ = corpus
+    assert accords_to_midi(accords[:1], 'single') == stream_midi(accords[:1], 'single')
@@ -1,11 +1,14 @@
 import os
 import random
-from typing import List, Tuple
+from multiprocessing import Pool
+from typing import List, Tuple, Iterator, Sequence
 
 
-from accord import Accord, notes_to_accords
-from notes import Note, midi_to_notes, load_midi
+from accord import Accord, AccordTable, notes_to_accords, notes_to_accord_table
+from midi_parser import fast_midi_to_notes, read_note_table
+from notes import Note
 import numpy as np
+from numba import jit
 
 # Each vector is made of 3 "sub-vectors":
 # * Long memory - with smaller decreasing factor
@@ -32,6 +35,14 @@ def empty_vector() -> Vector:
     return np.zeros((3, 128), dtype=np.float32)
 
 
+def empty_corpus() -> Vector:
+    """
+    Creates corpus with no vectors.
+    """
+
+    return np.zeros((0, 3, 128), dtype=np.float32)
+
+
 def copy_vector(v: Vector) -> Vector:
     """
     Copies vector.
@@ -71,6 +82,137 @@ def apply_accord(accord: Accord, pressed: np.ndarray, v: Vector) -> Tuple[np.nda
     return new_pressed, v
 
 
+@jit(nopython=True, cache=True)
+def track_states(lengths: np.ndarray, note_offsets: np.ndarray, note_keys: np.ndarray,
+                 note_exponents: np.ndarray) -> np.ndarray:
+    """
+    Compiled equivalent of applying `apply_accord` to all accords of single track.
+
+    :param lengths: Lengths of consecutive accords.
+    :param note_offsets: Offsets of notes of each accord (accord `i` plays notes `note_offsets[i]:note_offsets[i+1]`).
+    :param note_keys: Keys of played notes.
+    :param note_exponents: Lengths of played notes (as `NoteLength` values).
+    :return: Array of shape (n_accords, 3, 128) with vectors preceding each accord.
+    """
+
+    res = np.zeros((lengths.shape[0], 3, 128), dtype=np.float32)
+    v = np.zeros((3, 128), dtype=np.float32)
+    pressed = np.zeros(128)
+    for i in range(lengths.shape[0]):
+        res[i] = v
+        length = lengths[i]
+        for j in range(note_offsets[i], note_offsets[i + 1]):
+            n = note_keys[j]
+            v[0, n] = 1
+            v[1, n] = 1
+            v[2, n] = min(v[2, n] + np.float32(CUMULATIVE_INCREMENT), np.float32(1.0))
+            pressed[n] = 2.0 ** note_exponents[j]
+        for n in range(128):
+            held = min(pressed[n], length)
+            released = length - held
+            v[0, n] = v[0, n] * LONG_HELD_FACTOR ** held * LONG_RELEASED_FACTOR ** released
+            v[1, n] = v[1, n] * SHORT_HELD_FACTOR ** held * SHORT_RELEASED_FACTOR ** released
+            v[2, n] = v[2, n] * CUMULATIVE_HELD_FACTOR ** held * CUMULATIVE_RELEASED_FACTOR ** released
+            pressed[n] = max(pressed[n] - length, 0.0)
+    return res
+
+
+@jit(nopython=True, cache=True)
+def _apply_accord_convolved(v: np.ndarray, conv: np.ndarray, pressed: np.ndarray, keys: np.ndarray,
+                            exponents: np.ndarray, length: float, kernel: np.ndarray, full: bool):
+    """
+    Applies accord to vector in place (exactly like `track_states`) and updates its maxvolve with kernel.
+    Outside of footprint of keys which were pressed or are held, every sub-vector is multiplied by the same
+    released factor, which commutes with maxvolve, so these positions of convolution are just scaled.
+    Positions within footprint are recomputed. Returns number of recomputed positions.
+    """
+
+    x_size = v.shape[1]
+    y_size = kernel.shape[0]
+    half = y_size // 2
+    special = np.zeros(x_size, dtype=np.bool_)
+    for j in range(keys.shape[0]):
+        n = keys[j]
+        v[0, n] = 1
+        v[1, n] = 1
+        v[2, n] = min(v[2, n] + np.float32(CUMULATIVE_INCREMENT), np.float32(1.0))
+        pressed[n] = 2.0 ** exponents[j]
+        special[n] = True
+    for n in range(x_size):
+        held = min(pressed[n], length)
+        released = length - held
+        if held > 0 and (v[0, n] != 0 or v[1, n] != 0 or v[2, n] != 0):
+            special[n] = True
+        v[0, n] = v[0, n] * LONG_HELD_FACTOR ** held * LONG_RELEASED_FACTOR ** released
+        v[1, n] = v[1, n] * SHORT_HELD_FACTOR ** held * SHORT_RELEASED_FACTOR ** released
+        v[2, n] = v[2, n] * CUMULATIVE_HELD_FACTOR ** held * CUMULATIVE_RELEASED_FACTOR ** released
+        pressed[n] = max(pressed[n] - length, 0.0)
+
+    # Output position j depends on inputs j - (y_size - 1 - half) .. j + half.
+    affected = np.zeros(x_size, dtype=np.bool_)
+    count = 0
+    for n in range(x_size):
+        if special[n] or full:
+            for j in range(max(0, n - half), min(x_size, n + y_size - half)):
+                if not affected[j]:
+                    affected[j] = True
+                    count += 1
+
+    factors = np.array([LONG_RELEASED_FACTOR ** length, SHORT_RELEASED_FACTOR ** length,
+                        CUMULATIVE_RELEASED_FACTOR ** length])
+    for b in range(3):
+        for j in range(x_size):
+            if not affected[j]:
+                conv[b, j] *= factors[b]
+                continue
+            m = -np.inf
+            for y_pos in range(y_size):
+                i = j - y_pos + half
+                if 0 <= i < x_size:
+                    m = max(m, v[b, i] * kernel[y_pos])
+            conv[b, j] = m
+    return count
+
+
+def apply_accord_convolved(accord: Accord, pressed: np.ndarray, v: Vector, conv: np.ndarray, kernel: np.ndarray,
+                           full: bool = False) -> int:
+    """
+    Incremental version of `apply_accord` maintaining maxvolve of vector with kernel. Vector, pressed keys and
+    convolution are updated in place.
+
+    :param accord: Accord currently played.
+    :param pressed: Vector of holding down keys.
+    :param v: Vector (float32 array of shape (3, 128)).
+    :param conv: Maxvolve of vector (float64 array of shape (3, 128)).
+    :param kernel: Convolution kernel.
+    :param full: If true, the whole convolution is recomputed (e.g. to drop accumulated rounding errors).
+    :return: Number of recomputed positions of each sub-vector.
+    """
+
+    keys = np.array([n for (n, _) in accord.notes], dtype=np.int64)
+    exponents = np.array([int(l) for (_, l) in accord.notes], dtype=np.float64)
+    return _apply_accord_convolved(v, conv, pressed, keys, exponents, float(accord.length),
+                                   np.asarray(kernel, dtype=np.float64), full)
+
+
+def vectorize_accords(accords: List[Accord] | AccordTable) -> Vector:
+    """
+    Calculates vectors preceding each accord of single track in one compiled pass.
+
+    :param accords: Consecutive accords of track (list or table).
+    :return: Array of shape (n_accords, 3, 128) with vectors preceding each accord.
+    """
+
+    if isinstance(accords, AccordTable):
+        return track_states(accords.length, accords.note_offsets, accords.note_keys,
+                            accords.note_lengths.astype(np.float64))
+    note_offsets = np.zeros(len(accords) + 1, dtype=np.int64)
+    note_offsets[1:] = np.cumsum([len(a.notes) for a in accords])
+    return track_states(np.array([a.length for a in accords], dtype=np.float64), note_offsets,
+                        np.array([n for a in accords for (n, _) in a.notes], dtype=np.int64),
+                        np.array([int(l) for a in accords for (_, l) in a.notes], dtype=np.float64))
+
+
 def vectorize_notes(notes_list: List[Note]) -> Tuple[List[Accord], List[Vector]]:
     """
     Function converting list of `Notes` of single track into list of corresponding
@@ -80,15 +222,19 @@ def vectorize_notes(notes_list: List[Note]) -> Tuple[List[Accord], List[Vector]]
     :return: Pair containing list of accords and list of corresponding vectors
     """
 
-    vector = empty_vector()
-    vec_res = []
-    status_res = []
-    pressed = np.zeros(128)
-    for accord in notes_to_accords(notes_list):
-        vec_res.append(copy_vector(vector))
-        status_res.append(accord)
-        pressed, vector = apply_accord(accord, pressed, vector)
-    return status_res, vec_res
+    accords = notes_to_accords(notes_list)
+    return accords, list(vectorize_accords(accords))
+
+
+def vectorize_file(path: str) -> Tuple[List[Accord], List[Vector]]:
+    """
+    Loads single midi file and vectorizes track stored in it.
+
+    :param path: Path to midi file.
+    :return: Pair containing list of accords and list of corresponding vectors
+    """
+
+    return vectorize_notes(fast_midi_to_notes(path))
 
 
 def load_folder(folder: str, fraction: float = 1.0) -> Tuple[List[Accord], List[Vector], List[str]]:
@@ -105,13 +251,88 @@ def load_folder(folder: str, fraction: float = 1.0) -> Tuple[List[Accord], List[
         for name in files:
             if name.endswith(".mid") and random.uniform(0.0, 1.0) <= fraction:
                 try:
-                    midi = load_midi(os.path.join(path, name))
-                    accord, vec = vectorize_notes(midi_to_notes(midi))
+                    accord, vec = vectorize_file(os.path.join(path, name))
                     accords += accord
                     vectors += vec
                     names += [name] * len(vec)
-                except IOError:
-                    print(f"Corrupted {path}/{name}")
-                except:
-                    print(f"Corrupted {path}/{name}")
+                except IOError as e:
+                    print(f"Corrupted {path}/{name}: {e}")
+                except Exception as e:
+                    print(f"Corrupted {path}/{name}: {type(e).__name__}: {e}")
     return accords, vectors, names
+
+
+def list_tracks(folder: str, fraction: float = 1.0) -> List[str]:
+    """
+    Lists paths of midi files found in folder (in deterministic order).
+
+    :param folder: Folder containing tracks.
+    :param fraction: Fraction of tracks to be listed.
+    :return: List of paths to tracks.
+    """
+
+    paths = []
+    for path, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".mid") and random.uniform(0.0, 1.0) <= fraction:
+                paths.append(os.path.join(path, name))
+    return paths
+
+
+def _vectorize_track(path: str) -> Tuple[str, AccordTable | None, Vector | None, str | None]:
+    """
+    Vectorizes single track. Accords are returned as table and vectors as single contiguous array
+    (both are cheap to send between processes). In case of failure accords and vectors are None
+    and error message is returned instead.
+    """
+
+    try:
+        table = notes_to_accord_table(read_note_table(path), os.path.basename(path))
+        return path, table, vectorize_accords(table), None
+    except Exception as e:
+        return path, None, None, f"{type(e).__name__}: {e}"
+
+
+def vectorize_tracks(paths: List[str], workers: int | None = None, chunksize: int = 4) \
+        -> Iterator[Tuple[str, AccordTable | None, Vector | None, str | None]]:
+    """
+    Vectorizes tracks using pool of processes. Results are yielded in order of provided paths.
+
+    :param paths: Paths of tracks to be vectorized.
+    :param workers: Number of worker processes (all cores if None, no pool if 1).
+    :param chunksize: Number of tracks sent to worker at once.
+    :return: Iterator of tuples of path, accords, vectors and error message (None if successful).
+    """
+
+    if workers == 1 or len(paths) <= 1:
+        yield from map(_vectorize_track, paths)
+        return
+    with Pool(workers) as pool:
+        yield from pool.imap(_vectorize_track, paths, chunksize=chunksize)
+
+
+def load_folder_parallel(folder: str, fraction: float = 1.0, workers: int | None = None, chunksize: int = 4) \
+        -> Tuple[AccordTable, Vector, Sequence[str], List[Tuple[str, str]]]:
+    """
+    Parallel version of `load_folder`. Tracks are vectorized in pool of processes, results are
+    in deterministic order (sorted by path).
+
+    :param folder: Folder containing tracks to be vectorized.
+    :param fraction: Fraction of tracks to vectorize (for performance optimization).
+    :param workers: Number of worker processes (all cores if None).
+    :param chunksize: Number of tracks sent to worker at once.
+    :return: Tuple of table of accords, array of vectors, names of tracks and list of failed paths with
+        error messages.
+    """
+
+    tables, vectors, failures = [], [], []
+    for path, table, vec, error in vectorize_tracks(list_tracks(folder, fraction), workers, chunksize):
+        if error is not None:
+            print(f"Corrupted {path}: {error}")
+            failures.append((path, error))
+            continue
+        tables.append(table)
+        vectors.append(vec)
+    accords = AccordTable.concatenate(tables)
+    return accords, np.concatenate(vectors) if vectors else empty_corpus(), accords.names, failures
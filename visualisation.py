@@ -1,33 +1,33 @@
 import math
-from typing import Set, List
+import time
+from collections import deque
+from typing import Set, List, Tuple
 
 from keyboard import position_of_note, into_blacks_and_whites, black_pos, is_white
-from notes import Note, BITS_PER_SECOND
+from notes import BITS_PER_SECOND, TimelineView
 import pygame as pg
 
-__all__ = ['draw_falling_notes', 'draw_piano']
+__all__ = ['draw_falling_notes', 'draw_piano', 'Renderer', 'PIANO_HEIGHT']
 
+PIANO_HEIGHT = 300
 
-def draw_falling_notes(screen: pg.Surface, notes: List[Note], frame: int):
+
+def draw_falling_notes(screen: pg.Surface, notes: TimelineView, frame: int):
     """
     Procedure drawing falling notes
 
     :param screen: PyGame screen to be drawn on.
-    :param notes: List of notes to be drawn.
+    :param notes: View of timeline of notes to be drawn.
     :param frame: Number of frame to be drawn. Determinate position of notes.
     """
 
     visible_whites = []
     visible_blacks = []
-    notes_played = []
-    for note in notes:
+    visible, notes_played = notes.advance(frame, screen.get_height())
+    for note in visible + notes_played:
         key = note.note
         start_pos = math.floor(-note.start * BITS_PER_SECOND + frame)
         length = math.floor(note.length * BITS_PER_SECOND)
-        if start_pos < 0:
-            break
-        if start_pos - length > screen.get_height():
-            notes_played.append(note)
         if is_white(key):
             visible_whites.append((key, start_pos, length))
         else:
@@ -38,9 +38,6 @@ def draw_falling_notes(screen: pg.Surface, notes: List[Note], frame: int):
     for (key, start, length) in visible_blacks:
         (lx, key_len) = position_of_note(key)
         pg.draw.rect(screen, 'black', [lx, start - length, key_len, length], 0, 2)
-    for note in notes_played:
-        notes.remove(note)
-    notes_played.clear()
 
 
 def draw_piano(pressed: Set[int], screen: pg.Surface):
@@ -67,3 +64,130 @@ def draw_piano(pressed: Set[int], screen: pg.Surface):
     for i in blacks:
         k = black_pos[i]
         pg.draw.rect(screen, 'green', [26 + (k * 35), screen.get_height() - 298, 18, 196], 0, 2)
+
+
+def _key_rects(height: int) -> Tuple[List[pg.Rect], List[pg.Rect]]:
+    """
+    Returns areas of white and black keys of piano drawn by `draw_piano` on screen of given height.
+    """
+
+    whites = [pg.Rect(i * 35, height - PIANO_HEIGHT, 35, PIANO_HEIGHT) for i in range(52)]
+    blacks = [pg.Rect(23 + k * 35, height - PIANO_HEIGHT, 24, 200) for k in black_pos]
+    return whites, blacks
+
+
+class Renderer:
+    """
+    Renderer drawing the same frames as `draw_falling_notes` and `draw_piano`, but redrawing only what changed.
+
+    Piano is rendered once into cached surface and only keys that were pressed or released are redrawn.
+    Falling notes area is scrolled by number of frames passed and only the uncovered strip at its top is
+    drawn, so only notes entering the screen are drawn. Time spent on each frame is recorded.
+    """
+    def __init__(self, screen: pg.Surface, notes: TimelineView, history: int = BITS_PER_SECOND):
+        """
+        :param screen: PyGame screen to be drawn on.
+        :param notes: View of timeline of notes to be drawn (not shared with other consumers).
+        :param history: Number of last frames used for frame time statistics.
+        """
+
+        self.screen = screen
+        self.notes = notes
+        width, height = screen.get_size()
+        self.notes_area = pg.Rect(0, 0, width, height - PIANO_HEIGHT)
+        self.notes_surface = screen.subsurface(self.notes_area)
+        self.piano = pg.Surface(screen.get_size())
+        self.piano.fill('gray')
+        draw_piano(set(), self.piano)
+        self.white_rects, self.black_rects = _key_rects(height)
+        self.frame = None
+        self.pressed = set()
+        self.frame_times = deque(maxlen=history)
+
+    def _redraw_keys(self, area: pg.Rect, whites: List[int], blacks: List[int]):
+        """
+        Redraws piano inside given area, with given keys highlighted.
+        """
+
+        screen = self.screen
+        height = screen.get_height()
+        screen.set_clip(area)
+        screen.blit(self.piano, area, area)
+        for i in whites:
+            if self.white_rects[i].colliderect(area):
+                pg.draw.rect(screen, 'green', [i * 35 + 2, height - 298, 31, 296], 0, 0)
+        for rect in self.black_rects:
+            if rect.colliderect(area):
+                pg.draw.rect(screen, 'black', rect, 0, 2)
+        for i in blacks:
+            if self.black_rects[i].colliderect(area):
+                k = black_pos[i]
+                pg.draw.rect(screen, 'green', [26 + (k * 35), height - 298, 18, 196], 0, 2)
+        screen.set_clip(None)
+
+    def _draw_strip(self, frame: int, strip: int):
+        """
+        Draws notes inside strip of given height at the top of notes area.
+        """
+
+        screen = self.screen
+        screen.set_clip(pg.Rect(0, 0, self.notes_area.width, strip))
+        screen.fill('gray')
+        visible, finished = self.notes.advance(frame, strip - 1)
+        notes = visible + finished
+        for white in (True, False):
+            for note in notes:
+                if is_white(note.note) != white:
+                    continue
+                start = math.floor(-note.start * BITS_PER_SECOND + frame)
+                length = math.floor(note.length * BITS_PER_SECOND)
+                (lx, key_len) = position_of_note(note.note)
+                pg.draw.rect(screen, 'white' if white else 'black', [lx, start - length, key_len, length], 0, 2)
+        screen.set_clip(None)
+
+    def draw(self, frame: int, pressed: Set[int]) -> List[pg.Rect]:
+        """
+        Draws frame. Frames have to be drawn in increasing order.
+
+        :param frame: Number of frame to be drawn. Determinate position of notes.
+        :param pressed: Set of buttons pressed.
+        :return: List of areas of screen that changed.
+        """
+
+        begin = time.perf_counter()
+        changed = []
+        first = self.frame is None
+        if first:
+            self.screen.blit(self.piano, (0, 0))
+            draw_piano(pressed, self.screen)
+            changed.append(self.screen.get_rect())
+        else:
+            whites, blacks = into_blacks_and_whites(pressed)
+            old_whites, old_blacks = into_blacks_and_whites(self.pressed)
+            areas = ([self.white_rects[i] for i in set(whites).symmetric_difference(old_whites)] +
+                     [self.black_rects[i] for i in set(blacks).symmetric_difference(old_blacks)])
+            for area in areas:
+                self._redraw_keys(area, whites, blacks)
+            changed += areas
+        self.pressed = set(pressed)
+
+        height = self.notes_area.height
+        strip = height if first else min(max(frame - self.frame, 0), height)
+        if strip > 0:
+            if strip < height:
+                self.notes_surface.scroll(0, strip)
+            self._draw_strip(frame, strip)
+            changed.append(self.notes_area)
+            self.frame = frame
+
+        self.frame_times.append(time.perf_counter() - begin)
+        return changed
+
+    def frame_time(self) -> Tuple[float, float]:
+        """
+        Returns mean and maximal time (in seconds) of drawing recent frames.
+        """
+
+        if len(self.frame_times) == 0:
+            return 0.0, 0.0
+        return sum(self.frame_times) / len(self.frame_times), max(self.frame_times)